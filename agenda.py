@@ -0,0 +1,214 @@
+# agenda.py
+# ------------------------------------------------------------------
+# AGENDA DOS QUESTIONÁRIOS DE SEGUIMENTO (dias 7 / 30 / 60 / 90)
+#   • vencimento = dataAlta (Permanência) + dia, calculado em bloco
+#     para todos os atendimentos (sem laço por linha)
+#   • questionário respondido = observação do dia preenchida (a data
+#     sempre vem preenchida pelo formulário, não serve de sinal)
+#   • índice só dos não respondidos, ordenado por (hospital, vencimento):
+#     "quem vence esta semana no hospital X" é um searchsorted no trecho
+#     do hospital
+#   • cada save_csv / atualizar_registro de Pronto Atendimento,
+#     Permanência ou Questionários refaz só os itens do atendimento: a
+#     base ordenada ganha uma lista pequena de itens novos + o conjunto
+#     de atendimentos cujas linhas na base estão velhas; passou de
+#     LIMITE_DELTA, a base é reordenada na próxima consulta
+#   • etapas mudadas por fora (outro processo) -> recalculada inteira
+# ------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dados
+from dados import ETAPAS, carregar_csv, fetch_row, normalizar_chaves
+from perfil import medido
+
+DIAS = (7, 30, 60, 90)
+COLUNAS = ["vencimento", "dia", "numeroAtendimento", "hospital", "linhaCuidado",
+           "nomePaciente", "dataAlta"]
+# etapas que mudam a agenda
+_FONTES = ["Pronto Atendimento", "Permanência", "Questionários"]
+_COLUNAS_FONTE = {
+    "Pronto Atendimento": ["numeroAtendimento", "hospital", "linhaCuidado", "nomePaciente"],
+    "Permanência": ["numeroAtendimento", "dataAlta"],
+    "Questionários": ["numeroAtendimento"] + [f"observacaoQuestionarioPaciente{d}" for d in DIAS],
+}
+# lotes maiores que isso invalidam a agenda em vez de atualizá-la por atendimento
+LIMITE_INCREMENTAL = 1000
+# itens fora da base ordenada antes de reordenar tudo
+LIMITE_DELTA = 2000
+
+# _lock nunca é tomado antes de ler etapas inteiras com dados.py (que
+# espera a gravadora): a gravadora chega aqui (_gancho) no meio de um
+# commit e precisa de _lock no depois, e as duas travariam
+_lock = threading.RLock()
+_estado = {"assinaturas": None, "base": None, "vencimentos": None, "trechos": {},
+           "novos": [], "velhos": set()}
+
+
+def _assinaturas(exceto: str = None) -> tuple:
+    # exceto: etapa sendo gravada; ela e as que dividem o destino com ela
+    # ficam de fora (o gancho confere só as outras)
+    return tuple(None if exceto and dados.destino(ETAPAS[e]) == dados.destino(exceto)
+                 else dados.assinatura(ETAPAS[e]) for e in _FONTES)
+
+
+# --------------------------- Cálculo -------------------------------
+def _itens(pa_: pd.DataFrame, perm: pd.DataFrame, quest: pd.DataFrame) -> pd.DataFrame:
+    """Um item por (atendimento, dia) com alta e questionário sem resposta."""
+    tabelas = []
+    for nome, df in (("Pronto Atendimento", pa_), ("Permanência", perm), ("Questionários", quest)):
+        df = df.reindex(columns=_COLUNAS_FONTE[nome])
+        df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"])
+        # vale a 1ª linha de cada atendimento, como no fetch_row
+        tabelas.append(df.drop_duplicates("numeroAtendimento").set_index("numeroAtendimento"))
+    pa_, perm, quest = tabelas
+
+    alta = pd.to_datetime(perm["dataAlta"], errors="coerce", format="ISO8601").dt.normalize()
+    base = (perm[[]].assign(dataAlta=alta)
+                    .join(pa_[["hospital", "linhaCuidado", "nomePaciente"]])
+                    .join(quest))
+    base = base[base["dataAlta"].notna()]
+
+    partes = []
+    for dia in DIAS:
+        obs = base[f"observacaoQuestionarioPaciente{dia}"].astype("string").fillna("").str.strip()
+        falta = base[obs == ""]
+        partes.append(pd.DataFrame({
+            "vencimento": falta["dataAlta"] + pd.Timedelta(days=dia),
+            "dia": np.full(len(falta), dia, dtype="int8"),
+            "numeroAtendimento": falta.index.astype("string"),
+            "hospital": falta["hospital"].astype("string").fillna(""),
+            "linhaCuidado": falta["linhaCuidado"].astype("string").fillna(""),
+            "nomePaciente": falta["nomePaciente"].astype("string").fillna(""),
+            "dataAlta": falta["dataAlta"],
+        }))
+    return pd.concat(partes, ignore_index=True)[COLUNAS]
+
+
+def _ordenar(itens: pd.DataFrame):
+    """Base ordenada por (hospital, vencimento) + trecho de cada hospital."""
+    base = itens.sort_values(["hospital", "vencimento", "numeroAtendimento", "dia"],
+                             ignore_index=True)
+    hosp = base["hospital"].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, hosp[1:] != hosp[:-1]]) if len(base) else []
+    fins = list(inicios[1:]) + [len(base)]
+    trechos = {hosp[i]: (int(i), int(j)) for i, j in zip(inicios, fins)}
+    _estado.update(base=base, trechos=trechos, novos=[], velhos=set(),
+                   vencimentos=base["vencimento"].to_numpy())
+
+
+def reconstruir():
+    """Recalcula a agenda inteira a partir das etapas."""
+    # assinatura tirada antes da leitura: se alguém gravar no meio, a
+    # próxima consulta vê a diferença e recalcula de novo
+    sig = _assinaturas()
+    itens = _itens(*(carregar_csv(ETAPAS[e], colunas=_COLUNAS_FONTE[e]) for e in _FONTES))
+    with _lock:
+        _ordenar(itens)
+        _estado["assinaturas"] = sig
+
+
+def _garantir():
+    with _lock:
+        em_dia = (_estado["assinaturas"] == _assinaturas()
+                  and len(_estado["novos"]) <= LIMITE_DELTA)
+    if not em_dia:
+        reconstruir()
+
+
+# --------------------------- Atualização incremental ---------------
+def _do_atendimento(chave) -> pd.DataFrame:
+    linhas = []
+    for etapa in _FONTES:
+        linha = fetch_row(ETAPAS[etapa], chave)
+        linhas.append(pd.DataFrame([linha.to_dict()]) if len(linha)
+                      else pd.DataFrame(columns=_COLUNAS_FONTE[etapa]))
+    linhas[0]["numeroAtendimento"] = [chave] * len(linhas[0])   # linha vazia vem sem a chave
+    return _itens(*linhas)
+
+
+def _gancho(path: str, lote: pd.DataFrame):
+    # roda sob o lock de gravação de dados.py (ver _notificando)
+    if path not in (ETAPAS[e] for e in _FONTES) or "numeroAtendimento" not in lote:
+        return None
+    outras = _assinaturas(exceto=path)
+    if _estado["base"] is None or _estado["assinaturas"] != _assinaturas():
+        return None                       # nunca calculada ou já desatualizada: refeita na consulta
+    if len(lote) > LIMITE_INCREMENTAL:
+        return lambda: _estado.update(assinaturas=None)
+    chaves = set(normalizar_chaves(lote["numeroAtendimento"]))
+
+    def depois():
+        with _lock:
+            try:
+                agora = _assinaturas()
+                if _assinaturas(exceto=path) != outras:
+                    # outra etapa gravada em paralelo mudou o atendimento
+                    # depois do antes: refeito na próxima consulta
+                    _estado["assinaturas"] = None
+                    return
+                _estado["velhos"] |= chaves
+                novos = [r for r in _estado["novos"] if r["numeroAtendimento"] not in chaves]
+                for c in chaves:
+                    novos += _do_atendimento(c).to_dict("records")
+                _estado["novos"] = novos
+                _estado["assinaturas"] = agora
+            except Exception:
+                # o registro já foi salvo; a agenda é refeita na próxima consulta
+                _estado["assinaturas"] = None
+    return depois
+
+
+dados.registrar_gancho(_gancho)
+
+
+# --------------------------- Consulta ------------------------------
+@medido
+def vencimentos(inicio=None, fim=None, filtros: dict = None,
+                limite: int = None) -> pd.DataFrame:
+    """Questionários sem resposta com vencimento em [inicio, fim] (datas;
+    None = sem limite), do mais antigo ao mais novo.
+
+    `filtros`: {"hospital": ..., "linhaCuidado": ...} (vazios ignorados).
+    Coluna `atraso`: dias desde o vencimento (negativo = ainda vai vencer)."""
+    filtros = {c: v for c, v in (filtros or {}).items() if v not in ("", None)}
+    ini = pd.Timestamp(inicio).normalize() if inicio is not None else None
+    fim_ = pd.Timestamp(fim).normalize() if fim is not None else None
+
+    _garantir()
+    with _lock:
+        base, venc = _estado["base"], _estado["vencimentos"]
+        hospitais = ([filtros["hospital"]] if "hospital" in filtros
+                     else list(_estado["trechos"]))
+        pos = []
+        for h in hospitais:
+            i, j = _estado["trechos"].get(h, (0, 0))
+            a = i + (np.searchsorted(venc[i:j], ini.to_datetime64(), "left") if ini is not None else 0)
+            b = i + (np.searchsorted(venc[i:j], fim_.to_datetime64(), "right") if fim_ is not None
+                     else j - i)
+            pos.append(np.arange(a, b))
+        res = base.iloc[np.concatenate(pos)] if pos else base.iloc[:0]
+        if _estado["velhos"]:
+            res = res[~res["numeroAtendimento"].isin(_estado["velhos"])]
+        if _estado["novos"]:
+            extra = pd.DataFrame(_estado["novos"], columns=COLUNAS)
+            if ini is not None:
+                extra = extra[extra["vencimento"] >= ini]
+            if fim_ is not None:
+                extra = extra[extra["vencimento"] <= fim_]
+            if "hospital" in filtros:
+                extra = extra[extra["hospital"] == filtros["hospital"]]
+            res = pd.concat([res, extra.astype(base.dtypes.to_dict())], ignore_index=True)
+
+    if "linhaCuidado" in filtros:
+        res = res[res["linhaCuidado"] == filtros["linhaCuidado"]]
+    if len(hospitais) > 1 or _estado["novos"]:
+        res = res.sort_values(["vencimento", "numeroAtendimento", "dia"], kind="stable")
+    res = res.reset_index(drop=True)
+    if limite:
+        res = res.head(limite)
+    hoje = pd.Timestamp.today().normalize()
+    return res.assign(atraso=(hoje - res["vencimento"]).dt.days)
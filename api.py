@@ -0,0 +1,157 @@
+# api.py
+# ------------------------------------------------------------------
+# API HTTP DE INGESTÃO (sem Streamlit, sem rerun por registro)
+#   • POST /etapas/<etapa> com JSON (lista de registros, {"registros":
+#     [...]} ou um registro só) ou NDJSON (um registro por linha)
+#   • <etapa> = arquivo da etapa sem "dados_" e ".csv": pronto_atendimento,
+#     internacao, tratamento, permanencia, pos_alta, questionarios
+#   • mesma preparação/validação da importação em massa
+#     (importar.preparar) e gravação em lote: atendimento novo é anexado
+#     (dados.salvar_lote), já gravado é substituído pelo enviado, como
+#     salvar o formulário de novo (dados.atualizar_lote)
+#   • resposta só depois de gravado (fsync), com novos / atualizados /
+#     rejeitados (posição no lote + motivo)
+#   • ?hospital=HUC preenche o hospital de registros que vierem sem ele
+#   • GET /saude -> {"ok": true, "pendentes": n}
+#   • com LINHAS_API_TOKEN definido exige "Authorization: Bearer <token>"
+#   • só biblioteca padrão (http.server); para rodar local:
+#       python api.py --porta 8502
+#       curl --data-binary @lote.ndjson -H "Content-Type: application/x-ndjson" \
+#            localhost:8502/etapas/pronto_atendimento
+# ------------------------------------------------------------------
+
+import argparse
+import hmac
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import dados
+from dados import ETAPAS
+from importar import preparar
+
+PORTA = 8502
+# maior corpo aceito por requisição (bytes)
+MAX_CORPO = int(os.environ.get("LINHAS_API_MAX_CORPO", str(64 * 2 ** 20)))
+
+# /etapas/internacao -> "Internação"
+ROTAS = {os.path.splitext(p)[0].removeprefix("dados_"): etapa for etapa, p in ETAPAS.items()}
+
+# um lote por etapa de cada vez: a checagem "já existe?" e a gravação
+# não podem intercalar com outro lote trazendo o mesmo atendimento
+_travas = {etapa: threading.Lock() for etapa in ETAPAS}
+
+
+# --------------------------- Ingestão ------------------------------
+def ler_corpo(corpo: bytes, tipo: str = "application/json") -> list:
+    """Registros do corpo JSON / NDJSON; ValueError se malformado."""
+    texto = corpo.decode("utf-8")
+    if "ndjson" in tipo or "jsonl" in tipo:
+        registros = [json.loads(linha) for linha in texto.splitlines() if linha.strip()]
+    else:
+        registros = json.loads(texto) if texto.strip() else []
+        if isinstance(registros, dict):
+            registros = registros.get("registros", [registros])
+    if not isinstance(registros, list) or not all(isinstance(r, dict) for r in registros):
+        raise ValueError("esperado um objeto JSON por registro")
+    return registros
+
+
+def ingerir(etapa: str, registros: list, padroes: dict = None) -> dict:
+    """Valida e grava os registros na etapa; devolve o resumo do lote."""
+    resumo = {"recebidos": len(registros), "novos": 0, "atualizados": 0,
+              "repetidos": 0, "rejeitados": []}
+    if not registros:
+        return resumo
+
+    validos, ruins = preparar(pd.DataFrame(registros), etapa, padroes=padroes)
+    resumo["rejeitados"] = [{"posicao": int(i), "motivo": m}
+                            for i, m in ruins["motivo"].items()]
+    # o mesmo atendimento duas vezes no lote: vale o último
+    repetido = validos["numeroAtendimento"].duplicated(keep="last")
+    resumo["repetidos"] = int(repetido.sum())
+    validos = validos[~repetido]
+
+    path = ETAPAS[etapa]
+    with _travas[etapa]:
+        ja = dados.existentes(path, validos["numeroAtendimento"])
+        dados.salvar_lote(path, validos[~ja])
+        dados.atualizar_lote(path, validos[ja])
+    resumo["novos"], resumo["atualizados"] = int((~ja).sum()), int(ja.sum())
+    return resumo
+
+
+# --------------------------- HTTP ----------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "LinhasDeCuidado/1.0"
+
+    def _responder(self, status: int, corpo: dict):
+        dados_json = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados_json)))
+        self.end_headers()
+        self.wfile.write(dados_json)
+
+    def _autorizado(self) -> bool:
+        token = os.environ.get("LINHAS_API_TOKEN")
+        if not token:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}")
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip("/") != "/saude":
+            return self._responder(404, {"erro": "rota desconhecida"})
+        self._responder(200, {"ok": True, "pendentes": dados.pendentes()})
+
+    def do_POST(self):
+        if not self._autorizado():
+            return self._responder(401, {"erro": "token inválido"})
+        url = urlsplit(self.path)
+        partes = url.path.strip("/").split("/")
+        if len(partes) != 2 or partes[0] != "etapas" or partes[1] not in ROTAS:
+            return self._responder(404, {"erro": "etapa desconhecida",
+                                         "etapas": sorted(ROTAS)})
+
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho > MAX_CORPO:
+            return self._responder(413, {"erro": f"corpo maior que {MAX_CORPO} bytes"})
+        try:
+            registros = ler_corpo(self.rfile.read(tamanho),
+                                  self.headers.get("Content-Type", "application/json"))
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._responder(400, {"erro": f"corpo inválido: {e}"})
+
+        padroes = {c: v[-1] for c, v in parse_qs(url.query).items()}
+        try:
+            resumo = ingerir(ROTAS[partes[1]], registros, padroes)
+        except Exception as e:          # falha de gravação: o cliente reenvia o lote
+            return self._responder(500, {"erro": repr(e)})
+        gravados = resumo["novos"] + resumo["atualizados"]
+        self._responder(200 if gravados or not resumo["rejeitados"] else 422, resumo)
+
+
+def servidor(host: str = "127.0.0.1", porta: int = PORTA) -> ThreadingHTTPServer:
+    """Servidor pronto (ainda parado): serve_forever() / shutdown()."""
+    return ThreadingHTTPServer((host, porta), _Handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP de ingestão das etapas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    args = parser.parse_args()
+
+    srv = servidor(args.host, args.porta)
+    print(f"ouvindo em http://{args.host}:{args.porta}/etapas/<{'|'.join(sorted(ROTAS))}>")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        dados.descarregar()
@@ -2,18 +2,44 @@
 # ------------------------------------------------------------------
 # REGISTRO DAS LINHAS DE CUIDADO  –  STREAMLIT
 # versão “completa”, incluindo:
-#   • menu Cadastrar (6 abas)
-#   • menu Editar  (6 abas, com filtros + formulário pré‑preenchido
-#                   ou vazio, salvando/atualizando CSVs)
-#   • menu Indicadores (placeholder)
+#   • menu Cadastrar (6 etapas; só a escolhida é montada)
+#   • menu Editar  (6 etapas, com filtros + busca/listagem paginada ou
+#                   por palavras de nome/procedimento/observações +
+#                   formulário pré‑preenchido ou vazio, salvando/atualizando CSVs)
+#   • menu Indicadores (KPIs por hospital / linha de cuidado); gráficos
+#     de período em Altair com dados já reduzidos no servidor (graficos.py)
+#     e p50/p90/p99 dos meses do período pelos esboços de quantis.py
+#   • menu Agenda (questionários de 7/30/60/90 dias vencidos / a vencer)
+#   • "Salvar" não espera o disco: gravação em segundo plano (dados.py),
+#     com o nº de pendentes na sidebar
+#   • com LINHAS_PERFIL ligado: cada rerun medido (perfil.py) e painel
+#     de admin na sidebar com os reruns recentes e p50/p95 por trecho
 # ------------------------------------------------------------------
 
+import altair as alt
 import streamlit as st
 import pandas as pd
-import os
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from dados import (save_csv, atualizar_registro, fetch_row, facetas, pendentes,
+                   falhas, ETAPAS, HOSPITAIS, LINHAS_CUIDADO)
+from indicadores import indicadores
+from cubo import cubo, consultar as consultar_cubo
+from graficos import reduzir, serie, distribuicao, volumes
+from quantis import percentis
+from busca import buscar, pagina, TAMANHO_PAGINA
+from agenda import vencimentos
+from palavras import procurar
+import perfil
+from perfil import trecho
 
 # --------------------------- Configuração --------------------------
+# Copy-on-Write do pandas para o app inteiro (opção global do processo,
+# por isso ligada aqui e não em dados.py): recortes do cache de dados.py
+# que as sessões recebem são views sem cópia e só viram cópia se alguém
+# escrever neles
+pd.set_option("mode.copy_on_write", True)
+
 st.set_page_config(page_title="Linhas de Cuidado", layout="wide")
 st.title("📊 Registro das Linhas de Cuidado")
 
@@ -24,44 +50,75 @@ if "hospital" not in st.session_state:
     st.session_state.hospital = ""
 
 # --------------------------- Sidebar -------------------------------
-menu = st.sidebar.selectbox("Menu", ["Cadastrar", "Editar", "Indicadores"])
+menu = st.sidebar.selectbox("Menu", ["Cadastrar", "Editar", "Indicadores", "Agenda"])
+perfil.rerun(menu)
+
+# gravações dos formulários vão para a fila de segundo plano (dados.py)
+if pendentes():
+    st.sidebar.caption(f"⏳ {pendentes()} gravação(ões) pendente(s)")
+if falhas():
+    path_falha, _, erro_falha = falhas()[-1]
+    st.sidebar.error(f"{len(falhas())} gravação(ões) não foram salvas "
+                     f"(última: {path_falha} – {erro_falha})")
+
+# painel de admin: só existe com LINHAS_PERFIL ligado (mostra os reruns
+# anteriores a este, que ainda está rodando)
+if perfil.ATIVO:
+    with st.sidebar.expander("⏱️ Perfil (admin)"):
+        st.caption(f"log: {perfil.ARQUIVO}")
+        st.markdown("**Reruns recentes (ms)**")
+        st.dataframe(perfil.reruns(), hide_index=True)
+        st.markdown("**Por trecho: p50 / p95 (ms) e linhas**")
+        st.dataframe(perfil.resumo(), hide_index=True)
 
 # --------------------------- Funções Aux. --------------------------
-def save_csv(path: str, registro: dict):
-    """Salva linha única no CSV (append ou cria)."""
-    df = pd.DataFrame([registro])
-    cols = list(registro.keys())
-    if not os.path.isfile(path):
-        df.to_csv(path, index=False, columns=cols)
-    else:
-        df.to_csv(path, mode="a", header=False, index=False, columns=cols)
-
-def fetch_row(df_src: pd.DataFrame, chave: str) -> pd.Series:
-    # se ainda não existe coluna (csv vazio), devolve Series vazio
-    if "numeroAtendimento" not in df_src.columns:
-        return pd.Series(dtype="object")          # nada para mostrar
-    fil = df_src[df_src["numeroAtendimento"] == chave]
-    if len(fil):
-        return fil.iloc[0]
-    # retorna Series com todas as colunas mas vazias
-    return pd.Series({c: "" for c in df_src.columns})
+def fmt_metrica(valor, formato: str) -> str:
+    """Formata um KPI para st.metric ("–" quando não há dado)."""
+    if valor is None or pd.isna(valor):
+        return "–"
+    return format(valor, formato)
+
+# valores de fetch_row já vêm tipados (ver dados.ESQUEMA); nos backends
+# externos podem vir como texto: estes helpers aceitam os dois
+def texto(valor) -> str:
+    """Valor para text_input/selectbox ("" quando vazio)."""
+    return "" if valor is None or pd.isna(valor) else str(valor)
+
+def numero(valor, tipo=float):
+    """Inteiro/decimal para number_input (0 quando vazio)."""
+    v = pd.to_numeric(pd.Series([valor]), errors="coerce").iloc[0]
+    return tipo(0 if pd.isna(v) else v)
+
+def data_hora(valor) -> datetime:
+    """Data/hora para date_input/time_input (agora, quando vazio)."""
+    ts = pd.to_datetime(valor, errors="coerce", format="ISO8601") if isinstance(valor, str) else valor
+    return datetime.now() if ts is None or pd.isna(ts) else pd.Timestamp(ts).to_pydatetime()
+
+def iso(valor) -> str:
+    """Data/hora no texto ISO gravado pelos formulários ("" quando vazio)."""
+    return data_hora(valor).isoformat() if texto(valor) else ""
+
+def seletor_etapa(chave: str) -> str:
+    """Etapa ativa. Substitui st.tabs, que executa o corpo de todas as abas
+    a cada rerun: aqui só a etapa escolhida lê dados e monta formulário."""
+    return st.radio("Etapa", list(ETAPAS), horizontal=True, key=chave,
+                    label_visibility="collapsed")
 
 # ==================================================================
 #                               CADASTRAR
 # ==================================================================
 if menu == "Cadastrar":
-    abas = st.tabs(["Pronto Atendimento", "Internação", "Tratamento",
-                    "Permanência", "Pós-Alta", "Questionários"])
+    etapa = seletor_etapa("etapa_cadastro")
 
     # ------------------- 1) Pronto Atendimento --------------------
-    with abas[0]:
-        with st.form("form_pronto_atendimento"):
+    if etapa == "Pronto Atendimento":
+        with st.form("form_pronto_atendimento"), trecho("form:form_pronto_atendimento"):
             st.subheader("📍 Pronto Atendimento")
             c1, c2, c3 = st.columns(3)
 
             with c1:
-                hospital          = st.selectbox("Hospital", ["","Centro Médico", "Galileo", "HUC", "Irmãos Penteado", "Maternidade", "PUCC"])
-                linha_cuidado     = st.selectbox("Linha de Cuidado", ["","AVC", "Chron", "Fratura de Fêmur", "ICC"])
+                hospital          = st.selectbox("Hospital", [""] + HOSPITAIS)
+                linha_cuidado     = st.selectbox("Linha de Cuidado", [""] + LINHAS_CUIDADO)
                 numero_atendimento= st.text_input("Número Atendimento")
                 status            = st.selectbox("Status", ["", "Internado", "Alta", "Óbito"])
 
@@ -113,12 +170,12 @@ if menu == "Cadastrar":
                     "dataHoraLaudo": dt_laudo.isoformat(),
                     "tempoExame": tempo_exame
                 }
-                save_csv("dados_pronto_atendimento.csv", registro)
+                save_csv("dados_pronto_atendimento.csv", registro, esperar=False)
                 st.success("Dados de Pronto Atendimento salvos! ✅")
 
     # ------------------- 2) Internação ----------------------------
-    with abas[1]:
-        with st.form("form_internacao"):
+    if etapa == "Internação":
+        with st.form("form_internacao"), trecho("form:form_internacao"):
             st.subheader("🏥 Internação")
             st.text_input("Hospital", value=st.session_state.hospital, disabled=True)
             st.text_input("Número Atendimento", value=st.session_state.numero_atendimento,
@@ -153,12 +210,12 @@ if menu == "Cadastrar":
                     "altaUTIParaEnfermaria": alta_uti,
                     "tempoUTI": tempo_uti
                 }
-                save_csv("dados_internacao.csv", registro)
+                save_csv("dados_internacao.csv", registro, esperar=False)
                 st.success("Dados de Internação salvos! ✅")
 
     # ------------------- 3) Tratamento ----------------------------
-    with abas[2]:
-        with st.form("form_tratamento"):
+    if etapa == "Tratamento":
+        with st.form("form_tratamento"), trecho("form:form_tratamento"):
             st.subheader("💉 Tratamento")
             st.text_input("Hospital", value=st.session_state.hospital, disabled=True)
             st.text_input("Número Atendimento", value=st.session_state.numero_atendimento,
@@ -175,12 +232,12 @@ if menu == "Cadastrar":
                     "tipoProcedimentoCirurgico": tipo_proc,
                     "grauSeveridade": grau_sev
                 }
-                save_csv("dados_tratamento.csv", registro)
+                save_csv("dados_tratamento.csv", registro, esperar=False)
                 st.success("Dados de Tratamento salvos! ✅")
 
     # ------------------- 4) Permanência ---------------------------
-    with abas[3]:
-        with st.form("form_permanencia"):
+    if etapa == "Permanência":
+        with st.form("form_permanencia"), trecho("form:form_permanencia"):
             st.subheader("🛎️ Permanência")
             st.text_input("Hospital", value=st.session_state.hospital, disabled=True)
             st.text_input("Número Atendimento", value=st.session_state.numero_atendimento,
@@ -205,12 +262,12 @@ if menu == "Cadastrar":
                     "dataAlta": data_alta.isoformat(),
                     "acomodacao": acom_alta
                 }
-                save_csv("dados_permanencia.csv", registro)
+                save_csv("dados_permanencia.csv", registro, esperar=False)
                 st.success("Dados de Permanência salvos! ✅")
 
     # ------------------- 5) Pós‑Alta ------------------------------
-    with abas[4]:
-        with st.form("form_pos_alta"):
+    if etapa == "Pós-Alta":
+        with st.form("form_pos_alta"), trecho("form:form_pos_alta"):
             st.subheader("📦 Pós‑Alta")
             st.text_input("Hospital", value=st.session_state.hospital, disabled=True)
             st.text_input("Número Atendimento", value=st.session_state.numero_atendimento,
@@ -229,12 +286,12 @@ if menu == "Cadastrar":
                     "quantidade": quantidade,
                     "observacao": obs
                 }
-                save_csv("dados_pos_alta.csv", registro)
+                save_csv("dados_pos_alta.csv", registro, esperar=False)
                 st.success("Dados de Pós‑Alta salvos! ✅")
 
     # ------------------- 6) Questionários -------------------------
-    with abas[5]:
-        with st.form("form_questionarios"):
+    if etapa == "Questionários":
+        with st.form("form_questionarios"), trecho("form:form_questionarios"):
             st.subheader("📝 Questionários")
             st.text_input("Hospital", value=st.session_state.hospital, disabled=True)
             st.text_input("Número Atendimento", value=st.session_state.numero_atendimento,
@@ -251,7 +308,7 @@ if menu == "Cadastrar":
                 registro[f"observacaoQuestionarioPaciente{dia}"] = obs_q
 
             if st.form_submit_button("Salvar Questionários"):
-                save_csv("dados_questionarios.csv", registro)
+                save_csv("dados_questionarios.csv", registro, esperar=False)
                 st.success("Dados de Questionários salvos! ✅")
 
 # ==================================================================
@@ -261,103 +318,113 @@ elif menu == "Editar":
     st.subheader("✏️ Editar Pronto Atendimento")
     pa_path = "dados_pronto_atendimento.csv"
 
-    if not os.path.exists(pa_path):
+    # a listagem só precisa destas colunas: o resto nem é lido
+    cols_lista = ["hospital", "linhaCuidado", "numeroAtendimento", "nomePaciente", "numeroDRG"]
+    fac = facetas(pa_path)
+
+    if not fac.total:
         st.warning("Nenhum registro para editar.")
         st.stop()
 
-    df_pa = pd.read_csv(pa_path)
-
-    # -------- filtros ----------
+    # -------- filtros (opções vêm prontas do índice de facetas) ----------
     c1, c2 = st.columns(2)
     with c1:
         hosp_sel = st.selectbox(
             "Filtrar por Hospital",
-            [""] + sorted(df_pa["hospital"].dropna().unique())
+            [""] + fac.valores("hospital")
         )
     with c2:
-        linhas = (
-            df_pa[df_pa["hospital"] == hosp_sel]["linhaCuidado"].dropna().unique()
-            if hosp_sel else df_pa["linhaCuidado"].dropna().unique()
-        )
         linha_sel = st.selectbox(
             "Filtrar por Linha de Cuidado",
-            [""] + sorted(linhas.tolist())
+            [""] + fac.valores("linhaCuidado", {"hospital": hosp_sel})
         )
 
-    df_filtro = df_pa.copy()
-    if hosp_sel:
-        df_filtro = df_filtro[df_filtro["hospital"] == hosp_sel]
-    if linha_sel:
-        df_filtro = df_filtro[df_filtro["linhaCuidado"] == linha_sel]
-
-    st.dataframe(
-        df_filtro[["hospital", "linhaCuidado", "numeroAtendimento", "numeroDRG"]],
-        use_container_width=True
-    )
+    filtros = {"hospital": hosp_sel, "linhaCuidado": linha_sel}
+
+    # -------- busca / página (só isso vai para o navegador) ----------
+    with trecho("lista"):
+        termo = st.text_input("Buscar por nº atendimento, autorização ou nome do paciente")
+        por_palavras = st.checkbox("Procurar também em procedimento e observações")
+        if termo.strip() and por_palavras:
+            # índice invertido (palavras.py): nome, procedimento e observações
+            df_lista = procurar(termo, filtros)
+            st.caption(f"{len(df_lista)} melhores resultados por palavras para “{termo.strip()}”")
+        elif termo.strip():
+            df_lista = buscar(termo, filtros)
+            st.caption(f"{len(df_lista)} melhores resultados para “{termo.strip()}”")
+        else:
+            total = pagina(filtros, tamanho=1)[1]
+            n_paginas = max(1, -(-total // TAMANHO_PAGINA))
+            num_pag = st.number_input(f"Página (de {n_paginas})", min_value=1,
+                                      max_value=n_paginas, value=1, step=1)
+            df_lista, _ = pagina(filtros, num_pag)
+            st.caption(f"{total} atendimentos no filtro")
+
+        st.dataframe(
+            df_lista[cols_lista],
+            use_container_width=True,
+            hide_index=True
+        )
 
+    nomes = dict(zip(df_lista["numeroAtendimento"], df_lista["nomePaciente"].fillna("")))
     atend_sel = st.selectbox(
         "Selecione Atendimento",
-        [""] + df_filtro["numeroAtendimento"].tolist()
+        [""] + df_lista["numeroAtendimento"].tolist(),
+        format_func=lambda a: f"{a} – {nomes[a]}" if nomes.get(a) else a
     )
     if not atend_sel:
         st.stop()
 
-    # -------- abas de edição --------
-    tabs_ed = st.tabs([
-        "Pronto Atendimento", "Internação", "Tratamento",
-        "Permanência", "Pós-Alta", "Questionários"
-    ])
+    # -------- etapa em edição (só ela é lida) --------
+    etapa = seletor_etapa("etapa_edicao")
 
     # ================== Aba 1 : Pronto Atendimento =================
-    with tabs_ed[0]:
-        rec = fetch_row(df_pa, atend_sel)
+    if etapa == "Pronto Atendimento":
+        rec = fetch_row(pa_path, atend_sel)
 
-        with st.form("edit_pa"):
+        with st.form("edit_pa"), trecho("form:edit_pa"):
             st.subheader("✏️ Editar Pronto Atendimento")
             c1, c2, c3 = st.columns(3)
 
             with c1:
-                hospital_e = st.text_input("Hospital", value=rec["hospital"])
-                linha_e    = st.text_input("Linha de Cuidado", value=rec["linhaCuidado"])
+                hospital_e = st.text_input("Hospital", value=texto(rec["hospital"]))
+                linha_e    = st.text_input("Linha de Cuidado", value=texto(rec["linhaCuidado"]))
                 st.text_input("Número Atendimento", value=atend_sel, disabled=True)
                 status_e   = st.selectbox(
                     "Status", ["", "Internado", "Alta", "Óbito"],
-                    index=["", "Internado", "Alta", "Óbito"].index(rec["status"])
-                    if rec["status"] in ["Internado", "Alta", "Óbito"] else 0
+                    index=["", "Internado", "Alta", "Óbito"].index(texto(rec["status"]))
+                    if texto(rec["status"]) in ["Internado", "Alta", "Óbito"] else 0
                 )
 
             with c2:
-                num_aut_e = st.text_input("Número Autorização", value=rec["numeroAutorizacao"])
-                num_drg_e = st.text_input("Número DRG", value=rec["numeroDRG"])
-                nome_e    = st.text_input("Nome Paciente", value=rec["nomePaciente"])
-                idade_e   = st.number_input("Idade", value=int(rec["idade"] or 0), min_value=0)
+                num_aut_e = st.text_input("Número Autorização", value=texto(rec["numeroAutorizacao"]))
+                num_drg_e = st.text_input("Número DRG", value=texto(rec["numeroDRG"]))
+                nome_e    = st.text_input("Nome Paciente", value=texto(rec["nomePaciente"]))
+                idade_e   = st.number_input("Idade", value=numero(rec["idade"], int), min_value=0)
 
             with c3:
-                cid_e   = st.text_input("CID Principal", value=rec["cidPrincipal"])
-                base_dt = datetime.fromisoformat(rec["dataHoraInternacaoPS"]) \
-                          if rec["dataHoraInternacaoPS"] else datetime.now()
+                cid_e   = st.text_input("CID Principal", value=texto(rec["cidPrincipal"]))
+                base_dt = data_hora(rec.get("dataHoraInternacaoPS"))
                 di = st.date_input("Data Internação PS", base_dt.date())
                 ti = st.time_input("Hora Internação PS", base_dt.time())
                 ecg_e = st.selectbox(
                     "ECG Realizado", ["", "Sim", "Não", "Sem Informação"],
-                    index=["", "Sim", "Não", "Sem Informação"].index(rec["ECG"])
-                    if rec["ECG"] in ["Sim", "Não", "Sem Informação"] else 0
+                    index=["", "Sim", "Não", "Sem Informação"].index(texto(rec["ECG"]))
+                    if texto(rec["ECG"]) in ["Sim", "Não", "Sem Informação"] else 0
                 )
                 rx_e = st.selectbox(
                     "Raio‑X Realizado", ["", "Sim", "Não", "Sem Informação"],
-                    index=["", "Sim", "Não", "Sem Informação"].index(rec["raioX"])
-                    if rec["raioX"] in ["Sim", "Não", "Sem Informação"] else 0
+                    index=["", "Sim", "Não", "Sem Informação"].index(texto(rec["raioX"]))
+                    if texto(rec["raioX"]) in ["Sim", "Não", "Sem Informação"] else 0
                 )
-                exps_e = st.text_input("Exame PS Realizado", value=rec["examePS"])
+                exps_e = st.text_input("Exame PS Realizado", value=texto(rec["examePS"]))
 
             st.markdown("### 🧪 Recalcular Tempo")
-            base_sol = datetime.fromisoformat(rec["dataHoraSolicitacao"]) \
-                       if rec["dataHoraSolicitacao"] else datetime.now()
+            base_sol = data_hora(rec.get("dataHoraSolicitacao"))
             dsol = st.date_input("Data Solicitação", base_sol.date(), key="pa_sol_d")
             tsol = st.time_input("Hora Solicitação", base_sol.time(), key="pa_sol_t")
 
-            base_lau = datetime.fromisoformat(rec["dataHoraLaudo"]) \
-                       if rec["dataHoraLaudo"] else datetime.now()
+            base_lau = data_hora(rec.get("dataHoraLaudo"))
             dla = st.date_input("Data Laudo", base_lau.date(), key="pa_lau_d")
             tla = st.time_input("Hora Laudo", base_lau.time(), key="pa_lau_t")
 
@@ -383,68 +450,54 @@ elif menu == "Editar":
                     "raioX": rx_e,
                     "examePS": exps_e,
                     "dataHoraSolicitacao": datetime.combine(dsol, tsol).isoformat(),
-                    "dataHoraExecucao": rec["dataHoraExecucao"],  # não editado aqui
+                    "dataHoraExecucao": iso(rec["dataHoraExecucao"]),  # não editado aqui
                     "dataHoraLaudo": datetime.combine(dla, tla).isoformat(),
                     "tempoExame": new_tempo
                 }
 
-                if len(rec.dropna()):
-                    idx = df_pa[df_pa["numeroAtendimento"] == atend_sel].index[0]
-                    df_pa.loc[idx, :] = linha_nova.values()
-                else:
-                    df_pa = pd.concat(
-                        [df_pa, pd.DataFrame([linha_nova])],
-                        ignore_index=True
-                    )
-
-                df_pa.to_csv(pa_path, index=False)
+                atualizar_registro(pa_path, linha_nova, esperar=False)
                 st.success("Pronto Atendimento salvo! ✅")
 
     # ================== Aba 2 : Internação ========================
-    with tabs_ed[1]:
+    if etapa == "Internação":
         int_path = "dados_internacao.csv"
-        df_int_all = pd.read_csv(int_path) if os.path.exists(int_path) else pd.DataFrame()
-        rec_int = fetch_row(df_int_all, atend_sel)
+        rec_int = fetch_row(int_path, atend_sel)
 
-        with st.form("edit_int"):
+        with st.form("edit_int"), trecho("form:edit_int"):
             st.subheader("✏️ Editar Internação")
-            st.text_input("Hospital", value=rec_int.get("hospital", hosp_sel), disabled=True)
+            st.text_input("Hospital", value=texto(rec_int.get("hospital", hosp_sel)), disabled=True)
             st.text_input("Número Atendimento", value=atend_sel, disabled=True)
 
-            acomod_e = st.text_input("Acomodação", value=rec_int.get("acomodacao", ""))
+            acomod_e = st.text_input("Acomodação", value=texto(rec_int.get("acomodacao")))
 
-            base_dt = datetime.fromisoformat(rec_int["dataHoraInternacao"]) \
-                      if rec_int.get("dataHoraInternacao") else datetime.now()
+            base_dt = data_hora(rec_int.get("dataHoraInternacao"))
             di_int = st.date_input("Data Internação", base_dt.date())
             ti_int = st.time_input("Hora Internação", base_dt.time())
 
             exame_e = st.text_input(
                 "Exame Solicitado na Internação",
-                value=rec_int.get("exameSolicitadoInternacao", "")
+                value=texto(rec_int.get("exameSolicitadoInternacao"))
             )
 
-            base_sol = datetime.fromisoformat(rec_int["dataHoraSolicitacao"]) \
-                       if rec_int.get("dataHoraSolicitacao") else datetime.now()
+            base_sol = data_hora(rec_int.get("dataHoraSolicitacao"))
             dsol = st.date_input("Data Solicitação", base_sol.date(), key="int_sol_d")
             tsol = st.time_input("Hora Solicitação", base_sol.time(), key="int_sol_t")
 
-            base_exc = datetime.fromisoformat(rec_int["dataHoraExecucao"]) \
-                       if rec_int.get("dataHoraExecucao") else datetime.now()
+            base_exc = data_hora(rec_int.get("dataHoraExecucao"))
             dexc = st.date_input("Data Execução", base_exc.date(), key="int_exc_d")
             texc = st.time_input("Hora Execução", base_exc.time(), key="int_exc_t")
 
-            base_lau = datetime.fromisoformat(rec_int["dataHoraLaudo"]) \
-                       if rec_int.get("dataHoraLaudo") else datetime.now()
+            base_lau = data_hora(rec_int.get("dataHoraLaudo"))
             dlau = st.date_input("Data Laudo", base_lau.date(), key="int_lau_d")
             tlau = st.time_input("Hora Laudo", base_lau.time(), key="int_lau_t")
 
             alta_uti_e = st.checkbox(
                 "Alta da UTI para Enfermaria",
-                value=bool(rec_int.get("altaUTIParaEnfermaria"))
+                value=texto(rec_int.get("altaUTIParaEnfermaria")).lower() in ("true", "1")
             )
             tempo_uti_e = st.number_input(
                 "Tempo UTI (dias)",
-                value=int(rec_int.get("tempoUTI") or 0),
+                value=numero(rec_int.get("tempoUTI"), int),
                 min_value=0
             )
 
@@ -469,41 +522,31 @@ elif menu == "Editar":
                     "tempoUTI": tempo_uti_e
                 }
 
-                if len(rec_int.dropna()):
-                    idx = df_int_all[df_int_all["numeroAtendimento"] == atend_sel].index[0]
-                    df_int_all.loc[idx, :] = linha_int.values()
-                else:
-                    df_int_all = pd.concat(
-                        [df_int_all, pd.DataFrame([linha_int])],
-                        ignore_index=True
-                    )
-
-                df_int_all.to_csv(int_path, index=False)
+                atualizar_registro(int_path, linha_int, esperar=False)
                 st.success("Internação salva! ✅")
 
     # ================== Aba 3 : Tratamento ========================
-    with tabs_ed[2]:
+    if etapa == "Tratamento":
         trat_path = "dados_tratamento.csv"
-        df_trat = pd.read_csv(trat_path) if os.path.exists(trat_path) else pd.DataFrame()
-        rec_trat = fetch_row(df_trat, atend_sel)
+        rec_trat = fetch_row(trat_path, atend_sel)
 
-        with st.form("edit_trat"):
+        with st.form("edit_trat"), trecho("form:edit_trat"):
             st.subheader("✏️ Editar Tratamento")
-            st.text_input("Hospital", value=rec_trat.get("hospital", hosp_sel), disabled=True)
+            st.text_input("Hospital", value=texto(rec_trat.get("hospital", hosp_sel)), disabled=True)
             st.text_input("Número Atendimento", value=atend_sel, disabled=True)
 
             proc_e = st.text_input(
                 "Procedimento Cirúrgico",
-                value=rec_trat.get("procedimentoCirurgico", "")
+                value=texto(rec_trat.get("procedimentoCirurgico"))
             )
             tipo_e = st.text_input(
                 "Tipo de Procedimento Cirúrgico",
-                value=rec_trat.get("tipoProcedimentoCirurgico", "")
+                value=texto(rec_trat.get("tipoProcedimentoCirurgico"))
             )
             grau_e = st.selectbox(
                 "Grau de Severidade", ["", "Leve", "Moderado", "Grave"],
-                index=["", "Leve", "Moderado", "Grave"].index(rec_trat.get("grauSeveridade", ""))
-                if rec_trat.get("grauSeveridade", "") in ["Leve", "Moderado", "Grave"] else 0
+                index=["", "Leve", "Moderado", "Grave"].index(texto(rec_trat.get("grauSeveridade")))
+                if texto(rec_trat.get("grauSeveridade")) in ["Leve", "Moderado", "Grave"] else 0
             )
 
             if st.form_submit_button("Salvar Tratamento"):
@@ -514,43 +557,36 @@ elif menu == "Editar":
                     "tipoProcedimentoCirurgico": tipo_e,
                     "grauSeveridade": grau_e
                 }
-                if len(rec_trat.dropna()):
-                    idx = df_trat[df_trat["numeroAtendimento"] == atend_sel].index[0]
-                    df_trat.loc[idx, :] = reg.values()
-                else:
-                    df_trat = pd.concat([df_trat, pd.DataFrame([reg])], ignore_index=True)
-                df_trat.to_csv(trat_path, index=False)
+                atualizar_registro(trat_path, reg, esperar=False)
                 st.success("Tratamento salvo! ✅")
 
     # ================== Aba 4 : Permanência =======================
-    with tabs_ed[3]:
+    if etapa == "Permanência":
         perm_path = "dados_permanencia.csv"
-        df_perm = pd.read_csv(perm_path) if os.path.exists(perm_path) else pd.DataFrame()
-        rec_perm = fetch_row(df_perm, atend_sel)
+        rec_perm = fetch_row(perm_path, atend_sel)
 
-        with st.form("edit_perm"):
+        with st.form("edit_perm"), trecho("form:edit_perm"):
             st.subheader("✏️ Editar Permanência")
-            st.text_input("Hospital", value=rec_perm.get("hospital", hosp_sel), disabled=True)
+            st.text_input("Hospital", value=texto(rec_perm.get("hospital", hosp_sel)), disabled=True)
             st.text_input("Número Atendimento", value=atend_sel, disabled=True)
 
             risco_e = st.text_input(
                 "Estratificação de Risco",
-                value=rec_perm.get("estratificacaoRisco", "")
+                value=texto(rec_perm.get("estratificacaoRisco"))
             )
             prev_e = st.number_input(
                 "Permanência Prevista DRG",
-                value=float(rec_perm.get("permanenciaPrevistaDRG") or 0),
-                min_value=0
+                value=numero(rec_perm.get("permanenciaPrevistaDRG")),
+                min_value=0.0
             )
             real_e = st.number_input(
                 "Permanência Real",
-                value=float(rec_perm.get("permanenciaReal") or 0),
-                min_value=0
+                value=numero(rec_perm.get("permanenciaReal")),
+                min_value=0.0
             )
-            alta_dt_base = datetime.fromisoformat(rec_perm["dataAlta"]) \
-                           if rec_perm.get("dataAlta") else datetime.now()
+            alta_dt_base = data_hora(rec_perm.get("dataAlta"))
             alta_e = st.date_input("Data de Alta", alta_dt_base.date())
-            acom_e = st.text_input("Acomodação (na alta)", value=rec_perm.get("acomodacao", ""))
+            acom_e = st.text_input("Acomodação (na alta)", value=texto(rec_perm.get("acomodacao")))
 
             if st.form_submit_button("Salvar Permanência"):
                 reg = {
@@ -562,39 +598,33 @@ elif menu == "Editar":
                     "dataAlta": alta_e.isoformat(),
                     "acomodacao": acom_e
                 }
-                if len(rec_perm.dropna()):
-                    idx = df_perm[df_perm["numeroAtendimento"] == atend_sel].index[0]
-                    df_perm.loc[idx, :] = reg.values()
-                else:
-                    df_perm = pd.concat([df_perm, pd.DataFrame([reg])], ignore_index=True)
-                df_perm.to_csv(perm_path, index=False)
+                atualizar_registro(perm_path, reg, esperar=False)
                 st.success("Permanência salva! ✅")
 
     # ================== Aba 5 : Pós‑Alta ==========================
-    with tabs_ed[4]:
+    if etapa == "Pós-Alta":
         pos_path = "dados_pos_alta.csv"
-        df_pos = pd.read_csv(pos_path) if os.path.exists(pos_path) else pd.DataFrame()
-        rec_pos = fetch_row(df_pos, atend_sel)
+        rec_pos = fetch_row(pos_path, atend_sel)
 
-        with st.form("edit_pos"):
+        with st.form("edit_pos"), trecho("form:edit_pos"):
             st.subheader("✏️ Editar Pós‑Alta")
-            st.text_input("Hospital", value=rec_pos.get("hospital", hosp_sel), disabled=True)
+            st.text_input("Hospital", value=texto(rec_pos.get("hospital", hosp_sel)), disabled=True)
             st.text_input("Número Atendimento", value=atend_sel, disabled=True)
 
             gest_e = st.selectbox(
                 "Gestão de Crônicos", ["", "Sim", "Não"],
-                index=["", "Sim", "Não"].index(rec_pos.get("gestaoCronicos", ""))
-                if rec_pos.get("gestaoCronicos", "") in ["Sim", "Não"] else 0
+                index=["", "Sim", "Não"].index(texto(rec_pos.get("gestaoCronicos")))
+                if texto(rec_pos.get("gestaoCronicos")) in ["Sim", "Não"] else 0
             )
             rein_e = st.selectbox(
                 "Reinternação", ["", "Sim", "Não"],
-                index=["", "Sim", "Não"].index(rec_pos.get("reinternacao", ""))
-                if rec_pos.get("reinternacao", "") in ["Sim", "Não"] else 0
+                index=["", "Sim", "Não"].index(texto(rec_pos.get("reinternacao")))
+                if texto(rec_pos.get("reinternacao")) in ["Sim", "Não"] else 0
             )
             quant_e = st.number_input(
-                "Quantidade", value=int(rec_pos.get("quantidade") or 0), min_value=0
+                "Quantidade", value=numero(rec_pos.get("quantidade"), int), min_value=0
             )
-            obs_e = st.text_area("Observação", value=rec_pos.get("observacao", ""))
+            obs_e = st.text_area("Observação", value=texto(rec_pos.get("observacao")))
 
             if st.form_submit_button("Salvar Pós‑Alta"):
                 reg = {
@@ -605,23 +635,17 @@ elif menu == "Editar":
                     "quantidade": quant_e,
                     "observacao": obs_e
                 }
-                if len(rec_pos.dropna()):
-                    idx = df_pos[df_pos["numeroAtendimento"] == atend_sel].index[0]
-                    df_pos.loc[idx, :] = reg.values()
-                else:
-                    df_pos = pd.concat([df_pos, pd.DataFrame([reg])], ignore_index=True)
-                df_pos.to_csv(pos_path, index=False)
+                atualizar_registro(pos_path, reg, esperar=False)
                 st.success("Pós‑Alta salva! ✅")
 
     # ================== Aba 6 : Questionários =====================
-    with tabs_ed[5]:
+    if etapa == "Questionários":
         q_path = "dados_questionarios.csv"
-        df_q = pd.read_csv(q_path) if os.path.exists(q_path) else pd.DataFrame()
-        rec_q = fetch_row(df_q, atend_sel)
+        rec_q = fetch_row(q_path, atend_sel)
 
-        with st.form("edit_q"):
+        with st.form("edit_q"), trecho("form:edit_q"):
             st.subheader("✏️ Editar Questionários")
-            st.text_input("Hospital", value=rec_q.get("hospital", hosp_sel), disabled=True)
+            st.text_input("Hospital", value=texto(rec_q.get("hospital", hosp_sel)), disabled=True)
             st.text_input("Número Atendimento", value=atend_sel, disabled=True)
 
             registro = {
@@ -632,15 +656,14 @@ elif menu == "Editar":
                 d_key = f"dataQuestionarioPaciente{dia}"
                 o_key = f"observacaoQuestionarioPaciente{dia}"
 
-                base_dt = datetime.fromisoformat(rec_q[d_key]) \
-                          if rec_q.get(d_key) else datetime.now()
+                base_dt = data_hora(rec_q.get(d_key))
                 data_e  = st.date_input(
                     f"Data Questionário – Dia {dia}",
                     base_dt.date(), key=f"q_d_{dia}"
                 )
                 obs_e   = st.text_area(
                     f"Observação Dia {dia}",
-                    value=rec_q.get(o_key, ""),
+                    value=texto(rec_q.get(o_key)),
                     key=f"q_o_{dia}"
                 )
 
@@ -648,17 +671,163 @@ elif menu == "Editar":
                 registro[o_key] = obs_e
 
             if st.form_submit_button("Salvar Questionários"):
-                if len(rec_q.dropna()):
-                    idx = df_q[df_q["numeroAtendimento"] == atend_sel].index[0]
-                    df_q.loc[idx, :] = registro.values()
-                else:
-                    df_q = pd.concat([df_q, pd.DataFrame([registro])], ignore_index=True)
-                df_q.to_csv(q_path, index=False)
+                atualizar_registro(q_path, registro, esperar=False)
                 st.success("Questionários salvos! ✅")
 
 # ==================================================================
 #                               INDICADORES
 # ==================================================================
 elif menu == "Indicadores":
-    st.subheader("📈 Indicadores (em breve)")
-    st.info("Aqui virão gráficos e métricas geradas a partir dos CSVs.")
+    st.subheader("📈 Indicadores")
+
+    kpi = indicadores()
+    if kpi.empty:
+        st.warning("Nenhum atendimento registrado ainda.")
+        st.stop()
+
+    # -------- filtros (sobre a tabela já agregada) ----------
+    c1, c2 = st.columns(2)
+    with c1:
+        hosp_ind = st.selectbox("Hospital", [""] + sorted(kpi["hospital"].dropna().unique()))
+    with c2:
+        linha_ind = st.selectbox("Linha de Cuidado", [""] + sorted(kpi["linhaCuidado"].dropna().unique()))
+
+    grupos = [g for g, sel in (("hospital", hosp_ind), ("linhaCuidado", linha_ind)) if sel]
+    sel = kpi
+    if hosp_ind:
+        sel = sel[sel["hospital"] == hosp_ind]
+    if linha_ind:
+        sel = sel[sel["linhaCuidado"] == linha_ind]
+
+    # -------- resumo do recorte ----------
+    if grupos:
+        resumo = indicadores(grupos)
+        for g, valor in (("hospital", hosp_ind), ("linhaCuidado", linha_ind)):
+            if valor:
+                resumo = resumo[resumo[g] == valor]
+    else:
+        resumo = indicadores([])
+    r = resumo.iloc[0] if len(resumo) else pd.Series(dtype="float64")
+
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Atendimentos", fmt_metrica(r.get("atendimentos"), ",.0f").replace(",", "."))
+    m2.metric("Tempo Exame PS p50 (min)", fmt_metrica(r.get("tempoExamePSP50"), ".1f"))
+    m3.metric("Permanência Real / DRG", fmt_metrica(r.get("razaoPermanencia"), ".2f"))
+    m4.metric("Reinternação", fmt_metrica(r.get("taxaReinternacao"), ".1%"))
+    m5.metric("Mortalidade", fmt_metrica(r.get("taxaMortalidade"), ".1%"))
+
+    # -------- gráficos ----------
+    sel_idx = sel.assign(grupo=sel["hospital"].astype(str) + " · " + sel["linhaCuidado"].astype(str)).set_index("grupo")
+    g1, g2 = st.columns(2)
+    with g1:
+        st.markdown("**⏱️ Tempo de Exame (min) – p50 / p90**")
+        st.bar_chart(sel_idx[["tempoExamePSP50", "tempoExamePSP90",
+                              "tempoExameInternacaoP50", "tempoExameInternacaoP90"]])
+    with g2:
+        st.markdown("**🛎️ Permanência Real x Prevista DRG (dias)**")
+        st.bar_chart(sel_idx[["permanenciaRealMedia", "permanenciaPrevistaMedia"]])
+
+    g3, g4 = st.columns(2)
+    with g3:
+        st.markdown("**🏥 Tempo médio de UTI (dias)**")
+        st.bar_chart(sel_idx[["tempoUTIMedio"]])
+    with g4:
+        st.markdown("**🔁 Reinternação x Mortalidade**")
+        st.bar_chart(sel_idx[["taxaReinternacao", "taxaMortalidade"]])
+
+    st.dataframe(sel, use_container_width=True, hide_index=True)
+
+    # -------- período (consulta o cubo hospital × linha × dia) ----------
+    st.markdown("### 📅 Evolução no período")
+    df_cubo = cubo()
+    if df_cubo.empty:
+        st.info("Sem datas de internação PS registradas.")
+        st.stop()
+
+    dia_min, dia_max = df_cubo["dia"].min().date(), df_cubo["dia"].max().date()
+    periodo = st.date_input("Período", (dia_min, dia_max),
+                            min_value=dia_min, max_value=dia_max)
+    inicio, fim = (periodo[0], periodo[-1]) if len(periodo) else (dia_min, dia_max)
+    filtros_cubo = {"hospital": hosp_ind, "linhaCuidado": linha_ind}
+
+    # só vão para o navegador tabelas já reduzidas (até graficos.MAX_PONTOS linhas)
+    diario = consultar_cubo(["dia"], inicio, fim, filtros_cubo)
+    p1, p2 = st.columns(2)
+    with p1:
+        st.markdown("**Atendimentos por dia**")
+        st.altair_chart(alt.Chart(reduzir(diario, "dia", "atendimentos")).mark_line().encode(
+            x=alt.X("dia:T", title=None), y=alt.Y("atendimentos:Q", title=None)),
+            use_container_width=True)
+    with p2:
+        st.markdown("**Tempo médio de exame PS (min)**")
+        st.altair_chart(alt.Chart(reduzir(diario, "dia", "media_tempoExamePS")).mark_line().encode(
+            x=alt.X("dia:T", title=None), y=alt.Y("media_tempoExamePS:Q", title=None)),
+            use_container_width=True)
+
+    p3, p4 = st.columns(2)
+    with p3:
+        st.markdown("**Tempo de exame PS por atendimento (min)**")
+        st.altair_chart(alt.Chart(serie("tempoExamePS", filtros_cubo, inicio, fim)).mark_line(
+            strokeWidth=1).encode(
+            x=alt.X("dataHoraInternacaoPS:T", title=None), y=alt.Y("tempoExamePS:Q", title=None)),
+            use_container_width=True)
+    with p4:
+        st.markdown("**Distribuição da permanência real (dias)**")
+        st.altair_chart(alt.Chart(distribuicao("permanenciaReal", filtros_cubo, inicio, fim)).mark_bar().encode(
+            x=alt.X("inicio:Q", bin="binned", title=None), x2="fim:Q",
+            y=alt.Y("atendimentos:Q", title=None)),
+            use_container_width=True)
+
+    st.markdown("**Atendimentos por hospital e mês**")
+    st.altair_chart(alt.Chart(volumes(filtros_cubo, inicio, fim)).mark_bar().encode(
+        x=alt.X("yearmonth(mes):T", title=None), y=alt.Y("atendimentos:Q", title=None),
+        color=alt.Color("hospital:N", title="Hospital")),
+        use_container_width=True)
+
+    st.dataframe(
+        consultar_cubo(["hospital", "linhaCuidado"], inicio, fim, filtros_cubo)[
+            ["hospital", "linhaCuidado", "atendimentos",
+             "media_tempoExamePS", "desvio_tempoExamePS",
+             "media_tempoExameInternacao", "media_permanenciaReal", "media_tempoUTI"]
+        ],
+        use_container_width=True, hide_index=True
+    )
+
+    st.markdown("**Percentis nos meses do período (p50 / p90 / p99)**")
+    st.dataframe(percentis(["hospital", "linhaCuidado"], inicio, fim, filtros_cubo),
+                 use_container_width=True, hide_index=True)
+
+# ==================================================================
+#                               AGENDA
+# ==================================================================
+elif menu == "Agenda":
+    st.subheader("🗓️ Questionários de seguimento")
+
+    hoje = datetime.now().date()
+    janelas = {
+        "Vencidos":          (None, hoje - timedelta(days=1)),
+        "Hoje":              (hoje, hoje),
+        "Próximos 7 dias":   (hoje, hoje + timedelta(days=6)),
+        "Próximos 30 dias":  (hoje, hoje + timedelta(days=29)),
+    }
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        janela = st.selectbox("Vencimento", list(janelas))
+    with c2:
+        hosp_ag = st.selectbox("Hospital", [""] + HOSPITAIS, key="agenda_hospital")
+    with c3:
+        linha_ag = st.selectbox("Linha de Cuidado", [""] + LINHAS_CUIDADO, key="agenda_linha")
+
+    inicio_ag, fim_ag = janelas[janela]
+    lista_ag = vencimentos(inicio_ag, fim_ag, {"hospital": hosp_ag, "linhaCuidado": linha_ag})
+    st.caption(f"{len(lista_ag)} questionário(s) sem resposta")
+    # no máximo 10 páginas vão para o navegador (a lista já vem ordenada)
+    st.dataframe(
+        lista_ag.head(TAMANHO_PAGINA * 10)[
+            ["vencimento", "atraso", "dia", "numeroAtendimento", "nomePaciente",
+             "hospital", "linhaCuidado", "dataAlta"]],
+        use_container_width=True, hide_index=True,
+        column_config={"vencimento": st.column_config.DateColumn("Vencimento"),
+                       "dataAlta": st.column_config.DateColumn("Alta"),
+                       "atraso": "Atraso (dias)", "dia": "Dia"}
+    )
@@ -0,0 +1,354 @@
+# benchmark.py
+# ------------------------------------------------------------------
+# BENCHMARK DA CAMADA DE DADOS COM DADOS SINTÉTICOS
+#   • gerar(): atendimentos fictícios ligados pelas 6 etapas, com os
+#     hospitais / linhas de cuidado reais e datas coerentes
+#     (PS -> solicitação -> execução -> laudo -> internação -> alta ->
+#     questionários de 7/30/60/90 dias)
+#   • para cada tamanho (10k / 100k / 1M atendimentos) mede carga,
+#     fetch_row, filtros e busca do Editar, append, edição e a
+#     reescrita completa do CSV (compactação)
+#   • resultado em JSON (versões, commit, backend e um registro por
+#     tamanho × operação, com o pico de memória do processo até ali)
+#     para comparar entre versões:
+#       python benchmark.py --saida atual.json
+#       python benchmark.py --comparar anterior.json atual.json
+#   • roda num diretório temporário; backend pelo LINHAS_BACKEND
+# ------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import queue
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import busca
+import dados
+import indicadores
+from dados import COLUNAS, ETAPAS, HOSPITAIS, LINHAS_CUIDADO
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+BLOCO = 200_000             # atendimentos gerados por vez (limita a memória)
+CONSULTAS = 1000            # fetch_row por medição
+GRAVACOES = 50              # save_csv / atualizar_registro por medição
+LOTE = 1000                 # linhas do salvar_lote
+
+_PRIMEIROS = np.array(["Ana", "João", "Maria", "José", "Ítalo", "Conceição", "Pedro",
+                       "Luíza", "Antônio", "Sebastião", "Márcia", "Raimundo"])
+_SOBRENOMES = np.array(["Silva", "Souza", "Araújo", "Lima", "Gonçalves", "Pereira",
+                        "Ferreira", "Magalhães", "Simões", "Conceição"])
+# CID / procedimentos típicos de cada linha de cuidado
+_CID = {"AVC": "I63.9", "Chron": "K50.9", "Fratura de Fêmur": "S72.0", "ICC": "I50.0"}
+_PROCEDIMENTOS = {"AVC": ["Trombólise", "Trombectomia"], "Chron": ["Colectomia", "Ileostomia"],
+                  "Fratura de Fêmur": ["Artroplastia", "Osteossíntese"],
+                  "ICC": ["Cateterismo", "Marcapasso"]}
+
+
+# --------------------------- Geração -------------------------------
+def _iso(datas: pd.Series, formato: str = "%Y-%m-%dT%H:%M:%S") -> pd.Series:
+    return datas.dt.strftime(formato)
+
+
+def _minutos(rng, n: int, inicio: int, fim: int) -> pd.TimedeltaIndex:
+    return pd.to_timedelta(rng.integers(inicio, fim, n), unit="min")
+
+
+def _bloco(inicio: int, n: int, semente: int) -> dict:
+    """DataFrames das 6 etapas para os atendimentos inicio..inicio+n-1."""
+    rng = np.random.default_rng([semente, inicio])
+    linha = rng.choice(LINHAS_CUIDADO, n)
+    hospital = rng.choice(HOSPITAIS, n)
+    atend = (10_000_000 + inicio + np.arange(n)).astype(str)
+
+    # Pronto Atendimento: todo atendimento passa por ele
+    ps = pd.Series(pd.Timestamp("2024-01-01") + _minutos(rng, n, 0, 720 * 24 * 60))
+    solic = ps + _minutos(rng, n, 5, 120)
+    execu = solic + _minutos(rng, n, 5, 90)
+    laudo = execu + _minutos(rng, n, 10, 240)
+    status = rng.choice(["Internado", "Alta", "Óbito"], n, p=[0.55, 0.40, 0.05])
+    pa_ = pd.DataFrame({
+        "hospital": hospital, "linhaCuidado": linha, "numeroAtendimento": atend,
+        "status": status,
+        "numeroAutorizacao": rng.integers(10**8, 10**9, n).astype(str),
+        "numeroDRG": rng.integers(100, 999, n).astype(str),
+        "nomePaciente": np.char.add(np.char.add(rng.choice(_PRIMEIROS, n), " "),
+                                    rng.choice(_SOBRENOMES, n)),
+        "idade": rng.integers(18, 98, n),
+        "cidPrincipal": pd.Series(linha).map(_CID).to_numpy(),
+        "dataHoraInternacaoPS": _iso(ps),
+        "ECG": rng.choice(["Sim", "Não", "Sem Informação"], n, p=[0.7, 0.2, 0.1]),
+        "raioX": rng.choice(["Sim", "Não", "Sem Informação"], n, p=[0.6, 0.3, 0.1]),
+        "examePS": rng.choice(["Tomografia", "Ressonância", "Ecocardiograma", "Raio-X"], n),
+        "dataHoraSolicitacao": _iso(solic), "dataHoraExecucao": _iso(execu),
+        "dataHoraLaudo": _iso(laudo),
+        "tempoExame": ((laudo - solic).dt.total_seconds() / 60).round(2),
+    })
+
+    # Internação: quem não teve alta direto do PS
+    i = np.flatnonzero(status != "Alta")
+    k = len(i)
+    internacao = ps[i].reset_index(drop=True) + _minutos(rng, k, 60, 12 * 60)
+    solic_i = internacao + _minutos(rng, k, 30, 24 * 60)
+    execu_i = solic_i + _minutos(rng, k, 10, 180)
+    laudo_i = execu_i + _minutos(rng, k, 10, 300)
+    uti = rng.integers(0, 15, k) * (rng.random(k) < 0.35)
+    int_ = pd.DataFrame({
+        "hospital": hospital[i], "numeroAtendimento": atend[i],
+        "acomodacao": rng.choice(["Enfermaria", "Apartamento", "UTI"], k, p=[0.6, 0.25, 0.15]),
+        "dataHoraInternacao": _iso(internacao),
+        "exameSolicitadoInternacao": rng.choice(["Hemograma", "Tomografia", "Ecocardiograma"], k),
+        "dataHoraSolicitacao": _iso(solic_i), "dataHoraExecucao": _iso(execu_i),
+        "dataHoraLaudo": _iso(laudo_i),
+        "tempoExame": ((laudo_i - solic_i).dt.total_seconds() / 60).round(2),
+        "altaUTIParaEnfermaria": (uti > 0) & (rng.random(k) < 0.8),
+        "tempoUTI": uti,
+    })
+
+    # Tratamento: metade dos internados é operada
+    t = rng.random(k) < 0.5
+    trat = pd.DataFrame({
+        "hospital": hospital[i][t], "numeroAtendimento": atend[i][t],
+        "procedimentoCirurgico": [rng.choice(_PROCEDIMENTOS[l]) for l in linha[i][t]],
+        "tipoProcedimentoCirurgico": rng.choice(["Eletivo", "Urgência"], int(t.sum())),
+        "grauSeveridade": rng.choice(["Leve", "Moderado", "Grave"], int(t.sum())),
+    })
+
+    # Permanência: todos os internados; alta = internação + permanência real
+    prevista = rng.gamma(4, 2, k).round(1)
+    real = np.maximum(prevista + rng.normal(0, 2.5, k), 0.5).round(1)
+    alta = (internacao + pd.to_timedelta(real, unit="D")).dt.normalize()
+    perm = pd.DataFrame({
+        "hospital": hospital[i], "numeroAtendimento": atend[i],
+        "estratificacaoRisco": rng.choice(["Baixo", "Médio", "Alto"], k),
+        "permanenciaPrevistaDRG": prevista, "permanenciaReal": real,
+        "dataAlta": _iso(alta, "%Y-%m-%d"),
+        "acomodacao": int_["acomodacao"].to_numpy(),
+    })
+
+    # Pós-Alta: internados que saíram vivos
+    v = status[i] != "Óbito"
+    pos = pd.DataFrame({
+        "hospital": hospital[i][v], "numeroAtendimento": atend[i][v],
+        "gestaoCronicos": rng.choice(["Sim", "Não"], int(v.sum())),
+        "reinternacao": rng.choice(["Sim", "Não"], int(v.sum()), p=[0.1, 0.9]),
+        "quantidade": rng.integers(0, 3, int(v.sum())),
+        "observacao": rng.choice(["", "Retorno agendado", "Sem intercorrências"], int(v.sum())),
+    })
+
+    # Questionários: 7/30/60/90 dias depois da alta, cada vez menos respondidos
+    questionarios = {"hospital": hospital[i][v], "numeroAtendimento": atend[i][v]}
+    alta_v = alta[v].reset_index(drop=True)
+    for dia, resposta in ((7, 0.9), (30, 0.75), (60, 0.6), (90, 0.5)):
+        respondeu = rng.random(int(v.sum())) < resposta
+        data = (alta_v + pd.Timedelta(days=dia)).where(respondeu)
+        questionarios[f"dataQuestionarioPaciente{dia}"] = _iso(data, "%Y-%m-%d")
+        questionarios[f"observacaoQuestionarioPaciente{dia}"] = np.where(
+            respondeu, rng.choice(["Bem", "Com dor", "Sem queixas"], int(v.sum())), "")
+
+    return {"Pronto Atendimento": pa_, "Internação": int_, "Tratamento": trat,
+            "Permanência": perm, "Pós-Alta": pos, "Questionários": pd.DataFrame(questionarios)}
+
+
+def gerar(n: int, diretorio: str = ".", semente: int = 0) -> dict:
+    """Grava os CSVs das 6 etapas com `n` atendimentos em `diretorio`.
+
+    Devolve {etapa: linhas}."""
+    linhas = dict.fromkeys(ETAPAS, 0)
+    for inicio in range(0, n, BLOCO):
+        for etapa, df in _bloco(inicio, min(BLOCO, n - inicio), semente).items():
+            df.reindex(columns=COLUNAS[etapa]).to_csv(
+                os.path.join(diretorio, ETAPAS[etapa]), index=False,
+                mode="a" if inicio else "w", header=not inicio)
+            linhas[etapa] += len(df)
+    return linhas
+
+
+# --------------------------- Medição -------------------------------
+def _medir(funcao, vezes: int = 1) -> dict:
+    tempos = []
+    for i in range(vezes):
+        t = time.perf_counter()
+        funcao(i)
+        tempos.append(time.perf_counter() - t)
+    tempos = np.array(tempos)
+    return {"repeticoes": vezes, "total_s": round(float(tempos.sum()), 6),
+            "media_ms": round(float(tempos.mean()) * 1e3, 4),
+            "p95_ms": round(float(np.percentile(tempos, 95)) * 1e3, 4)}
+
+
+def _pico_mb() -> float:
+    # ru_maxrss: KiB no Linux, bytes no macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def _registro(linha: pd.Series) -> dict:
+    """Linha do fetch_row no formato que os formulários gravam."""
+    registro = {}
+    for col, valor in linha.items():
+        if pd.isna(valor):
+            valor = None
+        elif isinstance(valor, pd.Timestamp):
+            valor = valor.strftime(dados.FORMATOS_DATA[dados.ESQUEMA[col]])
+        elif isinstance(valor, np.generic):
+            valor = valor.item()
+        registro[col] = valor
+    return registro
+
+
+def _zerar_backend(db_path: str = None):
+    """Esquece o estado da medição anterior: cache de dados.py e da busca,
+    pool e colunas do SQLite (conexões abertas no banco já apagado) e
+    schemas do Parquet. Com `db_path`, o SQLite passa a usar esse banco."""
+    dados.invalidar()
+    busca._cache.clear()
+    if dados.BACKEND == "sqlite":
+        import dados_sqlite
+        while True:
+            try:
+                dados_sqlite._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        dados_sqlite._colunas.clear()
+        if db_path is not None:
+            dados_sqlite.DB_PATH = db_path
+    elif dados.BACKEND == "parquet":
+        import dados_parquet
+        with dados_parquet._schemas_lock:
+            dados_parquet._schemas.clear()
+
+
+def medir(n: int, semente: int = 0) -> list:
+    """Roda todas as medições com `n` atendimentos; um dict por operação."""
+    diretorio = tempfile.mkdtemp(prefix="linhas_bench_")
+    anterior = os.getcwd()
+    os.chdir(diretorio)                 # as etapas são caminhos relativos
+    banco = None
+    if dados.BACKEND == "sqlite":
+        import dados_sqlite
+        banco = dados_sqlite.DB_PATH
+        _zerar_backend(os.path.join(diretorio, os.path.basename(banco)))
+    else:
+        _zerar_backend()
+    resultados = []
+
+    def registrar(operacao: str, medida: dict):
+        resultados.append({"n": n, "operacao": operacao, **medida, "pico_mb": _pico_mb()})
+        print(f"{n:>9,} {operacao:<16} {medida['media_ms']:>12,.3f} ms "
+              f"(p95 {medida['p95_ms']:,.3f}, x{medida['repeticoes']})", file=sys.stderr)
+
+    try:
+        registrar("gerar", _medir(lambda _: gerar(n, ".", semente)))
+        if dados.BACKEND == "sqlite":
+            import dados_sqlite
+            registrar("conversao", _medir(lambda _: dados_sqlite.migrar_csvs()))
+        elif dados.BACKEND == "parquet":
+            import dados_parquet
+            registrar("conversao", _medir(lambda _: dados_parquet.converter_csvs()))
+
+        pa_path = ETAPAS["Pronto Atendimento"]
+        rng = np.random.default_rng(semente)
+        chaves = (10_000_000 + rng.integers(0, n, CONSULTAS)).astype(str)
+        combinacoes = [{"hospital": h, "linhaCuidado": l} for h in HOSPITAIS for l in LINHAS_CUIDADO]
+
+        def carga(_):
+            dados.invalidar()
+            dados.carregar_csv(pa_path)
+        registrar("carga_pa", _medir(carga))
+        registrar("carga_etapas", _medir(lambda _: (dados.invalidar(), indicadores.base())))
+        registrar("fetch_row", _medir(lambda i: dados.fetch_row(pa_path, chaves[i]), CONSULTAS))
+        registrar("filtro", _medir(
+            lambda i: dados.carregar_csv(pa_path, filtros=combinacoes[i]), len(combinacoes)))
+        registrar("indice_busca", _medir(lambda _: (busca._cache.clear(), busca._indice())))
+        registrar("editar_pagina", _medir(
+            lambda i: busca.pagina(combinacoes[i], 2), len(combinacoes)))
+        termos = ["ma", "silva", "joão sou", chaves[0][:5], chaves[1]]
+        registrar("editar_busca", _medir(lambda i: busca.buscar(termos[i]), len(termos)))
+
+        novos = _bloco(n, GRAVACOES + LOTE, semente + 1)["Pronto Atendimento"]
+        novos = novos.astype(object).where(novos.notna(), None).to_dict("records")
+        registrar("append", _medir(lambda i: dados.save_csv(pa_path, novos[i]), GRAVACOES))
+        registrar("append_lote", _medir(lambda _: dados.salvar_lote(pa_path, novos[GRAVACOES:])))
+
+        def edicao(i):
+            registro = _registro(dados.fetch_row(pa_path, chaves[i]))
+            dados.atualizar_registro(pa_path, {**registro, "nomePaciente": f"Editado {i}"})
+        registrar("edicao", _medir(edicao, GRAVACOES))
+        if dados.BACKEND != "sqlite":
+            registrar("reescrita", _medir(lambda _: dados.compactar(pa_path)))
+    finally:
+        dados.descarregar()
+        _zerar_backend(banco)           # fecha as conexões antes de apagar o banco
+        os.chdir(anterior)
+        shutil.rmtree(diretorio, ignore_errors=True)
+    return resultados
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(tamanhos: list = TAMANHOS, semente: int = 0) -> dict:
+    """Todas as medições em todos os tamanhos, no formato do JSON de saída."""
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "backend": dados.BACKEND,
+        "python": platform.python_version(), "pandas": pd.__version__,
+        "pyarrow": pa.__version__, "plataforma": platform.platform(),
+        "resultados": [r for n in tamanhos for r in medir(n, semente)],
+    }
+
+
+def comparar(antes: dict, depois: dict) -> pd.DataFrame:
+    """Média de cada (n, operação) nas duas execuções e a razão depois/antes
+    (< 1 = ficou mais rápido)."""
+    chave = ["n", "operacao"]
+    a = pd.DataFrame(antes["resultados"]).set_index(chave)["media_ms"]
+    d = pd.DataFrame(depois["resultados"]).set_index(chave)["media_ms"]
+    res = pd.DataFrame({"antes_ms": a, "depois_ms": d}).dropna()
+    res["razao"] = (res["depois_ms"] / res["antes_ms"]).round(3)
+    return res.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da camada de dados.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS,
+                        help="atendimentos por rodada (padrão: %(default)s)")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", help="arquivo JSON (padrão: stdout)")
+    parser.add_argument("--gerar", metavar="DIR",
+                        help="só gera os CSVs sintéticos em DIR (com o 1º tamanho)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"),
+                        help="compara dois JSONs de resultado")
+    args = parser.parse_args()
+
+    if args.comparar:
+        antes, depois = (json.load(open(p, encoding="utf-8")) for p in args.comparar)
+        print(comparar(antes, depois).to_string(index=False))
+    elif args.gerar:
+        os.makedirs(args.gerar, exist_ok=True)
+        print(json.dumps(gerar(args.tamanhos[0], args.gerar, args.semente), ensure_ascii=False))
+    else:
+        resultado = json.dumps(executar(args.tamanhos, args.semente), ensure_ascii=False, indent=1)
+        if args.saida:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                f.write(resultado)
+        else:
+            print(resultado)
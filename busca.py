@@ -0,0 +1,163 @@
+# busca.py
+# ------------------------------------------------------------------
+# BUSCA E PAGINAÇÃO DOS ATENDIMENTOS (menu Editar)
+#   • índice de prefixo sobre numeroAtendimento, numeroAutorizacao e
+#     cada palavra de nomePaciente: arrays ordenados + searchsorted,
+#     sem distinção de maiúsculas/acentos
+#   • buscar() devolve só os N melhores resultados; pagina() só as
+#     linhas da página pedida — o navegador nunca recebe a tabela toda
+#   • índice refeito só quando o Pronto Atendimento muda (assinatura)
+#   • nos backends externos, com hospital escolhido, o índice é só do
+#     hospital: a carga lê só a partição dele (Parquet) / WHERE (SQLite)
+# ------------------------------------------------------------------
+
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import dados
+from dados import ETAPAS, Facetas, assinatura, carregar_csv, normalizar_chaves
+from perfil import medido
+
+PA_PATH = ETAPAS["Pronto Atendimento"]
+COLUNAS = ["hospital", "linhaCuidado", "numeroAtendimento", "numeroAutorizacao",
+           "nomePaciente", "numeroDRG"]
+LIMITE = 20
+TAMANHO_PAGINA = 50
+
+# prioridade do tipo de acerto (menor = melhor)
+_EXATO, _PREFIXO_CHAVE, _PREFIXO_NOME = 0, 1, 2
+
+_cache: dict = {}          # hospital ("" = todos) -> (assinatura, _Indice)
+_lock = threading.Lock()
+
+
+def _normalizar(texto: str) -> str:
+    t = unicodedata.normalize("NFKD", str(texto).strip().lower())
+    return t.encode("ascii", "ignore").decode("ascii")
+
+
+def normalizar_texto(serie: pd.Series) -> pd.Series:
+    """Minúsculas, sem acentos e sem espaços nas pontas.
+
+    Normaliza cada valor distinto uma vez só (nomes se repetem muito)."""
+    codigos, unicos = pd.factorize(serie.fillna("").astype(str), sort=False)
+    norm = np.array([_normalizar(u) for u in unicos] + [""], dtype=object)
+    return pd.Series(norm[codigos], index=serie.index)     # código -1 (nulo) cai no ""
+
+
+class _Indice:
+    """Tabela do PA + um array ordenado (termo, posição) por campo."""
+
+    def __init__(self, df: pd.DataFrame):
+        # ordem fixa pelo nº de atendimento: a página (e as opções do
+        # selectbox) não muda quando o backend reordena linhas editadas
+        self.df = df.sort_values("numeroAtendimento", kind="stable", ignore_index=True)
+        self.facetas = Facetas(self.df)
+        pos = np.arange(len(self.df))
+        self.campos = {}
+        for col in ("numeroAtendimento", "numeroAutorizacao"):
+            # identificadores: só caixa/espaços (quase todos distintos)
+            termos = self.df[col].fillna("").astype(str).str.strip().str.lower()
+            self.campos[col] = self._ordenar(termos.to_numpy(), pos)
+        # nome: cada palavra vira um termo ("maria da silva" acha por "sil")
+        palavras = normalizar_texto(self.df["nomePaciente"]).str.split().explode().dropna()
+        self.campos["nomePaciente"] = self._ordenar(
+            palavras.to_numpy(), palavras.index.to_numpy())
+
+    @staticmethod
+    def _ordenar(termos, pos):
+        termos = termos.astype(str)
+        ok = termos != ""
+        termos, pos = termos[ok], pos[ok]
+        ordem = np.argsort(termos, kind="stable")
+        return termos[ordem], pos[ordem]
+
+    def prefixo(self, campo: str, texto: str):
+        """(posições, termos) dos termos do campo que começam com `texto`."""
+        termos, pos = self.campos[campo]
+        fim = texto[:-1] + chr(ord(texto[-1]) + 1)
+        i, j = np.searchsorted(termos, [texto, fim], side="left")
+        return pos[i:j], termos[i:j]
+
+
+def _recorte(filtros: dict) -> str:
+    """Hospital cujo índice atende aos filtros ("" = todos).
+
+    No CSV a tabela inteira já está em memória e as facetas filtram de
+    graça; nos backends externos vale carregar só o hospital."""
+    if not dados._externo():
+        return ""
+    return (filtros or {}).get("hospital") or ""
+
+
+@medido(linhas=lambda r, *a, **k: len(r.df))
+def _indice(hospital: str = "") -> _Indice:
+    sig = assinatura(PA_PATH)
+    with _lock:
+        if _cache.get(hospital, (None,))[0] == sig:
+            return _cache[hospital][1]
+    df = carregar_csv(PA_PATH, colunas=COLUNAS,
+                      filtros={"hospital": hospital}).reindex(columns=COLUNAS)
+    df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"])
+    ind = _Indice(df)
+    with _lock:
+        # índices de assinatura velha não servem mais para ninguém
+        for h in [h for h, (s, _) in _cache.items() if s != sig]:
+            del _cache[h]
+        _cache[hospital] = (sig, ind)
+    return ind
+
+
+# --------------------------- Consultas -----------------------------
+@medido
+def buscar(texto: str, filtros: dict = None, limite: int = LIMITE) -> pd.DataFrame:
+    """Os `limite` atendimentos que melhor casam com o prefixo digitado.
+
+    Ordem: nº de atendimento/autorização idêntico, prefixo de nº, nome
+    (cada palavra digitada é prefixo de uma palavra do nome); empate pelo
+    nº de atendimento."""
+    texto = _normalizar(texto)
+    ind = _indice(_recorte(filtros))
+    if not texto or ind.df.empty:
+        return ind.df.iloc[:0]
+
+    achados_pos, achados_nota = [], []
+    for campo in ("numeroAtendimento", "numeroAutorizacao"):
+        pos, termos = ind.prefixo(campo, texto)
+        achados_pos.append(pos)
+        achados_nota.append(np.where(termos == texto, _EXATO, _PREFIXO_CHAVE))
+    # nome: cada palavra digitada tem de começar alguma palavra do nome
+    pos = None
+    for palavra in texto.split():
+        p = np.unique(ind.prefixo("nomePaciente", palavra)[0])
+        pos = p if pos is None else np.intersect1d(pos, p, assume_unique=True)
+    achados_pos.append(pos)
+    achados_nota.append(np.full(len(pos), _PREFIXO_NOME))
+    pos = np.concatenate(achados_pos)
+    nota = np.concatenate(achados_nota)
+
+    if any(v not in ("", None) for v in (filtros or {}).values()):
+        ok = np.isin(pos, ind.facetas.posicoes(filtros))
+        pos, nota = pos[ok], nota[ok]
+    if not len(pos):
+        return ind.df.iloc[:0]
+
+    # um atendimento aparece uma vez, com a sua melhor nota
+    res = pd.DataFrame({"pos": pos, "nota": nota}).groupby("pos")["nota"].min()
+    res = res.to_frame().assign(
+        chave=ind.df["numeroAtendimento"].to_numpy()[res.index.to_numpy()])
+    melhores = res.sort_values(["nota", "chave"], kind="stable").index[:limite]
+    return ind.df.iloc[melhores]
+
+
+@medido(linhas=lambda r, *a, **k: len(r[0]))
+def pagina(filtros: dict = None, numero: int = 1,
+           tamanho: int = TAMANHO_PAGINA) -> tuple:
+    """(linhas da página `numero` (1..), total de linhas no filtro)."""
+    ind = _indice(_recorte(filtros))
+    pos = ind.facetas.posicoes(filtros)
+    inicio = (max(int(numero), 1) - 1) * tamanho
+    return ind.df.iloc[pos[inicio:inicio + tamanho]], len(pos)
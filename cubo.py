@@ -0,0 +1,278 @@
+# cubo.py
+# ------------------------------------------------------------------
+# CUBO PRÉ-AGREGADO  hospital × linhaCuidado × dia
+#   • dia = data de dataHoraInternacaoPS (Pronto Atendimento)
+#   • por célula: atendimentos e, para cada medida, n / soma / soma²
+#     (tempo de exame PS e internação, permanência real, dias de UTI)
+#   • mantido incrementalmente: cada save_csv / atualizar_registro tira
+#     da célula a contribuição antiga do atendimento e põe a nova
+#   • gravado em cubo_indicadores.parquet junto com a assinatura das
+#     etapas; se elas mudarem por fora, o cubo é reconstruído
+#   • save atualiza só o cubo em memória: o parquet é regravado uma vez
+#     por rajada de saves (ATRASO_GRAVACAO s depois da primeira) e na saída
+#   • reconstrução completa:  python cubo.py
+# ------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import dados
+from dados import ETAPAS, fetch_row, normalizar_chaves
+from perfil import medido
+
+ARQUIVO = "cubo_indicadores.parquet"
+
+DIMENSOES = ["hospital", "linhaCuidado", "dia"]
+# medida -> (etapa, coluna)
+MEDIDAS = {
+    "tempoExamePS":         ("Pronto Atendimento", "tempoExame"),
+    "tempoExameInternacao": ("Internação", "tempoExame"),
+    "permanenciaReal":      ("Permanência", "permanenciaReal"),
+    "tempoUTI":             ("Internação", "tempoUTI"),
+}
+COLUNAS = ["atendimentos"] + [f"{p}_{m}" for m in MEDIDAS for p in ("n", "soma", "soma2")]
+# etapas que alimentam o cubo (as outras não mexem nele)
+_FONTES = ["Pronto Atendimento", "Internação", "Permanência"]
+# lotes maiores que isso invalidam o cubo em vez de atualizá-lo linha a linha
+LIMITE_INCREMENTAL = 1000
+# segundos entre o primeiro save de uma rajada e a regravação do parquet
+ATRASO_GRAVACAO = 5.0
+
+# _lock não é tomado antes de ler etapas inteiras (dados.py /
+# indicadores.py esperam a gravadora, que chega a _gancho no meio de um
+# commit e precisa de _lock no depois); a reconstrução lê as etapas fora
+# dele e só troca as células sob ele
+_lock = threading.RLock()
+_estado = {"assinaturas": None, "celulas": None, "df": None, "timer": None}
+
+
+def _assinaturas(exceto: str = None) -> str:
+    # exceto: etapa sendo gravada; ela e as que dividem o destino com ela
+    # ficam de fora (o gancho confere só as outras)
+    return json.dumps([None if exceto and dados.destino(ETAPAS[e]) == dados.destino(exceto)
+                       else dados.assinatura(ETAPAS[e]) for e in _FONTES])
+
+
+def _num(valor) -> float:
+    v = pd.to_numeric(valor, errors="coerce")
+    return float(v) if pd.notna(v) else np.nan
+
+
+def _contribuicao(chave):
+    """(célula, vetor de COLUNAS) do atendimento, lido das etapas pelo índice."""
+    pa_ = fetch_row(ETAPAS["Pronto Atendimento"], chave)
+    hospital, linha = pa_.get("hospital"), pa_.get("linhaCuidado")
+    dia = pd.to_datetime(pa_.get("dataHoraInternacaoPS"), errors="coerce", format="ISO8601")
+    if pd.isna(hospital) or pd.isna(linha) or hospital == "" or linha == "" or pd.isna(dia):
+        return None
+
+    linhas = {"Pronto Atendimento": pa_}
+    vetor = [1.0]
+    for etapa, coluna in MEDIDAS.values():
+        if etapa not in linhas:
+            linhas[etapa] = fetch_row(ETAPAS[etapa], chave)
+        x = _num(linhas[etapa].get(coluna))
+        vetor += [0.0, 0.0, 0.0] if np.isnan(x) else [1.0, x, x * x]
+    return (hospital, linha, dia.normalize()), np.array(vetor)
+
+
+# --------------------------- Construção ----------------------------
+def _calcular_celulas() -> dict:
+    """Cubo inteiro a partir das etapas, vetorizado."""
+    from indicadores import base
+
+    df = base()
+    df["dia"] = df["dataHoraInternacaoPS"].dt.normalize()
+    df = df.dropna(subset=DIMENSOES)
+    df = df[(df["hospital"] != "") & (df["linhaCuidado"] != "")]
+
+    cols = {"atendimentos": np.ones(len(df))}
+    for m in MEDIDAS:
+        x = df[m].to_numpy(dtype="float64")
+        ok = ~np.isnan(x)
+        x = np.where(ok, x, 0.0)
+        cols[f"n_{m}"], cols[f"soma_{m}"], cols[f"soma2_{m}"] = ok.astype("float64"), x, x * x
+    agg = pd.DataFrame(cols, index=df.index).groupby(
+        [df[d] for d in DIMENSOES], observed=True).sum()
+    return dict(zip(agg.index, agg[COLUNAS].to_numpy()))
+
+
+def _tabela(celulas: dict) -> pd.DataFrame:
+    """Células como DataFrame (DIMENSOES + COLUNAS), ordenado."""
+    df = pd.DataFrame(list(celulas.values()), columns=COLUNAS)
+    chaves = list(celulas.keys())
+    for i, d in enumerate(DIMENSOES):
+        df.insert(i, d, [k[i] for k in chaves])
+    df["dia"] = pd.to_datetime(df["dia"])
+    return df.sort_values(DIMENSOES, ignore_index=True)
+
+
+def _gravar():
+    # chamado sob _lock: só mexe no estado e no arquivo, sem ler etapas
+    _estado["df"] = df = _tabela(_estado["celulas"])
+    tabela = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(
+        {"assinaturas": _estado["assinaturas"]})
+    tmp = ARQUIVO + ".tmp"
+    pq.write_table(tabela, tmp)
+    os.replace(tmp, ARQUIVO)
+
+
+def _adiar_gravacao():
+    # chamado sob _lock: um timer por rajada; os saves seguintes só
+    # mexem na memória até ele disparar
+    if _estado["timer"] is None:
+        _estado["timer"] = threading.Timer(ATRASO_GRAVACAO, gravar_pendente)
+        _estado["timer"].daemon = True
+        _estado["timer"].start()
+
+
+def gravar_pendente():
+    """Grava no parquet o cubo que só foi atualizado em memória."""
+    with _lock:
+        timer, _estado["timer"] = _estado["timer"], None
+        if timer is None:
+            return
+        timer.cancel()
+        if _estado["assinaturas"] is not None:      # desatualizado: nada a gravar
+            _gravar()
+
+
+def _na_saida():
+    dados.descarregar()         # gravações em segundo plano ainda passam pelo gancho
+    gravar_pendente()
+
+
+atexit.register(_na_saida)
+
+
+def _ler_gravado(sig: str):
+    try:
+        tabela = pq.read_table(ARQUIVO)
+    except (FileNotFoundError, OSError):
+        return None
+    meta = tabela.schema.metadata or {}
+    if meta.get(b"assinaturas", b"").decode() != sig:
+        return None
+    df = tabela.to_pandas()
+    return dict(zip(zip(*(df[d] for d in DIMENSOES)), df[COLUNAS].to_numpy()))
+
+
+def reconstruir():
+    """Refaz o cubo inteiro a partir das etapas e grava no disco."""
+    # assinatura tirada antes da leitura: se alguém gravar no meio, a
+    # próxima consulta vê a diferença e refaz de novo
+    sig = _assinaturas()
+    celulas = _calcular_celulas()
+    with _lock:
+        _estado.update(assinaturas=sig, celulas=celulas, df=None)
+        _gravar()
+
+
+def _garantir():
+    """Deixa o cubo em memória em dia com as etapas."""
+    sig = _assinaturas()
+    with _lock:
+        if _estado["assinaturas"] == sig:
+            return
+        celulas = _ler_gravado(sig)
+        if celulas is not None:
+            _estado.update(assinaturas=sig, celulas=celulas, df=None)
+            return
+    reconstruir()
+
+
+# --------------------------- Atualização incremental ---------------
+def _somar(cel, vetor, sinal: float):
+    celulas = _estado["celulas"]
+    novo = celulas.get(cel, np.zeros(len(COLUNAS))) + sinal * vetor
+    if novo[0] <= 0:
+        celulas.pop(cel, None)            # célula sem atendimentos some
+    else:
+        celulas[cel] = novo
+
+
+def _gancho(path: str, lote: pd.DataFrame):
+    # roda sob o lock de gravação de dados.py (ver _notificando)
+    if path not in (ETAPAS[e] for e in _FONTES) or "numeroAtendimento" not in lote:
+        return None
+    outras = _assinaturas(exceto=path)
+    if _estado["celulas"] is None or _estado["assinaturas"] != _assinaturas():
+        return None                       # já desatualizado: refeito na próxima leitura
+    if len(lote) > LIMITE_INCREMENTAL:
+        # carga em massa: sai mais barato reconstruir (vetorizado) na leitura
+        return lambda: _estado.update(assinaturas=None)
+    chaves = set(normalizar_chaves(lote["numeroAtendimento"]))
+    antes = {c: _contribuicao(c) for c in chaves}
+
+    def depois():
+        with _lock:
+            try:
+                agora = _assinaturas()
+                if _assinaturas(exceto=path) != outras:
+                    # outra etapa gravada em paralelo mudou o atendimento
+                    # depois do antes: refeito na próxima consulta
+                    _estado["assinaturas"] = None
+                    return
+                for c, velho in antes.items():
+                    if velho is not None:
+                        _somar(*velho, -1.0)
+                    novo = _contribuicao(c)
+                    if novo is not None:
+                        _somar(*novo, +1.0)
+                _estado.update(assinaturas=agora, df=None)
+                _adiar_gravacao()
+            except Exception:
+                # o registro já foi salvo; o cubo é refeito na próxima leitura
+                _estado["assinaturas"] = None
+    return depois
+
+
+dados.registrar_gancho(_gancho)
+
+
+# --------------------------- Consulta ------------------------------
+@medido
+def cubo() -> pd.DataFrame:
+    """O cubo como DataFrame (DIMENSOES + COLUNAS), uma linha por célula."""
+    _garantir()
+    with _lock:
+        if _estado["df"] is None:
+            _estado["df"] = _tabela(_estado["celulas"])
+        return _estado["df"]
+
+
+@medido
+def consultar(grupos: list = ("hospital", "linhaCuidado"), inicio=None, fim=None,
+              filtros: dict = None) -> pd.DataFrame:
+    """Agrega o cubo no período [inicio, fim] por `grupos`, com média e
+    desvio-padrão de cada medida (tirados de n, soma e soma²)."""
+    df = cubo()
+    if inicio is not None:
+        df = df[df["dia"] >= pd.Timestamp(inicio)]
+    if fim is not None:
+        df = df[df["dia"] <= pd.Timestamp(fim)]
+    for col, valor in (filtros or {}).items():
+        if valor not in ("", None):
+            df = df[df[col] == valor]
+
+    grupos = list(grupos)
+    res = (df.groupby(grupos, observed=True)[COLUNAS].sum() if grupos
+           else df[COLUNAS].sum().to_frame().T.astype("float64"))
+    for m in MEDIDAS:
+        n = res[f"n_{m}"].where(res[f"n_{m}"] > 0)
+        media = res[f"soma_{m}"] / n
+        res[f"media_{m}"] = media
+        res[f"desvio_{m}"] = np.sqrt((res[f"soma2_{m}"] / n - media ** 2).clip(lower=0))
+    return res.reset_index() if grupos else res.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    reconstruir()
+    print(f"{ARQUIVO}: {len(cubo())} células")
@@ -0,0 +1,1355 @@
+# dados.py
+# ------------------------------------------------------------------
+# CAMADA DE ACESSO AOS DADOS DAS LINHAS DE CUIDADO
+#   • leitura dos CSVs de cada etapa com cache compartilhado entre
+#     reruns e sessões do Streamlit (um único cache por processo);
+#     o DataFrame do cache nunca é alterado: edições geram um novo
+#     (só as colunas tocadas são copiadas) e a troca é feita sob _lock
+#   • invalidação pelo mtime/tamanho do arquivo e pelas escritas
+#     feitas pelo próprio app (save_csv / atualizar_registro)
+#   • CSV base e log só crescem: o cache guarda até que byte leu cada
+#     um e, quando outro processo acrescenta linhas, lê só o final novo;
+#     arquivo truncado ou reescrito -> recarga completa
+#   • índice hash numeroAtendimento -> posição por tabela
+#   • ESQUEMA com o tipo de cada coluna: ids como string, datas já
+#     parseadas, categorias, inteiros compactos
+#   • hospital / linhaCuidado como category + índice de facetas
+#     (hospital, linhaCuidado) -> posições, para filtros e listas de opções
+#   • edições gravadas num log append-only por etapa (last-write-wins),
+#     incorporado ao CSV base pela compactação
+#   • backends opcionais: SQLite (LINHAS_BACKEND=sqlite, dados_sqlite.py)
+#     e Parquet (LINHAS_BACKEND=parquet, dados_parquet.py)
+#   • leitura só das colunas/filtros pedidos (carregar_csv)
+#   • gravação segura entre sessões/processos: flock por etapa, arquivo
+#     temporário + rename atômico e group commit (um fsync por lote)
+#   • formulários podem gravar em segundo plano (esperar=False): fila
+#     limitada + uma thread gravadora por processo, descarregada na saída
+#   • leituras, consultas e gravações medidas por perfil.py (LINHAS_PERFIL)
+# ------------------------------------------------------------------
+
+import atexit
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from perfil import medido
+
+try:
+    import fcntl
+except ImportError:                 # Windows: sem flock
+    fcntl = None
+
+_log = logging.getLogger(__name__)
+
+# --------------------------- Etapas --------------------------------
+ETAPAS = {
+    "Pronto Atendimento": "dados_pronto_atendimento.csv",
+    "Internação":         "dados_internacao.csv",
+    "Tratamento":         "dados_tratamento.csv",
+    "Permanência":        "dados_permanencia.csv",
+    "Pós-Alta":           "dados_pos_alta.csv",
+    "Questionários":      "dados_questionarios.csv",
+}
+
+# colunas de cada etapa, na ordem em que os formulários gravam
+COLUNAS = {
+    "Pronto Atendimento": [
+        "hospital", "linhaCuidado", "numeroAtendimento", "status",
+        "numeroAutorizacao", "numeroDRG", "nomePaciente", "idade",
+        "cidPrincipal", "dataHoraInternacaoPS", "ECG", "raioX", "examePS",
+        "dataHoraSolicitacao", "dataHoraExecucao", "dataHoraLaudo", "tempoExame",
+    ],
+    "Internação": [
+        "hospital", "numeroAtendimento", "acomodacao", "dataHoraInternacao",
+        "exameSolicitadoInternacao", "dataHoraSolicitacao", "dataHoraExecucao",
+        "dataHoraLaudo", "tempoExame", "altaUTIParaEnfermaria", "tempoUTI",
+    ],
+    "Tratamento": [
+        "hospital", "numeroAtendimento", "procedimentoCirurgico",
+        "tipoProcedimentoCirurgico", "grauSeveridade",
+    ],
+    "Permanência": [
+        "hospital", "numeroAtendimento", "estratificacaoRisco",
+        "permanenciaPrevistaDRG", "permanenciaReal", "dataAlta", "acomodacao",
+    ],
+    "Pós-Alta": [
+        "hospital", "numeroAtendimento", "gestaoCronicos", "reinternacao",
+        "quantidade", "observacao",
+    ],
+    "Questionários": ["hospital", "numeroAtendimento"] + [
+        f"{campo}{dia}" for dia in (7, 30, 60, 90)
+        for campo in ("dataQuestionarioPaciente", "observacaoQuestionarioPaciente")
+    ],
+}
+
+HOSPITAIS = ["Centro Médico", "Galileo", "HUC", "Irmãos Penteado", "Maternidade", "PUCC"]
+LINHAS_CUIDADO = ["AVC", "Chron", "Fratura de Fêmur", "ICC"]
+
+# --------------------------- Esquema -------------------------------
+# tipo de cada coluna, o mesmo em todas as etapas onde ela aparece:
+#   id        identificador digitado (string, nunca número: "00123" fica "00123")
+#   texto     texto livre (string)
+#   categoria poucos valores repetidos (category)
+#   datahora  / data   datetime64, parseado uma vez na carga
+#   inteiro   Int32 (aceita vazio)     decimal  float64     logico  boolean
+ESQUEMA = {
+    "hospital": "categoria", "linhaCuidado": "categoria", "status": "categoria",
+    "ECG": "categoria", "raioX": "categoria", "grauSeveridade": "categoria",
+    "gestaoCronicos": "categoria", "reinternacao": "categoria",
+    "numeroAtendimento": "id", "numeroAutorizacao": "id", "numeroDRG": "id",
+    "cidPrincipal": "id",
+    "nomePaciente": "texto", "examePS": "texto", "acomodacao": "texto",
+    "exameSolicitadoInternacao": "texto", "procedimentoCirurgico": "texto",
+    "tipoProcedimentoCirurgico": "texto", "estratificacaoRisco": "texto",
+    "observacao": "texto",
+    "dataHoraInternacaoPS": "datahora", "dataHoraSolicitacao": "datahora",
+    "dataHoraExecucao": "datahora", "dataHoraLaudo": "datahora",
+    "dataHoraInternacao": "datahora", "dataAlta": "data",
+    "idade": "inteiro", "tempoUTI": "inteiro", "quantidade": "inteiro",
+    "tempoExame": "decimal", "permanenciaPrevistaDRG": "decimal",
+    "permanenciaReal": "decimal",
+    "altaUTIParaEnfermaria": "logico",
+}
+for _dia in (7, 30, 60, 90):
+    ESQUEMA[f"dataQuestionarioPaciente{_dia}"] = "data"
+    ESQUEMA[f"observacaoQuestionarioPaciente{_dia}"] = "texto"
+
+DTYPES = {
+    "id": "string[pyarrow]", "texto": "string[pyarrow]", "categoria": "category",
+    "datahora": "datetime64[ns]", "data": "datetime64[ns]",
+    "inteiro": "Int32", "decimal": "float64", "logico": "boolean",
+}
+# formato gravado nos arquivos (o mesmo que os formulários produzem)
+FORMATOS_DATA = {"datahora": "%Y-%m-%dT%H:%M:%S", "data": "%Y-%m-%d"}
+
+# colunas que são chave do índice de facetas (ver Facetas)
+FACETAS = ["hospital", "linhaCuidado"]
+# data que define o mês de cada etapa: filtro {"mes": "AAAA-MM"} e, no
+# Parquet, a partição hospital=.../mes=... (as outras só por hospital)
+COLUNA_MES = {"Pronto Atendimento": "dataHoraInternacaoPS",
+              "Internação": "dataHoraInternacao"}
+
+# "csv" (padrão), "sqlite" ou "parquet"
+BACKEND = os.environ.get("LINHAS_BACKEND", "csv").lower()
+
+
+def _externo():
+    """Módulo do backend ativo, quando não é o CSV."""
+    # import tardio: só quem usa o backend paga
+    if BACKEND == "sqlite":
+        import dados_sqlite
+        return dados_sqlite
+    if BACKEND == "parquet":
+        import dados_parquet
+        return dados_parquet
+    return None
+
+
+def destino(path: str) -> str:
+    """Onde a etapa é gravada: o próprio arquivo, ou o banco inteiro no
+    SQLite. Etapas com o mesmo destino gravam uma de cada vez e mudam de
+    assinatura juntas."""
+    if BACKEND == "sqlite":
+        return _externo().DB_PATH
+    return path
+
+
+# --------------------------- Cache ---------------------------------
+@dataclass
+class _Marca:
+    """Até onde um arquivo append-only (CSV base ou log) já foi lido."""
+    inode: int
+    offset: int             # bytes já incorporados à tabela
+    fim: bytes              # os últimos bytes antes do offset: se mudarem,
+                            # o arquivo foi reescrito no lugar
+    cabecalho: tuple = ()   # colunas do CSV (o final novo vem sem cabeçalho)
+    comeco: bytes = b""     # os primeiros bytes (cabeçalho + 1º bloco)
+    mtime: int = 0          # st_mtime_ns quando a marca foi tirada
+
+
+@dataclass
+class _Tabela:
+    """Tabela de uma etapa já carregada em memória (base + log aplicado)."""
+    assinatura: tuple
+    df: pd.DataFrame
+    indice: dict            # numeroAtendimento (normalizado) -> posição
+    versao: int = 0         # última versão do log já aplicada
+    facetas: "Facetas" = None   # montado na 1ª consulta (ver facetas())
+    base: _Marca = None     # leitura do CSV base
+    log: _Marca = None      # leitura do log de edições
+
+
+# path -> _Tabela
+_cache: dict = {}
+_lock = threading.RLock()
+
+# a partir de quantas edições no log a compactação dispara sozinha
+LIMITE_LOG = 500
+
+
+def _stat(path: str):
+    """(mtime_ns, tamanho) do arquivo, ou None se ele não existe."""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _arquivo_log(path: str) -> str:
+    """dados_internacao.csv -> dados_internacao.log.jsonl"""
+    return os.path.splitext(path)[0] + ".log.jsonl"
+
+
+def _assinatura(path: str):
+    """Assinatura do CSV base + log de edições, ou None se nenhum existe."""
+    base, log = _stat(path), _stat(_arquivo_log(path))
+    if base is None and log is None:
+        return None
+    return (base, log)
+
+
+def _chave(valor) -> str:
+    """Normaliza numeroAtendimento: 101010, 101010.0 e "101010" viram "101010"."""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def normalizar_chaves(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de _chave para uma coluna inteira."""
+    if pd.api.types.is_string_dtype(serie.dtype) and serie.dtype != object:
+        return serie.str.strip()
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype(str)
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        return serie.astype("Int64").astype(str)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.map(_chave)
+    return serie.astype(str).str.strip()
+
+
+_VERDADEIRO = {"true", "1", "sim", "s", "yes"}
+
+
+def _logico(valor):
+    if valor is None or valor is pd.NA or (isinstance(valor, float) and valor != valor):
+        return pd.NA
+    if isinstance(valor, str):
+        return valor.strip().lower() in _VERDADEIRO
+    return bool(valor)
+
+
+def _tipar_coluna(serie: pd.Series, tipo: str) -> pd.Series:
+    if serie.dtype == DTYPES[tipo]:
+        return serie
+    if tipo in FORMATOS_DATA:
+        return pd.to_datetime(serie, errors="coerce", format="ISO8601")
+    if tipo == "inteiro":
+        return pd.to_numeric(serie, errors="coerce").round().astype("Int32")
+    if tipo == "decimal":
+        return pd.to_numeric(serie, errors="coerce").astype("float64")
+    if tipo == "logico":
+        return serie.map(_logico).astype("boolean")
+    if tipo == "id":
+        # 101010.0 (coluna lida como número) vira "101010"; vazio continua vazio
+        ok = serie.notna()
+        saida = pd.Series(pd.NA, index=serie.index, dtype=DTYPES["id"])
+        if ok.any():
+            saida[ok] = normalizar_chaves(serie[ok]).astype(DTYPES["id"])
+        return saida
+    return serie.astype(DTYPES[tipo])
+
+
+def tipar(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte (in-place) as colunas conhecidas para os tipos do ESQUEMA."""
+    for col in df.columns:
+        tipo = ESQUEMA.get(col)
+        if tipo is not None:
+            df[col] = _tipar_coluna(df[col], tipo)
+    return df
+
+
+# quantos bytes antes do offset / do início do arquivo a _Marca guarda
+_TAM_FIM = 64
+_TAM_COMECO = 4096
+
+
+class _Trecho(io.RawIOBase):
+    """Arquivo visto só até o byte `fim` (o que outro processo acrescentar
+    durante a leitura fica para a próxima)."""
+
+    def __init__(self, f, fim: int):
+        self._f, self._fim = f, fim
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._fim - self._f.tell())
+        if n <= 0:
+            return 0
+        dados = self._f.read(n)
+        buffer[:len(dados)] = dados
+        return len(dados)
+
+
+def _ultimo_registro(bloco: bytes) -> int:
+    """Tamanho do prefixo de `bloco` formado só por registros CSV
+    completos: termina num \n fora de aspas (texto livre pode ter
+    quebra de linha dentro de aspas)."""
+    fim = len(bloco)
+    while True:
+        i = bloco.rfind(b"\n", 0, fim)
+        if i < 0:
+            return 0
+        if bloco.count(b'"', 0, i) % 2 == 0:
+            return i + 1
+        fim = i
+
+
+def _marcar(path: str, offset: int, cabecalho: tuple = ()):
+    """_Marca do arquivo lido até `offset`, ou None se ele não existe."""
+    try:
+        with open(path, "rb") as f:
+            estado = os.fstat(f.fileno())
+            comeco = f.read(min(offset, _TAM_COMECO))
+            inicio = max(offset - _TAM_FIM, 0)
+            f.seek(inicio)
+            return _Marca(estado.st_ino, offset, f.read(offset - inicio), tuple(cabecalho),
+                          comeco, estado.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def _intacto(path: str, marca: _Marca) -> bool:
+    """O arquivo ainda é o mesmo da marca, só (talvez) com mais bytes.
+
+    Mudou a data mas não o tamanho: nada foi acrescentado, então foi
+    reescrito no lugar (editor, to_csv por cima) e precisa de recarga."""
+    atual = _marcar(path, marca.offset)
+    if atual is None or atual.inode != marca.inode:
+        return False
+    tamanho = os.path.getsize(path)
+    if tamanho < marca.offset or (tamanho == marca.offset and atual.mtime != marca.mtime):
+        return False
+    return atual.fim == marca.fim and atual.comeco == marca.comeco
+
+
+def _dtype_leitura(cabecalho) -> dict:
+    """dtype do read_csv: ids/textos/categorias direto, datas como texto
+    (parseadas em tipar)."""
+    dtype = {c: DTYPES[ESQUEMA[c]] for c in cabecalho
+             if ESQUEMA.get(c) in ("id", "texto", "categoria")}
+    dtype.update({c: str for c in cabecalho if ESQUEMA.get(c) in FORMATOS_DATA})
+    return dtype
+
+
+def _fim_completo(f, tamanho: int) -> int:
+    """Byte logo após o último registro completo (ignora linha pela metade
+    de uma gravação em curso)."""
+    f.seek(max(tamanho - 1, 0))
+    if f.read(1) in (b"\n", b""):
+        return tamanho
+    f.seek(max(tamanho - 65536, 0))
+    cauda = f.read()
+    return tamanho - len(cauda) + cauda.rfind(b"\n") + 1
+
+
+@medido(linhas=lambda r, *a, **k: len(r[0]))
+def _ler_csv(path: str, inicio: int = 0, cabecalho: tuple = ()) -> tuple:
+    """read_csv já com os tipos do ESQUEMA: ids e textos nunca passam por
+    número e as datas são parseadas aqui, uma vez só.
+
+    Com `inicio` lê só os registros acrescentados a partir desse byte
+    (sem cabeçalho: usa `cabecalho`). Devolve (df, _Marca do que foi lido)."""
+    if not inicio:
+        cabecalho = tuple(pd.read_csv(path, nrows=0).columns)
+    dtype = _dtype_leitura(cabecalho)
+
+    with open(path, "rb") as f:
+        tamanho = os.fstat(f.fileno()).st_size
+        if inicio:
+            # o final novo é proporcional às linhas novas: cabe em memória
+            f.seek(inicio)
+            bloco = f.read(tamanho - inicio)
+            fim = inicio + _ultimo_registro(bloco)
+            df = pd.read_csv(io.BytesIO(bloco[:fim - inicio]), header=None,
+                             names=list(cabecalho), dtype=dtype) \
+                if fim > inicio else pd.DataFrame(columns=list(cabecalho))
+        else:
+            fim = _fim_completo(f, tamanho)
+            f.seek(0)
+            df = pd.read_csv(io.BufferedReader(_Trecho(f, fim)), dtype=dtype)
+    return tipar(df), _marcar(path, fim, cabecalho)
+
+
+def para_texto(df: pd.DataFrame) -> pd.DataFrame:
+    """Cópia com as colunas tipadas de volta a valores simples (datas em
+    texto ISO, strings/categorias como object), para gravar em arquivo
+    ou banco no mesmo formato dos formulários."""
+    df = df.copy()
+    for col in df.columns:
+        tipo = ESQUEMA.get(col)
+        if tipo in FORMATOS_DATA and pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime(FORMATOS_DATA[tipo]).astype(object)
+        elif tipo is not None:
+            df[col] = df[col].astype(object)
+    return df
+
+
+def _juntar(df: pd.DataFrame, novos: pd.DataFrame) -> pd.DataFrame:
+    """concat que mantém os tipos do esquema (categorias novas incluídas)."""
+    novos = tipar(pd.DataFrame(novos).copy())
+    ajustes = {}
+    for c in df.columns:
+        if not isinstance(df[c].dtype, pd.CategoricalDtype):
+            continue
+        cats = df[c].cat.categories
+        if c in novos.columns:
+            faltam = pd.Index(novos[c].dropna().unique()).difference(cats)
+            if len(faltam):
+                cats = cats.append(faltam).sort_values()
+                ajustes[c] = df[c].cat.set_categories(cats)
+        novos[c] = pd.Categorical(novos[c] if c in novos.columns else [None] * len(novos),
+                                  categories=cats)
+    for c in df.columns:
+        if c not in novos.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            novos[c] = pd.Series(index=novos.index, dtype=df[c].dtype)     # vazio do tipo certo
+    if ajustes:
+        df = df.assign(**ajustes)
+    return tipar(pd.concat([df, novos], ignore_index=True))
+
+
+def _indexar(df: pd.DataFrame) -> dict:
+    """Índice numeroAtendimento -> posição da primeira linha com a chave."""
+    if "numeroAtendimento" not in df.columns:
+        return {}
+    chaves = normalizar_chaves(df["numeroAtendimento"]).tolist()
+    # percorre de trás pra frente para a 1ª ocorrência prevalecer
+    return dict(zip(reversed(chaves), range(len(chaves) - 1, -1, -1)))
+
+
+def _editavel(df: pd.DataFrame, colunas) -> pd.DataFrame:
+    """Cópia rasa de `df` com cópia própria só das `colunas`: dá para
+    alterar essas colunas sem mexer no DataFrame original (o do cache,
+    que outras sessões podem estar lendo)."""
+    novo = df.copy(deep=False)
+    for col in set(colunas) & set(df.columns):
+        novo[col] = df[col].copy()
+    return novo
+
+
+def _aplicar(df: pd.DataFrame, indice: dict, registro: dict) -> pd.DataFrame:
+    """Upsert de um registro no DataFrame em memória (O(1) se já existe).
+
+    Altera `df` no lugar: quem chama passa uma cópia (_editavel)."""
+    chave = _chave(registro["numeroAtendimento"])
+    pos = indice.get(chave)
+    if pos is None:
+        df = _juntar(df, pd.DataFrame([registro]))
+        indice[chave] = len(df) - 1
+        return df
+
+    # valores no tipo do esquema; coluna a coluna (iloc com várias colunas
+    # de tipos diferentes copia a tabela inteira)
+    linha = tipar(pd.DataFrame([registro]))
+    for col in linha.columns:
+        valor = linha[col].iloc[0]
+        if col not in df.columns:
+            df[col] = pd.Series(index=df.index, dtype=linha[col].dtype)
+        elif isinstance(df[col].dtype, pd.CategoricalDtype) and not pd.isna(valor) \
+                and valor not in df[col].cat.categories:
+            # categorias sempre ordenadas, como em _juntar
+            df[col] = df[col].cat.set_categories(
+                df[col].cat.categories.append(pd.Index([valor])).sort_values())
+        df.iat[pos, df.columns.get_loc(col)] = valor
+    return df
+
+
+# a partir de quantos registros o upsert em memória vai coluna a coluna
+# (uma atribuição vetorizada por coluna em vez de uma por célula)
+LIMITE_VETORIZADO = 50
+
+
+def _aplicar_varios(df: pd.DataFrame, indice: dict, registros: list) -> pd.DataFrame:
+    """_aplicar para uma lista de registros (o último de cada chave vale).
+
+    Devolve um DataFrame novo; `df` fica como estava."""
+    ultimos = {_chave(r["numeroAtendimento"]): r for r in registros}
+    registros = list(ultimos.values())
+    campos = set(registros[0]) if registros else set()
+    if len(registros) < LIMITE_VETORIZADO or any(set(r) != campos for r in registros):
+        # poucos, ou com colunas diferentes (um DataFrame só apagaria as ausentes)
+        df = _editavel(df, set().union(*registros))
+        for registro in registros:
+            df = _aplicar(df, indice, registro)
+        return df
+
+    novos = tipar(pd.DataFrame(registros))
+    pos = np.array([indice.get(c, -1) for c in ultimos], dtype=np.intp)
+    existe = pos >= 0
+    df = df.copy(deep=False)            # cada coluna alterada abaixo é uma série nova
+    if existe.any():
+        alvo, valores = pos[existe], novos[existe]
+        for col in valores.columns:
+            v = valores[col]
+            if col not in df.columns:
+                df[col] = pd.Series(index=df.index, dtype=v.dtype)
+            serie = df[col]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                faltam = pd.Index(v.dropna().unique()).difference(serie.cat.categories)
+                if len(faltam):
+                    serie = serie.cat.set_categories(
+                        serie.cat.categories.append(faltam).sort_values())
+            serie = serie.copy()
+            serie.iloc[alvo] = v.to_numpy()
+            df[col] = serie
+    if not existe.all():
+        n = len(df)
+        df = _juntar(df, novos[~existe])
+        for i, chave in enumerate(np.array(list(ultimos))[~existe]):
+            indice[chave] = n + i
+    return df
+
+
+@medido(linhas=lambda r, *a, **k: len(r[0]))
+def _ler_log(path: str, inicio: int = 0) -> tuple:
+    """Entradas {"versao", "em", "registro"} do log a partir do byte
+    `inicio`, na ordem gravada. Devolve (entradas, _Marca do que foi lido)."""
+    log = _arquivo_log(path)
+    entradas, fim = [], inicio
+    try:
+        with open(log, "rb") as f:
+            f.seek(inicio)
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break               # linha ainda sendo gravada (ou que caiu no meio)
+                if linha.strip():
+                    try:
+                        entradas.append(json.loads(linha))
+                    except json.JSONDecodeError:
+                        break
+                fim += len(linha)
+    except FileNotFoundError:
+        return entradas, None
+    return entradas, _marcar(log, fim)
+
+
+def invalidar(path: str = None):
+    """Descarta o cache de um arquivo (ou de todos, se path=None)."""
+    with _lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+
+def assinatura(path: str):
+    """Token que muda sempre que os dados da etapa mudam, em qualquer
+    backend; serve de chave para caches de dados derivados."""
+    if _externo():
+        return _externo().assinatura(path)
+    return _assinatura(path)
+
+
+def _aplicar_log(df: pd.DataFrame, indice: dict, entradas: list) -> pd.DataFrame:
+    # last-write-wins: só a última versão de cada chave importa
+    return _aplicar_varios(df, indice, [e["registro"] for e in entradas])
+
+
+def _continuar(path: str, tab: _Tabela, assinatura: tuple):
+    """Atualiza a tabela lendo só o que foi acrescentado ao CSV base e ao
+    log desde a última leitura; None se algum deles foi truncado ou
+    reescrito (aí só a recarga completa serve)."""
+    if tab.base is None or not _intacto(path, tab.base):
+        return None
+    log = _arquivo_log(path)
+    if tab.log is not None and not _intacto(log, tab.log):
+        return None
+    if tab.log is None and tab.versao:
+        return None
+
+    df, indice, facetas = tab.df, tab.indice, tab.facetas
+    novos, base = tab.df.iloc[:0], tab.base
+    if os.path.getsize(path) > tab.base.offset:
+        if tuple(pd.read_csv(path, nrows=0).columns) != tab.base.cabecalho:
+            return None
+        novos, base = _ler_csv(path, tab.base.offset, tab.base.cabecalho)
+    if len(novos):
+        n = len(df)
+        df = _juntar(df, novos)
+        if "numeroAtendimento" in novos.columns:
+            for i, chave in enumerate(normalizar_chaves(novos["numeroAtendimento"])):
+                indice.setdefault(chave, n + i)
+        facetas = facetas.estender(novos, n) if facetas is not None else None
+
+    entradas, marca_log = _ler_log(path, tab.log.offset if tab.log else 0)
+    entradas = [e for e in entradas if e["versao"] > tab.versao]
+    if entradas:
+        df = _aplicar_log(df, indice, entradas)
+        facetas = None                  # edições podem mudar hospital/linha
+    versao = entradas[-1]["versao"] if entradas else tab.versao
+    return _Tabela(assinatura, df, indice, versao, facetas, base, marca_log)
+
+
+def _tabela(path: str) -> _Tabela:
+    assinatura = _assinatura(path)
+    if assinatura is None:
+        return _Tabela(None, pd.DataFrame(), {})
+
+    with _lock:
+        tab = _cache.get(path)
+        if tab is not None and tab.assinatura == assinatura:
+            return tab
+        if tab is not None:
+            # custo proporcional ao que foi acrescentado (sob o lock, para
+            # duas sessões não anexarem o mesmo final duas vezes)
+            tab = _continuar(path, tab, assinatura)
+            if tab is not None:
+                _cache[path] = tab
+                return tab
+
+    df, base = _ler_csv(path) if assinatura[0] is not None else (pd.DataFrame(), None)
+    indice = _indexar(df)
+    entradas, log = _ler_log(path)
+    df = _aplicar_log(df, indice, entradas)
+
+    versao = entradas[-1]["versao"] if entradas else 0
+    tab = _Tabela(assinatura, df, indice, versao, base=base, log=log)
+    with _lock:
+        _cache[path] = tab
+    return tab
+
+
+def coluna_mes(path: str):
+    """Coluna de data que define o mês da etapa (COLUNA_MES), ou None."""
+    for etapa, coluna in COLUNA_MES.items():
+        if os.path.basename(ETAPAS[etapa]) == os.path.basename(path):
+            return coluna
+    return None
+
+
+@medido
+def carregar_csv(path: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
+    """Devolve a etapa (CSV base + edições do log), só re-parseando
+    quando algum dos arquivos mudou.
+
+    `colunas` limita as colunas devolvidas e `filtros` ({coluna: valor},
+    valores vazios são ignorados) as linhas; nos backends externos isso
+    vai direto para a consulta/scan. {"mes": "AAAA-MM"} filtra pelo mês
+    da data da etapa (COLUNA_MES).
+
+    O DataFrame é o do cache (ou um recorte dele), compartilhado entre
+    sessões; as gravações nunca o alteram, trocam por outro. Trate-o
+    como somente leitura e grave alterações por save_csv /
+    atualizar_registro (no app, com Copy-on-Write ligado, alterar o
+    recorte recebido não chega ao cache).
+    """
+    _aguardar(path)
+    if _externo():
+        return tipar(_externo().carregar(path, colunas, filtros))
+
+    tab = _tabela(path)
+    df = tab.df
+    filtros = {c: v for c, v in (filtros or {}).items() if v not in ("", None)}
+    mes = filtros.pop("mes", None)
+    filtros = {c: v for c, v in filtros.items() if c in df.columns}
+    # hospital / linhaCuidado: posições prontas no índice de facetas
+    por_faceta = {c: v for c, v in filtros.items() if c in FACETAS}
+    if por_faceta:
+        df = df.take(_facetas_da_tabela(tab).posicoes(por_faceta))
+    df = _filtrar(df, path, {c: v for c, v in filtros.items() if c not in FACETAS}, mes)
+    if colunas:
+        df = df[[c for c in colunas if c in df.columns]]
+    return df
+
+
+def _filtrar(df: pd.DataFrame, path: str, filtros: dict, mes: str = None) -> pd.DataFrame:
+    """Linhas com coluna == valor para cada filtro e, com `mes`, da data
+    da etapa (COLUNA_MES) dentro do mês."""
+    for col, valor in filtros.items():
+        df = df[df[col] == valor]
+    col_mes = coluna_mes(path)
+    if mes and col_mes in df.columns:
+        inicio = pd.Timestamp(f"{mes}-01")
+        datas = df[col_mes]
+        df = df[(datas >= inicio) & (datas < inicio + pd.offsets.MonthBegin())]
+    return df
+
+
+# --------------------------- Leitura em blocos ---------------------
+# para o que não cabe em memória: a etapa passa em blocos de até
+# TAMANHO_LOTE linhas, sem cache e sem carregar o arquivo inteiro
+TAMANHO_LOTE = int(os.environ.get("LINHAS_LOTE", "50000"))
+
+
+def lotes(path: str, colunas: list = None, filtros: dict = None, tamanho: int = None):
+    """Gera a etapa em DataFrames de até `tamanho` linhas (padrão
+    TAMANHO_LOTE), com as edições do log já aplicadas e os mesmos
+    `colunas` / `filtros` de carregar_csv. Memória O(tamanho).
+
+    Um atendimento repetido no CSV base sai repetido (carregar_csv também
+    devolve as duas linhas); quem agrega fica com a 1ª, como fetch_row."""
+    tamanho = tamanho or TAMANHO_LOTE
+    _aguardar(path)
+    filtros = {c: v for c, v in (filtros or {}).items() if v not in ("", None)}
+    if _externo():
+        for lote in _externo().lotes(path, colunas, filtros, tamanho):
+            yield tipar(lote)
+        return
+    if _stat(path) is None:
+        return
+
+    mes = filtros.pop("mes", None)
+    cabecalho = tuple(pd.read_csv(path, nrows=0).columns)
+    filtros = {c: v for c, v in filtros.items() if c in cabecalho}
+    lidas = [c for c in cabecalho
+             if not colunas or c in colunas or c in filtros or c == "numeroAtendimento"
+             or (mes and c == coluna_mes(path))]
+    # o log (no máximo LIMITE_LOG edições até a compactação) cabe em memória
+    edicoes = {_chave(e["registro"]["numeroAtendimento"]): e["registro"]
+               for e in _ler_log(path)[0]}
+
+    with open(path, "rb") as f:
+        fim = _fim_completo(f, os.fstat(f.fileno()).st_size)
+        f.seek(0)
+        leitor = pd.read_csv(io.BufferedReader(_Trecho(f, fim)), usecols=lidas,
+                             dtype=_dtype_leitura(lidas), chunksize=tamanho)
+        for lote in leitor:
+            lote = tipar(lote)
+            if edicoes:
+                # a edição vale para a 1ª linha da chave (como no _indexar)
+                indice = _indexar(lote)
+                aqui = [edicoes.pop(c) for c in list(edicoes) if c in indice]
+                if aqui:
+                    lote = _aplicar_varios(lote, indice, aqui)[lidas]
+            lote = _filtrar(lote, path, filtros, mes)
+            if len(lote):
+                yield lote[[c for c in (colunas or lidas) if c in lote.columns]]
+    if edicoes:
+        # edições de atendimentos que não estão no CSV base viram linhas
+        resto = tipar(pd.DataFrame(list(edicoes.values()))).reindex(columns=lidas)
+        resto = _filtrar(resto, path, filtros, mes)
+        if len(resto):
+            yield resto[[c for c in (colunas or lidas) if c in resto.columns]]
+
+
+# --------------------------- Facetas -------------------------------
+class Facetas:
+    """Índice (hospital, linhaCuidado) -> posições das linhas, com as
+    listas de valores distintos para os filtros.
+
+    As posições são das linhas do DataFrame usado para montá-lo (0..n-1),
+    em ordem crescente."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.colunas = [c for c in FACETAS if c in df.columns]
+        self.total = len(df)
+        self.grupos: dict = {}
+        if self.colunas and len(df):
+            g = df.reset_index(drop=True).groupby(self.colunas, observed=True, sort=True)
+            self.grupos = {(k if isinstance(k, tuple) else (k,)): v
+                           for k, v in g.indices.items()}
+        self._memo: dict = {}
+
+    def _casa(self, chave: tuple, filtros: dict) -> bool:
+        return all(chave[self.colunas.index(c)] == v for c, v in filtros.items())
+
+    def _ativos(self, filtros: dict) -> dict:
+        return {c: v for c, v in (filtros or {}).items()
+                if v not in ("", None) and c in self.colunas}
+
+    def posicoes(self, filtros: dict = None) -> np.ndarray:
+        """Posições das linhas que passam nos filtros de faceta."""
+        ativos = self._ativos(filtros)
+        memo = tuple(sorted(ativos.items()))
+        if not ativos:
+            return np.arange(self.total)
+        if memo not in self._memo:
+            partes = [p for k, p in self.grupos.items() if self._casa(k, ativos)]
+            if len(partes) == 1:
+                res = partes[0]
+            elif partes:
+                res = np.sort(np.concatenate(partes))
+            else:
+                res = np.empty(0, dtype=np.intp)
+            self._memo[memo] = res
+        return self._memo[memo]
+
+    def estender(self, novos: pd.DataFrame, inicio: int):
+        """Índice com as linhas `novos` acrescentadas a partir da posição
+        `inicio`, sem reagrupar as antigas; None se elas não têm as
+        mesmas colunas de faceta (aí é remontar)."""
+        if [c for c in FACETAS if c in novos.columns] != self.colunas or inicio != self.total:
+            return None
+        ext = Facetas(novos)
+        grupos = dict(self.grupos)
+        for chave, pos in ext.grupos.items():
+            pos = pos + inicio
+            grupos[chave] = np.concatenate([grupos[chave], pos]) if chave in grupos else pos
+        ext.grupos, ext.total = grupos, inicio + len(novos)
+        return ext
+
+    def valores(self, coluna: str, filtros: dict = None) -> list:
+        """Valores distintos de `coluna` entre as linhas que passam nos
+        outros filtros (ex.: linhas de cuidado de um hospital)."""
+        if coluna not in self.colunas:
+            return []
+        i = self.colunas.index(coluna)
+        ativos = {c: v for c, v in self._ativos(filtros).items() if c != coluna}
+        return sorted({k[i] for k in self.grupos if self._casa(k, ativos)})
+
+
+_facetas_ext: dict = {}     # backends externos: path -> (assinatura, Facetas)
+
+
+def _facetas_da_tabela(tab: _Tabela) -> Facetas:
+    # _Tabela é trocada a cada gravação, então o índice nunca fica velho
+    if tab.facetas is None:
+        tab.facetas = Facetas(tab.df)
+    return tab.facetas
+
+
+@medido(linhas=lambda r, *a, **k: r.total)
+def facetas(path: str) -> Facetas:
+    """Índice de facetas da etapa, refeito só quando ela muda."""
+    _aguardar(path)
+    if not _externo():
+        return _facetas_da_tabela(_tabela(path))
+    sig = assinatura(path)
+    with _lock:
+        if _facetas_ext.get(path, (None,))[0] == sig:
+            return _facetas_ext[path][1]
+    fac = Facetas(carregar_csv(path, colunas=FACETAS))
+    with _lock:
+        _facetas_ext[path] = (sig, fac)
+    return fac
+
+
+# --------------------------- Ganchos -------------------------------
+# estruturas derivadas (cubo, índices ...) acompanham as gravações daqui
+_ganchos: list = []
+
+
+def registrar_gancho(gancho):
+    """gancho(path, lote) roda antes de cada gravação e pode devolver uma
+    função sem argumentos, chamada depois que a gravação terminou.
+
+    `lote` é um DataFrame com as linhas que vão ser gravadas. Erro num
+    gancho vai para o log e não desfaz nem repete a gravação."""
+    if gancho not in _ganchos:
+        _ganchos.append(gancho)
+
+
+@contextmanager
+def _notificando(path: str, lote: pd.DataFrame):
+    # roda sob a trava da etapa (_trava_etapa): ninguém grava nela entre o
+    # antes e o depois; outras etapas podem mudar no meio, e o gancho
+    # confere isso antes de aplicar o depois
+    depois = []
+    for g in list(_ganchos):
+        try:
+            f = g(path, lote)
+        except Exception:
+            _log.exception("gancho %r falhou antes de gravar %s", g, path)
+            continue
+        if f:
+            depois.append(f)
+    yield
+    for f in depois:
+        try:
+            f()
+        except Exception:
+            _log.exception("gancho %r falhou depois de gravar %s", f, path)
+
+
+# --------------------------- Trava entre processos -----------------
+@contextmanager
+def _trava_arquivo(path: str):
+    """Lock consultivo (flock) em <path>.lock: serializa quem grava a
+    etapa, mesmo em outros processos. Sem fcntl (Windows) vale só o
+    lock do processo."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# destino -> lock de gravação no processo: etapas diferentes gravam em
+# paralelo e _lock (cache) só é tomado na troca da tabela
+_travas: dict = {}
+_travas_lock = threading.Lock()
+
+
+@contextmanager
+def _trava_etapa(path: str):
+    """Quem grava a etapa: lock do processo para ela + flock entre processos."""
+    with _travas_lock:
+        trava = _travas.setdefault(destino(path), threading.RLock())
+    with trava, _trava_arquivo(path):
+        yield
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class GravacaoIncerta(OSError):
+    """O append falhou e não deu para desfazê-lo: as linhas podem ou não
+    estar no arquivo, então a gravação não é repetida."""
+
+
+@contextmanager
+def _desfazendo(path: str):
+    """Append que falha no meio (disco cheio, fsync) é cortado de volta ao
+    tamanho de antes: nada fica gravado e repetir não duplica linhas."""
+    existia = os.path.exists(path)
+    tamanho = os.path.getsize(path) if existia else 0
+    try:
+        yield
+    except BaseException as e:
+        try:
+            if existia:
+                os.truncate(path, tamanho)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            raise GravacaoIncerta(f"{path}: gravação pela metade ({e})") from e
+        raise
+
+
+def _cortar_linha_parcial(path: str):
+    """Descarta uma última linha sem \\n (gravação que caiu no meio e
+    nunca foi confirmada), para o próximo append não colar nela."""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        tamanho = f.tell()
+        if tamanho == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        bloco = min(tamanho, 1 << 16)
+        f.seek(-bloco, os.SEEK_END)
+        fim = f.read(bloco).rfind(b"\n")
+        f.truncate(tamanho - bloco + fim + 1 if fim >= 0 else 0)
+
+
+# --------------------------- Group commit --------------------------
+# quanto o 1º escritor espera por outros antes de gravar o lote (s)
+JANELA_GRUPO = float(os.environ.get("LINHAS_JANELA_GRUPO", "0.005"))
+
+
+class _Pedido:
+    def __init__(self, tipo: str, registros):
+        self.tipo = tipo                # "novo" (append) | "edicao" (upsert)
+        self.registros = registros      # lista de dicts ou DataFrame
+        self.feito = threading.Event()
+        self.erro = None
+
+
+class _Fila:
+    """Gravações pendentes de uma etapa; quem chega primeiro vira líder,
+    espera a janela e grava o lote de todos de uma vez."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pendentes: list = []
+        self.lider = False
+
+
+_filas: dict = {}
+_filas_lock = threading.Lock()
+# por thread: está dentro de _commit (ganchos lendo etapas não esperam a gravadora)
+_local = threading.local()
+
+
+def _enfileirar(path: str, tipo: str, registros):
+    with _filas_lock:
+        fila = _filas.setdefault(path, _Fila())
+    pedido = _Pedido(tipo, registros)
+    with fila.lock:
+        fila.pendentes.append(pedido)
+        lider = not fila.lider
+        fila.lider = True
+
+    if lider:
+        lote, terminou, erro = [], False, None
+        try:
+            time.sleep(JANELA_GRUPO)
+            while True:
+                with fila.lock:
+                    lote, fila.pendentes = fila.pendentes, []
+                    if not lote:
+                        fila.lider = False
+                        terminou = True
+                        break
+                _commit(path, lote)
+        except Exception as e:
+            erro = e                # flock/open do lock falhou: vale para o lote todo
+        finally:
+            if not terminou:
+                # nenhum pedido fica esperando para sempre e a próxima
+                # gravação da etapa vira líder de novo
+                with fila.lock:
+                    resto, fila.pendentes = fila.pendentes, []
+                    fila.lider = False
+                for p in lote + resto:
+                    if not p.feito.is_set():
+                        p.erro = p.erro or erro or RuntimeError("gravação interrompida")
+                        p.feito.set()
+
+    pedido.feito.wait()
+    if pedido.erro is not None:
+        raise pedido.erro
+
+
+@medido(linhas=lambda r, path, pedidos: sum(len(p.registros) for p in pedidos))
+def _commit(path: str, pedidos: list):
+    """Grava os pedidos sob a trava da etapa, em blocos do mesmo tipo."""
+    blocos = []
+    for p in pedidos:
+        if blocos and blocos[-1][0] == p.tipo:
+            blocos[-1][1].append(p)
+        else:
+            blocos.append((p.tipo, [p]))
+
+    _local.gravando = True
+    try:
+        with _trava_etapa(path):
+            for tipo, bloco in blocos:
+                try:
+                    lote = pd.concat([pd.DataFrame(p.registros) for p in bloco],
+                                     ignore_index=True)
+                    with _notificando(path, lote):
+                        _gravar_lote(path, tipo, lote)
+                except Exception as e:
+                    for p in bloco:
+                        p.erro = e
+                for p in bloco:
+                    p.feito.set()
+    finally:
+        _local.gravando = False
+
+
+def _gravar_lote(path: str, tipo: str, lote: pd.DataFrame):
+    if tipo == "novo" and not _externo():
+        _anexar_csv(path, lote)             # direto do DataFrame, sem passar por dicts
+        return
+    if _externo():
+        # o banco recebe o texto dos formulários (como na migração), mesmo
+        # que o registro venha tipado de fetch_row (Timestamp, Int32...)
+        lote = para_texto(tipar(lote.copy()))
+    registros = lote.astype(object).where(lote.notna(), None).to_dict("records")
+    if _externo() and tipo == "novo":
+        _externo().save(path, registros)
+    elif _externo():
+        _externo().upsert(path, registros)
+    else:
+        _registrar_edicoes(path, registros)
+
+
+# --------------------------- Gravação em segundo plano -------------
+# os formulários não precisam esperar o disco: o registro entra numa fila
+# limitada, compartilhada por todas as sessões, e uma thread só grava o
+# que tiver acumulado em lotes (mesmo _commit do group commit)
+FILA_MAX = int(os.environ.get("LINHAS_FILA_MAX", "1000"))
+TENTATIVAS = 3
+
+_fila_bg: queue.Queue = queue.Queue(maxsize=FILA_MAX)
+_bg_cond = threading.Condition()
+_bg = {"thread": None, "pendentes": {}}    # path -> pedidos ainda não gravados
+_falhas: list = []                          # (path, registros, erro) que não entraram
+
+
+def _gravar_depois(path: str, tipo: str, registros):
+    with _bg_cond:
+        _bg["pendentes"][path] = _bg["pendentes"].get(path, 0) + 1
+        if _bg["thread"] is None or not _bg["thread"].is_alive():
+            _bg["thread"] = threading.Thread(target=_gravadora, name="gravadora",
+                                             daemon=True)
+            _bg["thread"].start()
+    # fila cheia: quem envia espera (o disco não acompanha)
+    _fila_bg.put((path, _Pedido(tipo, registros)))
+
+
+def _gravadora():
+    while True:
+        itens = [_fila_bg.get()]
+        time.sleep(JANELA_GRUPO)            # junta o que chegar junto
+        while True:
+            try:
+                itens.append(_fila_bg.get_nowait())
+            except queue.Empty:
+                break
+
+        por_path: dict = {}
+        for path, pedido in itens:
+            por_path.setdefault(path, []).append(pedido)
+        for path, pedidos in por_path.items():
+            falhos = pedidos
+            for tentativa in range(TENTATIVAS):
+                if tentativa:
+                    time.sleep(0.5 * 2 ** tentativa)
+                    for p in falhos:
+                        p.erro = None
+                        p.feito.clear()
+                try:
+                    _commit(path, falhos)
+                except Exception as e:      # flock/lock: a thread não pode morrer
+                    for p in falhos:
+                        p.erro = e
+                falhos = [p for p in falhos if p.erro is not None]
+                # só repete o que com certeza não foi gravado (erro de
+                # gancho nem chega aqui: não falha o pedido)
+                if not falhos or any(isinstance(p.erro, GravacaoIncerta) for p in falhos):
+                    break
+            with _bg_cond:
+                _falhas.extend((path, p.registros, repr(p.erro)) for p in falhos)
+                _bg["pendentes"][path] -= len(pedidos)
+                if not _bg["pendentes"][path]:
+                    del _bg["pendentes"][path]
+                _bg_cond.notify_all()
+
+
+def _aguardar(path: str):
+    """Leitura vê as próprias gravações: espera as pendentes da etapa.
+
+    Dentro de _commit (ganchos, na gravadora ou num save síncrono) não
+    espera: a gravadora pode estar parada esperando o mesmo lock."""
+    if not _bg["pendentes"].get(path) or getattr(_local, "gravando", False):
+        return
+    with _bg_cond:
+        _bg_cond.wait_for(lambda: not _bg["pendentes"].get(path))
+
+
+def pendentes(path: str = None) -> int:
+    """Gravações em segundo plano ainda não feitas (da etapa ou todas)."""
+    with _bg_cond:
+        if path is not None:
+            return _bg["pendentes"].get(path, 0)
+        return sum(_bg["pendentes"].values())
+
+
+def falhas() -> list:
+    """Gravações em segundo plano que falharam TENTATIVAS vezes (ou uma
+    só, com GravacaoIncerta): [(path, registros, erro)]."""
+    with _bg_cond:
+        return list(_falhas)
+
+
+def descarregar(timeout: float = None) -> bool:
+    """Espera a fila de segundo plano esvaziar; False se o tempo acabou."""
+    with _bg_cond:
+        return _bg_cond.wait_for(lambda: not _bg["pendentes"], timeout)
+
+
+# na saída do processo (Streamlit parado, Ctrl+C) nada fica só na fila
+atexit.register(descarregar)
+
+
+# --------------------------- Escrita -------------------------------
+@medido
+def save_csv(path: str, registro: dict, esperar: bool = True):
+    """Salva linha única no CSV (append ou cria).
+
+    Gravações simultâneas da mesma etapa saem juntas num único append
+    + fsync (group commit); volta só depois de gravado. Com
+    esperar=False volta na hora e a linha é gravada em segundo plano
+    (leituras da etapa esperam por ela)."""
+    if not esperar:
+        _gravar_depois(path, "novo", [registro])
+        return
+    _enfileirar(path, "novo", [registro])
+
+
+@medido(linhas=lambda r, path, registros: len(registros))
+def salvar_lote(path: str, registros):
+    """Como save_csv, para muitas linhas de uma vez (um append só).
+
+    Aceita lista de dicts ou DataFrame com as colunas da etapa."""
+    if len(registros):
+        _enfileirar(path, "novo", registros)
+
+
+@medido
+def atualizar_registro(path: str, registro: dict, esperar: bool = True):
+    """Grava a edição de um registro (upsert por numeroAtendimento).
+
+    No CSV a edição vira uma linha versionada no log da etapa
+    (append-only), então o custo não depende do tamanho da tabela; o
+    CSV base só é reescrito na compactação. esperar=False: como em save_csv."""
+    if not esperar:
+        _gravar_depois(path, "edicao", [registro])
+        return
+    _enfileirar(path, "edicao", [registro])
+
+
+@medido(linhas=lambda r, path, registros: len(registros))
+def atualizar_lote(path: str, registros):
+    """Como atualizar_registro, para muitas linhas de uma vez (um commit só).
+
+    Aceita lista de dicts ou DataFrame com as colunas da etapa."""
+    if len(registros):
+        _enfileirar(path, "edicao", registros)
+
+
+def existentes(path: str, chaves) -> np.ndarray:
+    """Máscara: quais das `chaves` (numeroAtendimento) já estão na etapa."""
+    _aguardar(path)
+    chaves = normalizar_chaves(pd.Series(chaves, dtype=object))
+    if not _externo():
+        indice = _tabela(path).indice           # hash: sem varrer a tabela
+        return np.array([c in indice for c in chaves], dtype=bool)
+    gravadas = carregar_csv(path, colunas=["numeroAtendimento"])
+    if "numeroAtendimento" not in gravadas.columns:
+        return np.zeros(len(chaves), dtype=bool)
+    return chaves.isin(set(normalizar_chaves(gravadas["numeroAtendimento"]))).to_numpy()
+
+
+def _anexar_csv(path: str, df: pd.DataFrame):
+    antes, inicio = _assinatura(path), None
+    if _stat(path) is None:
+        # arquivo novo nasce completo (cabeçalho + linhas) via rename atômico
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            df.to_csv(f, index=False)
+            _fsync(f)
+        os.replace(tmp, path)
+    else:
+        _cortar_linha_parcial(path)
+        inicio = os.path.getsize(path)
+        # linhas na ordem das colunas do arquivo, mesmo se o lote vier incompleto
+        cabecalho = pd.read_csv(path, nrows=0).columns
+        with _desfazendo(path), open(path, "a", encoding="utf-8", newline="") as f:
+            df.reindex(columns=cabecalho).to_csv(f, header=False, index=False)
+            _fsync(f)
+
+    # já está no disco: daqui em diante, erro só descarta o cache
+    try:
+        with _lock:
+            _anexar_no_cache(path, df, antes, inicio)
+    except Exception:
+        _log.exception("cache de %s descartado depois do append", path)
+        invalidar(path)
+
+
+def _anexar_no_cache(path: str, df: pd.DataFrame, antes, inicio):
+    # se o cache estava em dia, só acrescenta as linhas e as chaves no
+    # índice; senão a próxima leitura lê o final do arquivo (_continuar).
+    # Em dia = leu o arquivo até onde o append começou: um leitor que
+    # pegou o final no meio do append já trocou a tabela
+    tab = _cache.get(path)
+    if tab is None or tab.assinatura != antes or tab.base is None or tab.base.offset != inicio:
+        return
+    n = len(tab.df)
+    novo = _juntar(tab.df, df)
+    if "numeroAtendimento" in df.columns:
+        for i, chave in enumerate(normalizar_chaves(df["numeroAtendimento"])):
+            tab.indice.setdefault(chave, n + i)
+    facetas = tab.facetas.estender(df, n) if tab.facetas is not None else None
+    _cache[path] = _Tabela(_assinatura(path), novo, tab.indice, tab.versao, facetas,
+                           _marcar(path, os.path.getsize(path), tab.base.cabecalho), tab.log)
+
+
+def _registrar_edicoes(path: str, registros: list):
+    tab = _tabela(path)            # relê se outro processo mexeu
+    versao, linhas = tab.versao, []
+    agora = datetime.now().isoformat()
+    for registro in registros:
+        versao += 1
+        linhas.append(json.dumps({"versao": versao, "em": agora, "registro": registro},
+                                 ensure_ascii=False, default=str) + "\n")
+
+    log = _arquivo_log(path)
+    if _stat(log) is not None:
+        _cortar_linha_parcial(log)
+    with _desfazendo(log), open(log, "a", encoding="utf-8") as f:
+        f.write("".join(linhas))
+        _fsync(f)
+    try:
+        with _lock:
+            # outra leitura pode ter trocado a tabela no meio (e lido parte
+            # do log novo): então ela já está em dia, ou se acerta sozinha
+            if _cache.get(path) is tab:
+                df = _aplicar_varios(tab.df, tab.indice, registros)
+                _cache[path] = _Tabela(_assinatura(path), df, tab.indice, versao,
+                                       base=tab.base, log=_marcar(log, os.path.getsize(log)))
+    except Exception:
+        # o log já tem as edições: a próxima leitura as aplica do zero
+        _log.exception("cache de %s descartado depois das edições", path)
+        invalidar(path)
+
+    if versao >= LIMITE_LOG:
+        threading.Thread(target=compactar, args=(path,), daemon=True).start()
+
+
+@medido
+def compactar(path: str = None):
+    """Incorpora o log de edições ao CSV base e zera o log.
+
+    Sem `path`, compacta todas as etapas. Se cair no meio, o log antigo
+    continua valendo: reaplicá-lo sobre a base nova dá o mesmo resultado.
+    """
+    paths = [path] if path else list(ETAPAS.values())
+    if BACKEND == "parquet":
+        for p in paths:
+            _externo().compactar(p)
+        return
+    for p in paths:
+        with _trava_etapa(p):
+            log = _arquivo_log(p)
+            if _stat(log) is None:
+                continue
+            tab = _tabela(p)
+            tmp = p + ".tmp"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                para_texto(tab.df).to_csv(f, index=False)
+                _fsync(f)
+            os.replace(tmp, p)
+            os.remove(log)
+            cabecalho = tuple(tab.df.columns)
+            with _lock:
+                _cache[p] = _Tabela(_assinatura(p), tab.df, tab.indice, 0, tab.facetas,
+                                    _marcar(p, os.path.getsize(p), cabecalho))
+
+
+# --------------------------- Consulta ------------------------------
+@medido
+def fetch_row(path: str, chave) -> pd.Series:
+    """Linha do numeroAtendimento `chave` na etapa, via índice (O(1))."""
+    _aguardar(path)
+    if _externo():
+        linha = _externo().fetch_row(path, chave)
+        if str(linha.get("numeroAtendimento", "")) == "":
+            return linha                    # não achou: mesmo formato do CSV
+        # mesmos tipos (ESQUEMA) da linha que o CSV devolve do cache
+        return tipar(linha.to_frame().T).iloc[0]
+    tab = _tabela(path)
+    # se ainda não existe coluna (csv vazio), devolve Series vazio
+    if "numeroAtendimento" not in tab.df.columns:
+        return pd.Series(dtype="object")          # nada para mostrar
+    pos = tab.indice.get(_chave(chave))
+    # o índice é compartilhado com a versão seguinte da tabela: chave
+    # acrescentada depois desta leitura aponta além do fim
+    if pos is not None and pos < len(tab.df):
+        return tab.df.iloc[pos]
+    # retorna Series com todas as colunas mas vazias
+    return pd.Series({c: "" for c in tab.df.columns})
@@ -0,0 +1,451 @@
+# dados_parquet.py
+# ------------------------------------------------------------------
+# BACKEND PARQUET (opcional) PARA AS ETAPAS DAS LINHAS DE CUIDADO
+#   • cada etapa é um diretório dados_<etapa>.parquet/ particionado no
+#     estilo hive por hospital e mês da data da etapa (dados.COLUNA_MES):
+#       hospital=HUC/mes=2025-04/part-*.parquet
+#     etapas sem data de referência ficam só em hospital=<...>/
+#   • gravar = criar um part novo em cada partição do lote (nada é reescrito)
+#   • leitura com memory-map, só das colunas pedidas; filtro de hospital
+#     / mês poda partições (só os arquivos do recorte são abertos) e os
+#     demais (linhaCuidado ...) vão para o scan do Arrow
+#   • cada linha leva _seq (ns); na leitura vale a versão mais nova
+#     de cada numeroAtendimento (last-write-wins). Edição que muda a
+#     linha de partição deixa uma lápide (_apagado) na antiga, então
+#     cada partição se resolve sozinha
+#   • compactação junta os parts de cada partição num único arquivo,
+#     com a trava de gravação da etapa (flock, como dados.py); os parts
+#     antigos só são apagados depois do novo estar no lugar e quando
+#     nenhum leitor, deste ou de outro processo, está no meio de um scan
+#     (flock compartilhado em <diretório>.leitura.lock)
+#   • conversão dos CSVs:  python dados_parquet.py
+#     diretório no layout antigo (sem partições):  python dados_parquet.py --reparticionar
+#
+# Ativado com LINHAS_BACKEND=parquet (ver dados.py).
+# ------------------------------------------------------------------
+
+import glob
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:                 # Windows: sem flock
+    fcntl = None
+
+SEQ = "_seq"
+APAGADO = "_apagado"
+MES = "mes"
+# identificadores digitados em text_input: sempre texto, mesmo que pareçam número
+COLUNAS_TEXTO = {"hospital", "numeroAtendimento", "numeroAutorizacao",
+                 "numeroDRG", "cidPrincipal"}
+# a partir de quantos parts a compactação dispara sozinha
+LIMITE_PARTS = 200
+# partição de valor vazio (lida de volta como nulo)
+SEM_VALOR = "__HIVE_DEFAULT_PARTITION__"
+# até quantas chaves o dedup lê só as versões delas (e não a partição toda)
+LIMITE_CHAVES = 50_000
+
+# _lock: gravações deste módulo. Leitores nunca o tomam (a compactação
+# espera os leitores, e leitor esperando _lock travaria as duas)
+_lock = threading.RLock()
+_fs = pafs.LocalFileSystem(use_mmap=True)
+_schemas: dict = {}         # path -> (parts já lidos, schema unificado)
+_schemas_lock = threading.Lock()
+
+
+def diretorio_de(path: str) -> str:
+    """dados_internacao.csv -> dados_internacao.parquet"""
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def _parts(path: str) -> list:
+    return sorted(glob.glob(os.path.join(diretorio_de(path), "**", "*.parquet"),
+                            recursive=True))
+
+
+@contextmanager
+def _trava_leitura(path: str, exclusiva: bool = False):
+    """flock em <diretório>.leitura.lock: compartilhado por quem lista e
+    lê os parts, exclusivo para a compactação apagar os antigos. Sem
+    fcntl (Windows) não trava."""
+    if fcntl is None:
+        yield
+        return
+    with open(diretorio_de(path) + ".leitura.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _coluna_mes(path: str):
+    import dados
+    return dados.coluna_mes(path)
+
+
+def _chaves_particao(path: str) -> list:
+    return ["hospital", MES] if _coluna_mes(path) else ["hospital"]
+
+
+def _schema(path: str):
+    """Schema dos arquivos da etapa (união dos parts), ou None."""
+    parts = _parts(path)
+    if not parts:
+        return None
+    with _schemas_lock:
+        lidos, schema = _schemas.get(path, (set(), None))
+        novos = [p for p in parts if p not in lidos]
+        if novos:
+            schema = pa.unify_schemas(([schema] if schema else []) +
+                                      [pq.read_schema(p).remove_metadata() for p in novos])
+            _schemas[path] = (lidos | set(novos), schema)
+    return schema
+
+
+def _dataset(path: str):
+    particao = pa.schema([(c, pa.string()) for c in _chaves_particao(path)])
+    arquivos = _schema(path)
+    schema = pa.schema(list(arquivos) + [f for f in particao if f.name not in arquivos.names])
+    return ds.dataset(diretorio_de(path), schema=schema, format="parquet", filesystem=_fs,
+                      partitioning=ds.partitioning(particao, flavor="hive"))
+
+
+def _para_arrow(df: pd.DataFrame, schema) -> pa.Table:
+    """DataFrame -> Table, com ids como texto e tipos iguais aos já gravados."""
+    df = df.copy()
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(object)        # grava texto simples, não dicionário
+        if c in COLUNAS_TEXTO:
+            df[c] = df[c].map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+
+    campos = []
+    for campo in tabela.schema:
+        i = schema.get_field_index(campo.name) if schema is not None else -1
+        if i >= 0 and not pa.types.is_null(schema.field(i).type):
+            campos.append(schema.field(i))
+        elif pa.types.is_null(campo.type):
+            # coluna toda vazia: texto, para os próximos parts poderem preenchê-la
+            campos.append(pa.field(campo.name, pa.string()))
+        else:
+            campos.append(campo)
+    return tabela.cast(pa.schema(campos))
+
+
+def _valor_particao(serie: pd.Series) -> pd.Series:
+    """Valores como aparecem no caminho; vazio/nulo -> SEM_VALOR."""
+    serie = serie.astype(object)
+    return serie.where(serie.notna() & (serie != ""), SEM_VALOR).astype(str)
+
+
+def _com_particao(path: str, df: pd.DataFrame) -> pd.DataFrame:
+    """df com as colunas de partição (hospital, mes) já como texto."""
+    coluna = _coluna_mes(path)
+    if coluna:
+        datas = pd.to_datetime(df[coluna], errors="coerce", format="ISO8601") \
+            if coluna in df.columns else pd.Series(pd.NaT, index=df.index)
+        df = df.assign(**{MES: datas.dt.strftime("%Y-%m")})
+    if "hospital" not in df.columns:
+        df = df.assign(hospital=None)
+    for c in _chaves_particao(path):
+        df[c] = _valor_particao(df[c])
+    return df
+
+
+def _escrever(diretorio: str, tabela: pa.Table, sufixo: str = None, **opcoes):
+    os.makedirs(diretorio, exist_ok=True)
+    nome = f"part-{time.time_ns():020d}-{sufixo or uuid.uuid4().hex[:8]}.parquet"
+    tmp = os.path.join(diretorio, "." + nome)
+    pq.write_table(tabela, tmp, **opcoes)
+    os.replace(tmp, os.path.join(diretorio, nome))   # leitores nunca veem part pela metade
+
+
+def _particoes_atuais(path: str, chaves: list) -> pd.DataFrame:
+    """Partição da versão visível de cada chave já gravada (índice = chave)."""
+    particao = _chaves_particao(path)
+    if not chaves or not _parts(path):
+        return pd.DataFrame(columns=particao)
+    dataset = _dataset(path)
+    lidas = ["numeroAtendimento", SEQ] + particao + \
+        ([APAGADO] if APAGADO in dataset.schema.names else [])
+    df = dataset.to_table(columns=lidas,
+                          filter=pc.field("numeroAtendimento").isin(chaves)).to_pandas()
+    df = df.sort_values(SEQ, kind="stable").drop_duplicates("numeroAtendimento", keep="last")
+    if APAGADO in df.columns:
+        df = df[~df[APAGADO].fillna(False).astype(bool)]
+    df = df.set_index("numeroAtendimento")[particao]
+    for c in particao:
+        df[c] = _valor_particao(df[c])
+    return df
+
+
+def _gravar_part(path: str, df: pd.DataFrame):
+    seq = time.time_ns()
+    particao = _chaves_particao(path)
+    with _lock:
+        df = _com_particao(path, df.assign(**{SEQ: seq, APAGADO: False}))
+        df["numeroAtendimento"] = df["numeroAtendimento"].map(
+            lambda v: None if pd.isna(v) else str(v))
+        df = df.drop_duplicates("numeroAtendimento", keep="last")
+
+        # linha que mudou de partição: lápide na antiga, para a leitura
+        # podada (que só olha a partição filtrada) não achar a versão velha
+        antigas = _particoes_atuais(path, df["numeroAtendimento"].dropna().tolist())
+        if len(antigas):
+            novas = df.set_index("numeroAtendimento")[particao].reindex(antigas.index)
+            mudou = (novas != antigas).any(axis=1)
+            lapides = antigas[mudou].rename_axis("numeroAtendimento").reset_index()
+            if len(lapides):
+                lapides = lapides.assign(**{SEQ: seq - 1, APAGADO: True})
+                df = pd.concat([lapides, df], ignore_index=True)
+
+        schema = _schema(path)
+        for valores, grupo in df.groupby(particao, sort=False):
+            valores = valores if isinstance(valores, tuple) else (valores,)
+            diretorio = os.path.join(diretorio_de(path), *(
+                f"{c}={v if v == SEM_VALOR else quote(v, safe='')}"
+                for c, v in zip(particao, valores)))
+            tabela = _para_arrow(grupo.drop(columns=particao), schema)
+            _escrever(diretorio, tabela)
+            schema = schema or tabela.schema
+
+    if len(_parts(path)) >= LIMITE_PARTS:
+        threading.Thread(target=compactar, args=(path,), daemon=True).start()
+
+
+def _expressao(filtros: dict):
+    """{"hospital": "HUC", "linhaCuidado": ""} -> filtro Arrow (ignora vazios)."""
+    expr = None
+    for col, valor in (filtros or {}).items():
+        if valor in ("", None):
+            continue
+        e = pc.field(col) == valor
+        expr = e if expr is None else expr & e
+    return expr
+
+
+def _e(*exprs):
+    exprs = [e for e in exprs if e is not None]
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def _recorte(path: str, colunas: list = None, filtros: dict = None) -> tuple:
+    """(dataset, colunas pedidas, colunas lidas, poda de partição, filtro
+    do scan) da leitura pedida."""
+    dataset = _dataset(path)
+    particao = _chaves_particao(path)
+    nomes = [n for n in dataset.schema.names if n not in (SEQ, APAGADO, MES)]
+    pedidas = [c for c in (colunas or nomes) if c in nomes]
+    lidas = list(dict.fromkeys(pedidas + ["numeroAtendimento", SEQ]))
+    if APAGADO in dataset.schema.names:
+        lidas.append(APAGADO)
+
+    filtros = {c: v for c, v in (filtros or {}).items() if c in dataset.schema.names}
+    poda = _expressao({c: v for c, v in filtros.items() if c in particao})
+    resto = _expressao({c: v for c, v in filtros.items() if c not in particao})
+    return dataset, pedidas, lidas, poda, resto
+
+
+def _ler(path: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
+    with _trava_leitura(path):
+        return _ler_parts(path, colunas, filtros)
+
+
+def _ler_parts(path: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
+    if not _parts(path):
+        return pd.DataFrame(columns=colunas) if colunas else pd.DataFrame()
+
+    dataset, pedidas, lidas, poda, resto = _recorte(path, colunas, filtros)
+    df = dataset.to_table(columns=lidas, filter=_e(poda, resto)).to_pandas()
+
+    if len(df) and len(list(dataset.get_fragments(filter=poda))) > 1:
+        # mais de um part: a versão lida só vale se for a mais nova da
+        # chave. Basta olhar as partições do recorte: quem saiu delas
+        # deixou lápide lá
+        chaves = df["numeroAtendimento"].dropna().unique()
+        # tipado: lista vazia viraria array null e o isin quebraria
+        tipo = dataset.schema.field("numeroAtendimento").type
+        so_estas = pc.field("numeroAtendimento").isin(pa.array(list(chaves), tipo)) \
+            if len(chaves) <= LIMITE_CHAVES else None
+        versoes = dataset.to_table(columns=["numeroAtendimento", SEQ],
+                                   filter=_e(poda, so_estas)).to_pandas()
+        ultima = versoes.groupby("numeroAtendimento")[SEQ].max()
+        df = df[df[SEQ].values == ultima.reindex(df["numeroAtendimento"]).values]
+        df = df.drop_duplicates("numeroAtendimento", keep="last")
+    if APAGADO in df.columns:
+        df = df[~df[APAGADO].fillna(False).astype(bool)]
+    return df[pedidas].reset_index(drop=True)
+
+
+# --------------------------- API (espelha dados.py) ----------------
+def save(path: str, registros: list):
+    """Grava uma ou mais linhas novas, um part por partição do lote."""
+    if registros:
+        _gravar_part(path, pd.DataFrame(registros))
+
+
+def upsert(path: str, registros: list):
+    """Edição = nova versão da linha; a leitura fica com a mais recente."""
+    save(path, registros)
+
+
+def assinatura(path: str):
+    """Os parts nunca mudam depois de escritos: a lista deles basta."""
+    base = diretorio_de(path)
+    return tuple(os.path.relpath(p, base) for p in _parts(path))
+
+
+def carregar(path: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
+    return _ler(path, colunas, filtros)
+
+
+def lotes(path: str, colunas: list = None, filtros: dict = None, tamanho: int = 50_000):
+    """Como carregar, em DataFrames de até `tamanho` linhas (scan em
+    batches do Arrow). Com mais de um part no recorte, uma passada antes
+    lê só (numeroAtendimento, _seq) para saber a versão vigente de cada
+    chave: memória O(chaves), não O(linhas × colunas). A trava de
+    leitura fica com o gerador até o último lote."""
+    with _trava_leitura(path):
+        if not _parts(path):
+            return
+        dataset, pedidas, lidas, poda, resto = _recorte(path, colunas, filtros)
+        ultima = None
+        if len(list(dataset.get_fragments(filter=poda))) > 1:
+            versoes = dataset.to_table(columns=["numeroAtendimento", SEQ],
+                                       filter=poda).to_pandas()
+            ultima = versoes.groupby("numeroAtendimento")[SEQ].max()
+            del versoes
+        for batch in dataset.to_batches(columns=lidas, filter=_e(poda, resto),
+                                        batch_size=tamanho):
+            df = batch.to_pandas()
+            if ultima is not None:
+                df = df[df[SEQ].values == ultima.reindex(df["numeroAtendimento"]).values]
+            if APAGADO in df.columns:
+                df = df[~df[APAGADO].fillna(False).astype(bool)]
+            if len(df):
+                yield df[pedidas].reset_index(drop=True)
+
+
+def fetch_row(path: str, chave) -> pd.Series:
+    with _trava_leitura(path):
+        if not _parts(path):
+            return pd.Series(dtype="object")
+        df = _ler_parts(path, filtros={"numeroAtendimento": str(chave)})
+        if len(df):
+            return df.iloc[-1]
+        return pd.Series({c: "" for c in _dataset(path).schema.names
+                          if c not in (SEQ, APAGADO, MES)})
+
+
+def compactar(path: str):
+    """Reescreve cada partição num único part, sem versões velhas nem
+    lápides, ordenado por linhaCuidado (deixa as estatísticas de cada
+    row group boas para o filtro).
+
+    Enquanto os antigos não são apagados, o part novo (com _seq maior)
+    e eles convivem e a leitura dá o mesmo resultado."""
+    import dados
+
+    with dados._trava_etapa(path):
+        por_particao: dict = {}
+        for p in _parts(path):
+            por_particao.setdefault(os.path.dirname(p), []).append(p)
+        velhos = []
+        for diretorio, parts in por_particao.items():
+            tabela = pq.read_table(parts, filesystem=_fs, partitioning=None,
+                                   schema=_schema(path))
+            apagados = tabela[APAGADO].fill_null(False) if APAGADO in tabela.schema.names \
+                else pa.array([False] * len(tabela))
+            if len(parts) == 1 and not pc.any(apagados).as_py():
+                continue
+            df = tabela.to_pandas().sort_values(SEQ, kind="stable")
+            df = df.drop_duplicates("numeroAtendimento", keep="last")
+            if APAGADO in df.columns:
+                df = df[~df[APAGADO].fillna(False).astype(bool)]
+            if len(df):
+                ordem = [c for c in ("linhaCuidado", "numeroAtendimento") if c in df.columns]
+                df = df.sort_values(ordem, kind="stable").assign(
+                    **{SEQ: time.time_ns(), APAGADO: False})
+                _escrever(diretorio, _para_arrow(df, _schema(path)), "base",
+                          row_group_size=64_000)
+            velhos += parts
+        with _trava_leitura(path, exclusiva=True):
+            for p in velhos:
+                os.remove(p)
+
+
+# --------------------------- Conversão -----------------------------
+def converter_csvs(etapas: dict = None) -> dict:
+    """Converte cada CSV de etapa (já com o log de edições) para Parquet,
+    substituindo o que houver no diretório. Devolve {path: linhas}."""
+    import shutil
+
+    import dados
+
+    resultado = {}
+    for path in (etapas or dados.ETAPAS).values():
+        df = dados._tabela(path).df          # sempre o CSV, qualquer que seja o BACKEND
+        if df.empty or "numeroAtendimento" not in df.columns:
+            resultado[path] = 0
+            continue
+        with _lock:
+            shutil.rmtree(diretorio_de(path), ignore_errors=True)
+            with _schemas_lock:
+                _schemas.pop(path, None)
+            _gravar_part(path, dados.para_texto(df))    # mesmo formato das gravações do app
+            compactar(path)
+        resultado[path] = len(df)
+    return resultado
+
+
+def reparticionar(etapas: dict = None) -> dict:
+    """Leva um diretório do layout antigo (parts soltos na raiz, com a
+    coluna hospital dentro) para o particionado. Devolve {path: linhas}."""
+    import shutil
+
+    import dados
+
+    resultado = {}
+    for path in (etapas or dados.ETAPAS).values():
+        soltos = sorted(glob.glob(os.path.join(diretorio_de(path), "*.parquet")))
+        if not soltos:
+            continue
+        with _lock:
+            df = pq.read_table(soltos).to_pandas().sort_values(SEQ, kind="stable")
+            df = df.drop_duplicates("numeroAtendimento", keep="last").drop(columns=SEQ)
+            antigo = diretorio_de(path) + ".antigo"
+            os.replace(diretorio_de(path), antigo)
+            with _schemas_lock:
+                _schemas.pop(path, None)
+            _gravar_part(path, df)
+            compactar(path)
+            shutil.rmtree(antigo)
+        resultado[path] = len(df)
+    return resultado
+
+
+if __name__ == "__main__":
+    import sys
+
+    funcao = reparticionar if "--reparticionar" in sys.argv[1:] else converter_csvs
+    for path, n in funcao().items():
+        print(f"{path}: {n} linhas -> {diretorio_de(path)}")
@@ -0,0 +1,288 @@
+# dados_sqlite.py
+# ------------------------------------------------------------------
+# BACKEND SQLITE (opcional) PARA AS ETAPAS DAS LINHAS DE CUIDADO
+#   • uma tabela por etapa, PK (hospital, numeroAtendimento)
+#   • chave = numeroAtendimento, como no resto do app: uma linha por
+#     atendimento. save de atendimento já gravado SUBSTITUI a linha
+#     inteira (de propósito: no CSV o append deixaria as duas e fetch_row
+#     ficaria com a primeira); upsert muda só as colunas do registro,
+#     hospital inclusive. A PK só agrupa as linhas por hospital no arquivo
+#   • índices em hospital / linhaCuidado / numeroAtendimento
+#   • WAL para leitores concorrentes + pool de conexões por processo
+#   • migração única dos CSVs:  python dados_sqlite.py [--db arquivo]
+#
+# Ativado com LINHAS_BACKEND=sqlite (ver dados.py); o arquivo do banco
+# vem de LINHAS_SQLITE (padrão linhas_de_cuidado.db).
+# ------------------------------------------------------------------
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+DB_PATH = os.environ.get("LINHAS_SQLITE", "linhas_de_cuidado.db")
+TAMANHO_POOL = 8
+
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=TAMANHO_POOL)
+_lock_ddl = threading.Lock()
+_colunas: dict = {}       # tabela -> lista de colunas já existentes
+
+
+def _nova_conexao() -> sqlite3.Connection:
+    con = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False,
+                          isolation_level=None)      # transações explícitas
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=30000")
+    return con
+
+
+@contextmanager
+def _conexao():
+    """Empresta uma conexão do pool (compartilhado entre sessões)."""
+    try:
+        con = _pool.get_nowait()
+    except queue.Empty:
+        con = _nova_conexao()
+    try:
+        yield con
+    finally:
+        try:
+            _pool.put_nowait(con)
+        except queue.Full:
+            con.close()
+
+
+def tabela_de(path: str) -> str:
+    """dados_internacao.csv -> dados_internacao"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _q(nome: str) -> str:
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def _colunas_existentes(con, tabela: str) -> list:
+    if tabela not in _colunas:
+        info = con.execute(f"PRAGMA table_info({_q(tabela)})").fetchall()
+        _colunas[tabela] = [c[1] for c in info]
+    return _colunas[tabela]
+
+
+def _garantir_tabela(con, tabela: str, colunas: list):
+    """Cria a tabela/índices na 1ª escrita e acrescenta colunas novas."""
+    with _lock_ddl:
+        existentes = _colunas_existentes(con, tabela)
+        if not existentes:
+            extras = [c for c in colunas if c not in ("hospital", "numeroAtendimento")]
+            defs = ", ".join(["hospital TEXT NOT NULL DEFAULT ''",
+                              "numeroAtendimento TEXT NOT NULL"] + [_q(c) for c in extras])
+            con.execute(f"CREATE TABLE IF NOT EXISTS {_q(tabela)} ({defs}, "
+                        "PRIMARY KEY (hospital, numeroAtendimento))")
+            con.execute(f"CREATE INDEX IF NOT EXISTS {_q('ix_' + tabela + '_atend')} "
+                        f"ON {_q(tabela)} (numeroAtendimento)")
+            con.execute(f"CREATE INDEX IF NOT EXISTS {_q('ix_' + tabela + '_hosp')} "
+                        f"ON {_q(tabela)} (hospital)")
+            _colunas.pop(tabela, None)
+            existentes = _colunas_existentes(con, tabela)
+
+        for c in colunas:
+            if c not in existentes:
+                con.execute(f"ALTER TABLE {_q(tabela)} ADD COLUMN {_q(c)}")
+                existentes.append(c)
+
+        if "linhaCuidado" in existentes:
+            con.execute(f"CREATE INDEX IF NOT EXISTS {_q('ix_' + tabela + '_linha')} "
+                        f"ON {_q(tabela)} (hospital, linhaCuidado)")
+
+
+def _valor(v):
+    """Converte tipos numpy/pandas em tipos aceitos pelo sqlite3."""
+    if v is None or (isinstance(v, float) and v != v) or v is pd.NA:
+        return None
+    if hasattr(v, "item"):
+        return v.item()
+    return v
+
+
+def _normalizar(registro: dict) -> dict:
+    reg = {c: _valor(v) for c, v in registro.items()}
+    reg["hospital"] = reg.get("hospital") or ""
+    reg["numeroAtendimento"] = str(reg["numeroAtendimento"])
+    return reg
+
+
+# --------------------------- API (espelha dados.py) ----------------
+def save(path: str, registros: list):
+    """Insere uma ou mais linhas numa transação; atendimento que já
+    existia (com qualquer hospital) tem a linha substituída."""
+    if not registros:
+        return
+    # no mesmo lote vale o último registro de cada atendimento
+    registros = list({r["numeroAtendimento"]: r
+                      for r in map(_normalizar, registros)}.values())
+    tabela = tabela_de(path)
+    colunas = list(dict.fromkeys(c for r in registros for c in r))
+    with _conexao() as con:
+        _garantir_tabela(con, tabela, colunas)
+        sql = (f"INSERT INTO {_q(tabela)} ({', '.join(map(_q, colunas))}) "
+               f"VALUES ({', '.join('?' * len(colunas))})")
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany(f"DELETE FROM {_q(tabela)} WHERE numeroAtendimento = ?",
+                            [[r["numeroAtendimento"]] for r in registros])
+            con.executemany(sql, [[r.get(c) for c in colunas] for r in registros])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+
+def upsert(path: str, registros: list):
+    """Atualiza a linha de cada numeroAtendimento (ou insere), tudo numa
+    transação só. O registro pode mudar o hospital da linha."""
+    if not registros:
+        return
+    originais, registros = registros, [_normalizar(r) for r in registros]
+    tabela = tabela_de(path)
+    with _conexao() as con:
+        _garantir_tabela(con, tabela, list(dict.fromkeys(c for r in registros for c in r)))
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for reg, original in zip(registros, originais):
+                # banco gravado antes de save substituir pela chave pode ter
+                # o atendimento em dois hospitais: fica a 1ª linha (a do
+                # fetch_row), senão mudar o hospital bateria na PK
+                con.execute(
+                    f"DELETE FROM {_q(tabela)} WHERE numeroAtendimento = ? AND rowid <> "
+                    f"(SELECT MIN(rowid) FROM {_q(tabela)} WHERE numeroAtendimento = ?)",
+                    [reg["numeroAtendimento"]] * 2)
+                # hospital ausente do registro não apaga o da linha
+                mudar = {c: v for c, v in reg.items() if c in original}
+                sets = ", ".join(f"{_q(c)} = ?" for c in mudar)
+                cur = con.execute(
+                    f"UPDATE {_q(tabela)} SET {sets} WHERE numeroAtendimento = ?",
+                    list(mudar.values()) + [reg["numeroAtendimento"]])
+                if cur.rowcount == 0:
+                    con.execute(
+                        f"INSERT INTO {_q(tabela)} ({', '.join(map(_q, reg))}) "
+                        f"VALUES ({', '.join('?' * len(reg))})", list(reg.values()))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+
+def assinatura(path: str):
+    """Muda a cada commit: o WAL (ou o próprio banco) é tocado."""
+    sig = []
+    for arq in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            info = os.stat(arq)
+            sig.append((info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return (tabela_de(path), *sig)
+
+
+def _consulta(con, path: str, colunas: list = None, filtros: dict = None):
+    """(sql, params) do SELECT com as colunas/filtros pedidos; None se a
+    tabela ainda não existe."""
+    import dados
+    tabela = tabela_de(path)
+    existentes = _colunas_existentes(con, tabela)
+    if not existentes:
+        _colunas.pop(tabela, None)      # tabela ainda não criada
+        return None
+
+    cols = [c for c in (colunas or existentes) if c in existentes]
+    where, params = [], []
+    for col, valor in (filtros or {}).items():
+        if valor in ("", None):
+            continue
+        if col == "mes" and dados.coluna_mes(path) in existentes:
+            # datas gravadas em ISO: o mês é o prefixo AAAA-MM
+            where.append(f"substr({_q(dados.coluna_mes(path))}, 1, 7) = ?")
+        elif col in existentes:
+            where.append(f"{_q(col)} = ?")
+        else:
+            continue
+        params.append(valor)
+    sql = f"SELECT {', '.join(map(_q, cols))} FROM {_q(tabela)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+
+def carregar(path: str, colunas: list = None, filtros: dict = None) -> pd.DataFrame:
+    with _conexao() as con:
+        consulta = _consulta(con, path, colunas, filtros)
+        if consulta is None:
+            return pd.DataFrame(columns=colunas) if colunas else pd.DataFrame()
+        sql, params = consulta
+        return pd.read_sql_query(sql, con, params=params)
+
+
+def lotes(path: str, colunas: list = None, filtros: dict = None, tamanho: int = 50_000):
+    """Como carregar, em DataFrames de até `tamanho` linhas (cursor aberto
+    durante a iteração; a conexão volta ao pool no fim)."""
+    with _conexao() as con:
+        consulta = _consulta(con, path, colunas, filtros)
+        if consulta is None:
+            return
+        sql, params = consulta
+        yield from pd.read_sql_query(sql, con, params=params, chunksize=tamanho)
+
+
+def fetch_row(path: str, chave) -> pd.Series:
+    tabela = tabela_de(path)
+    with _conexao() as con:
+        colunas = _colunas_existentes(con, tabela)
+        if not colunas:
+            _colunas.pop(tabela, None)
+            return pd.Series(dtype="object")
+        cur = con.execute(
+            f"SELECT * FROM {_q(tabela)} WHERE numeroAtendimento = ? ORDER BY rowid LIMIT 1",
+            [str(chave)])
+        linha = cur.fetchone()
+        nomes = [d[0] for d in cur.description]
+    if linha is None:
+        return pd.Series({c: "" for c in nomes})
+    return pd.Series(dict(zip(nomes, linha)))
+
+
+# --------------------------- Migração ------------------------------
+def migrar_csvs(etapas: dict = None) -> dict:
+    """Copia cada CSV de etapa (já com o log de edições) para o banco.
+
+    Pode ser rodada de novo sem duplicar: save substitui pela chave
+    (numeroAtendimento).
+    Devolve {path: linhas migradas}."""
+    import dados
+
+    resultado = {}
+    for path in (etapas or dados.ETAPAS).values():
+        df = dados._tabela(path).df          # sempre o CSV, qualquer que seja o BACKEND
+        if df.empty or "numeroAtendimento" not in df.columns:
+            resultado[path] = 0
+            continue
+        df = dados.para_texto(df)
+        registros = df.astype(object).where(df.notna(), None).to_dict("records")
+        save(path, registros)
+        resultado[path] = len(registros)
+    return resultado
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migra os CSVs das etapas para SQLite.")
+    parser.add_argument("--db", default=DB_PATH, help="arquivo do banco (padrão: %(default)s)")
+    args = parser.parse_args()
+    DB_PATH = args.db
+
+    for path, n in migrar_csvs().items():
+        print(f"{path}: {n} linhas")
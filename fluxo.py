@@ -0,0 +1,277 @@
+# fluxo.py
+# ------------------------------------------------------------------
+# EXECUÇÃO EM FLUXO (dados maiores que a memória)
+#   • tudo passa por dados.lotes(): a etapa é lida em blocos de até
+#     LINHAS_LOTE linhas (CSV: read_csv em chunks; Parquet: batches do
+#     scan do Arrow; SQLite: cursor em chunks) e nada fica no cache
+#   • filtrar(): só as linhas do filtro ficam em memória
+#   • exportar(): filtro + colunas direto para um CSV, bloco a bloco
+#   • indicadores(): os KPIs de indicadores.calcular somados bloco a
+#     bloco por (hospital, linhaCuidado); p50/p90 saem de histogramas
+#     logarítmicos fixos (faixas de ~1% de largura). Só o mapa
+#     numeroAtendimento -> grupo fica em memória (para juntar as etapas)
+#   • cada operação devolve também um relatório: linhas, lotes,
+#     segundos e pico de memória residente (MB)
+#   • LINHAS_FLUXO=1 faz indicadores.indicadores() usar este caminho
+#   • linha de comando:
+#       python fluxo.py indicadores [--grupos hospital] [--lote 20000]
+#       python fluxo.py exportar Internação saida.csv --filtro hospital=HUC
+# ------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import dados
+from dados import ETAPAS, lotes, normalizar_chaves, para_texto
+from indicadores import GRUPOS, _COLUNAS
+from perfil import medido
+
+ATIVO = os.environ.get("LINHAS_FLUXO", "").strip() not in ("", "0")
+
+# faixas dos histogramas de p50/p90: log de 1e-2 a 1e6 (dos dois lados
+# do zero); fora disso o valor cai na faixa da ponta
+_LOG = np.geomspace(1e-2, 1e6, 2000)
+BORDAS = np.r_[-_LOG[::-1], 0.0, _LOG]
+
+
+# --------------------------- Memória -------------------------------
+def memoria_mb() -> float:
+    """Memória residente atual do processo (MB)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource             # sem /proc: o pico do processo é o que há
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+class _Relatorio:
+    """Conta linhas/lotes e acompanha o pico de memória a cada lote."""
+
+    def __init__(self, tamanho: int):
+        self.tamanho = tamanho
+        self.linhas = self.lotes = 0
+        self.inicio = time.perf_counter()
+        self.pico = memoria_mb()
+
+    def lote(self, df: pd.DataFrame) -> pd.DataFrame:
+        self.linhas += len(df)
+        self.lotes += 1
+        self.pico = max(self.pico, memoria_mb())
+        return df
+
+    def como_dict(self) -> dict:
+        return {"linhas": self.linhas, "lotes": self.lotes, "tamanho_lote": self.tamanho,
+                "segundos": round(time.perf_counter() - self.inicio, 3),
+                "pico_mb": round(max(self.pico, memoria_mb()), 1)}
+
+
+# --------------------------- Filtro / exportação -------------------
+@medido(linhas=lambda r, *a, **k: len(r[0]))
+def filtrar(path: str, filtros: dict, colunas: list = None, tamanho: int = None) -> tuple:
+    """(linhas da etapa no filtro, relatório), lendo em blocos."""
+    rel = _Relatorio(tamanho or dados.TAMANHO_LOTE)
+    partes = [rel.lote(df) for df in lotes(path, colunas, filtros, rel.tamanho)]
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    return df, rel.como_dict()
+
+
+@medido(linhas=None)
+def exportar(path: str, destino: str, colunas: list = None, filtros: dict = None,
+             tamanho: int = None) -> dict:
+    """Grava em `destino` (CSV) as linhas/colunas pedidas da etapa, bloco
+    a bloco; devolve o relatório."""
+    rel = _Relatorio(tamanho or dados.TAMANHO_LOTE)
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        for df in lotes(path, colunas, filtros, rel.tamanho):
+            para_texto(rel.lote(df)).to_csv(f, index=False, header=rel.lotes == 1)
+        if not rel.lotes and colunas:
+            pd.DataFrame(columns=colunas).to_csv(f, index=False)
+    os.replace(tmp, destino)
+    return rel.como_dict()
+
+
+# --------------------------- Indicadores ---------------------------
+class _Acumulador:
+    """Somas por grupo (hospital, linhaCuidado) que aceitam mais lotes."""
+
+    SOMAS = ["atendimentos", "obito", "n_real", "s_real", "n_prev", "s_prev",
+             "n_uti", "s_uti", "n_reint", "s_reint", "razao_real", "razao_prev"]
+    HISTOGRAMAS = ["tempoExamePS", "tempoExameInternacao"]
+
+    def __init__(self):
+        self.grupos: dict = {}          # (hospital, linhaCuidado) -> código
+        self.somas = {s: np.zeros(0) for s in self.SOMAS}
+        self.hist = {h: np.zeros((0, len(BORDAS) + 1), dtype=np.int64) for h in self.HISTOGRAMAS}
+
+    def codigos(self, hospital: pd.Series, linha: pd.Series) -> np.ndarray:
+        pares = list(zip(hospital.astype(object).where(hospital.notna(), None),
+                         linha.astype(object).where(linha.notna(), None)))
+        for p in set(pares) - self.grupos.keys():
+            self.grupos[p] = len(self.grupos)
+        g = len(self.grupos)
+        for s in self.SOMAS:
+            self.somas[s] = np.pad(self.somas[s], (0, g - len(self.somas[s])))
+        for h in self.HISTOGRAMAS:
+            self.hist[h] = np.pad(self.hist[h], ((0, g - len(self.hist[h])), (0, 0)))
+        return np.array([self.grupos[p] for p in pares], dtype=np.int64)
+
+    def somar(self, nome: str, codigos: np.ndarray, valores=None):
+        pesos = None if valores is None else np.asarray(valores, dtype="float64")
+        self.somas[nome] += np.bincount(codigos, pesos, minlength=len(self.grupos))
+
+    def contar(self, nome: str, codigos: np.ndarray, valores):
+        v = np.asarray(pd.to_numeric(valores, errors="coerce"), dtype="float64")
+        ok = ~np.isnan(v)
+        faixa = np.searchsorted(BORDAS, v[ok])
+        np.add.at(self.hist[nome], (codigos[ok], faixa), 1)
+
+
+def _quantil(hist: np.ndarray, q: float) -> float:
+    """Quantil (interpolação linear, como o pandas) a partir das faixas."""
+    n = hist.sum()
+    if not n:
+        return np.nan
+    alvo = q * (n - 1)                  # posição 0-based na amostra ordenada
+    acumulado = np.cumsum(hist)
+    k = int(np.searchsorted(acumulado, alvo, side="right"))
+    antes = acumulado[k - 1] if k else 0
+    lo = BORDAS[k - 1] if k else BORDAS[0]
+    hi = BORDAS[k] if k < len(BORDAS) else BORDAS[-1]
+    return float(lo + (alvo - antes + 0.5) / hist[k] * (hi - lo))
+
+
+def _etapa_em_lotes(nome: str, tamanho: int, rel: _Relatorio):
+    """Lotes da etapa já com os nomes da base de indicadores, 1ª linha de
+    cada atendimento (como fetch_row)."""
+    mapa = _COLUNAS[nome]
+    vistos = pd.Index([], dtype="string")
+    for df in lotes(ETAPAS[nome], list(mapa), tamanho=tamanho):
+        rel.lote(df)
+        df = df.rename(columns=mapa).reindex(columns=list(mapa.values()))
+        df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"]).astype("string")
+        df = df[~df["numeroAtendimento"].duplicated() & ~df["numeroAtendimento"].isin(vistos)]
+        vistos = vistos.append(pd.Index(df["numeroAtendimento"]))
+        yield df
+
+
+@medido
+def indicadores(grupos: list = GRUPOS, tamanho: int = None) -> tuple:
+    """(KPIs como indicadores.calcular, relatório), lendo as etapas em
+    blocos. p50/p90 são aproximados (faixas de BORDAS)."""
+    rel = _Relatorio(tamanho or dados.TAMANHO_LOTE)
+    acc = _Acumulador()
+
+    # 1) Pronto Atendimento define o grupo de cada atendimento
+    chave_grupo = []
+    for df in _etapa_em_lotes("Pronto Atendimento", rel.tamanho, rel):
+        cod = acc.codigos(df["hospital"], df["linhaCuidado"])
+        acc.somar("atendimentos", cod)
+        acc.somar("obito", cod, (df["status"] == "Óbito").fillna(False))
+        acc.contar("tempoExamePS", cod, df["tempoExamePS"])
+        chave_grupo.append(pd.Series(cod, index=df["numeroAtendimento"].to_numpy()))
+    grupo_de = pd.concat(chave_grupo) if chave_grupo else pd.Series(dtype=np.int64)
+    del chave_grupo
+
+    # 2) as outras etapas entram pelo grupo do atendimento (left join no PA)
+    def com_grupo(nome):
+        for df in _etapa_em_lotes(nome, rel.tamanho, rel):
+            cod = grupo_de.reindex(df["numeroAtendimento"].to_numpy()).to_numpy()
+            ok = ~np.isnan(cod)
+            yield df[ok], cod[ok].astype(np.int64)
+
+    def media(prefixo, cod, valores):
+        v = np.asarray(pd.to_numeric(valores, errors="coerce"), dtype="float64")
+        ok = ~np.isnan(v)
+        acc.somar(f"n_{prefixo}", cod[ok])
+        acc.somar(f"s_{prefixo}", cod[ok], v[ok])
+
+    for df, cod in com_grupo("Internação"):
+        acc.contar("tempoExameInternacao", cod, df["tempoExameInternacao"])
+        media("uti", cod, df["tempoUTI"])
+    for df, cod in com_grupo("Permanência"):
+        real = pd.to_numeric(df["permanenciaReal"], errors="coerce").to_numpy(dtype="float64")
+        prev = pd.to_numeric(df["permanenciaPrevistaDRG"], errors="coerce").to_numpy(dtype="float64")
+        media("real", cod, real)
+        media("prev", cod, prev)
+        ambos = ~np.isnan(real) & (prev > 0)
+        acc.somar("razao_real", cod[ambos], real[ambos])
+        acc.somar("razao_prev", cod[ambos], prev[ambos])
+    for df, cod in com_grupo("Pós-Alta"):
+        r = df["reinternacao"].astype(object)
+        ok = r.isin(["Sim", "Não"]).to_numpy()
+        acc.somar("n_reint", cod[ok])
+        acc.somar("s_reint", cod[ok], (r[ok] == "Sim").to_numpy())
+
+    return _kpis(acc, list(grupos)), rel.como_dict()
+
+
+def _kpis(acc: _Acumulador, grupos: list) -> pd.DataFrame:
+    """Junta os grupos finos em `grupos` e calcula as taxas/médias/quantis."""
+    pares = pd.DataFrame(list(acc.grupos), columns=GRUPOS)
+    somas = pd.DataFrame(acc.somas).assign(**pares)
+    if grupos:
+        somas = somas.dropna(subset=grupos)      # groupby do pandas ignora grupo nulo
+        chave = [tuple(x) for x in somas[grupos].itertuples(index=False)]
+    else:
+        chave = [0] * len(somas)
+    ordem = sorted(set(chave))
+    pos = {c: i for i, c in enumerate(ordem)}
+    linhas = np.array([pos[c] for c in chave], dtype=np.int64)
+
+    def soma(nome):
+        return np.bincount(linhas, somas[nome].to_numpy(), minlength=len(ordem))
+
+    def razao(a, b):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(b > 0, a / np.where(b > 0, b, 1), np.nan)
+
+    res = pd.DataFrame({
+        "atendimentos": soma("atendimentos").astype(np.int64),
+        "permanenciaRealMedia": razao(soma("s_real"), soma("n_real")),
+        "permanenciaPrevistaMedia": razao(soma("s_prev"), soma("n_prev")),
+        "tempoUTIMedio": razao(soma("s_uti"), soma("n_uti")),
+        "taxaReinternacao": razao(soma("s_reint"), soma("n_reint")),
+        "taxaMortalidade": razao(soma("obito"), soma("atendimentos")),
+    })
+    for col in _Acumulador.HISTOGRAMAS:
+        hist = np.zeros((len(ordem), len(BORDAS) + 1), dtype=np.int64)
+        np.add.at(hist, linhas, acc.hist[col][somas.index.to_numpy()])
+        res[f"{col}P50"] = [_quantil(h, 0.5) for h in hist]
+        res[f"{col}P90"] = [_quantil(h, 0.9) for h in hist]
+    res["razaoPermanencia"] = razao(soma("razao_real"), soma("razao_prev"))
+    if grupos:
+        res = pd.concat([pd.DataFrame(ordem, columns=grupos), res], axis=1)
+    return res
+
+
+# --------------------------- Linha de comando ----------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Execução em fluxo (memória limitada).")
+    parser.add_argument("--lote", type=int, default=None,
+                        help=f"linhas por lote (padrão LINHAS_LOTE = {dados.TAMANHO_LOTE})")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_ind = sub.add_parser("indicadores", help="KPIs por grupo")
+    p_ind.add_argument("--grupos", nargs="*", default=GRUPOS)
+    p_exp = sub.add_parser("exportar", help="etapa (com filtro) para CSV")
+    p_exp.add_argument("etapa", choices=list(ETAPAS))
+    p_exp.add_argument("saida")
+    p_exp.add_argument("--filtro", action="append", default=[], metavar="COLUNA=VALOR")
+    p_exp.add_argument("--colunas", nargs="*")
+    args = parser.parse_args()
+
+    if args.comando == "indicadores":
+        kpi, relatorio = indicadores(args.grupos, args.lote)
+        print(kpi.to_string(index=False))
+    else:
+        filtros = dict(f.split("=", 1) for f in args.filtro)
+        relatorio = exportar(ETAPAS[args.etapa], args.saida, args.colunas, filtros, args.lote)
+    print(json.dumps(relatorio), file=sys.stderr)
@@ -0,0 +1,143 @@
+# graficos.py
+# ------------------------------------------------------------------
+# DADOS DOS GRÁFICOS DE INDICADORES, JÁ REDUZIDOS NO SERVIDOR
+#   • o navegador só recebe tabelas pequenas (até MAX_PONTOS linhas);
+#     o Altair nunca vê as linhas cruas
+#   • séries no tempo: LTTB (Largest-Triangle-Three-Buckets) — guarda
+#     a forma da curva, picos incluídos, com poucos pontos
+#   • distribuições: histograma (np.histogram) em MAX_FAIXAS faixas
+#   • volumes: contagem por hospital × mês, tirada do cubo
+#   • resultado em cache até alguma etapa mudar (como indicadores.py)
+# ------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cubo import consultar as consultar_cubo
+from indicadores import _assinaturas, base_atual
+from perfil import medido
+
+MAX_PONTOS = 1000
+MAX_FAIXAS = 40
+# a cauda acima deste quantil vai para a última faixa do histograma
+QUANTIL_CAUDA = 0.995
+MAX_CACHE = 64
+
+_cache: dict = {}          # (função, argumentos) -> resultado, da assinatura atual
+_estado = {"assinaturas": None}
+_lock = threading.Lock()
+
+
+def _em_cache(chave: tuple, calcular):
+    sig = _assinaturas()
+    with _lock:
+        if _estado["assinaturas"] != sig:
+            _cache.clear()
+            _estado["assinaturas"] = sig
+        if chave in _cache:
+            return _cache[chave]
+    res = calcular()
+    with _lock:
+        if len(_cache) >= MAX_CACHE:
+            _cache.pop(next(iter(_cache)))
+        _cache[chave] = res
+    return res
+
+
+# --------------------------- Redução -------------------------------
+def lttb(x, y, pontos: int) -> np.ndarray:
+    """Posições dos `pontos` pontos escolhidos pelo LTTB (x crescente).
+
+    Primeiro e último ficam; o resto é dividido em pontos-2 baldes e de
+    cada um fica o ponto que forma o maior triângulo com o escolhido no
+    balde anterior e a média do balde seguinte."""
+    n = len(x)
+    if pontos >= n or pontos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    limites = np.linspace(1, n - 1, pontos - 1).astype(np.int64)
+
+    escolhidos = np.empty(pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    a = 0
+    for k in range(pontos - 2):
+        i, j = limites[k], limites[k + 1]
+        # média do balde seguinte (o último "balde" é o ponto final)
+        prox_i, prox_j = j, (limites[k + 2] if k + 2 < len(limites) else n)
+        mx, my = x[prox_i:prox_j].mean(), y[prox_i:prox_j].mean()
+        area = np.abs((x[a] - mx) * (y[i:j] - y[a]) - (x[a] - x[i:j]) * (my - y[a]))
+        a = i + int(np.argmax(area))
+        escolhidos[k + 1] = a
+    return escolhidos
+
+
+def reduzir(df: pd.DataFrame, x: str, y: str, pontos: int = MAX_PONTOS) -> pd.DataFrame:
+    """df[[x, y]] sem nulos, ordenado por x e reduzido a `pontos` linhas."""
+    df = df[[x, y]].dropna().sort_values(x, kind="stable")
+    if len(df) <= pontos:
+        return df.reset_index(drop=True)
+    eixo = df[x]
+    eixo = eixo.astype("int64") if pd.api.types.is_datetime64_any_dtype(eixo) else eixo
+    return df.iloc[lttb(eixo.to_numpy(), df[y].to_numpy(), pontos)].reset_index(drop=True)
+
+
+def faixas(valores, faixas: int = MAX_FAIXAS) -> pd.DataFrame:
+    """Histograma: uma linha por faixa [inicio, fim) com a contagem."""
+    v = pd.to_numeric(pd.Series(valores), errors="coerce").dropna().to_numpy(dtype="float64")
+    if not len(v):
+        return pd.DataFrame(columns=["inicio", "fim", "atendimentos"])
+    teto = np.quantile(v, QUANTIL_CAUDA)
+    limites = np.histogram_bin_edges(v, bins=faixas, range=(v.min(), max(teto, v.min() + 1e-9)))
+    contagem, _ = np.histogram(np.clip(v, limites[0], limites[-1]), bins=limites)
+    return pd.DataFrame({"inicio": limites[:-1], "fim": limites[1:], "atendimentos": contagem})
+
+
+# --------------------------- Recortes ------------------------------
+def _recorte(filtros: dict, inicio=None, fim=None) -> pd.DataFrame:
+    df = base_atual()
+    ok = np.ones(len(df), dtype=bool)
+    for col, valor in (filtros or {}).items():
+        if valor not in ("", None):
+            ok &= (df[col] == valor).to_numpy()
+    datas = df["dataHoraInternacaoPS"]
+    if inicio is not None:
+        ok &= (datas >= pd.Timestamp(inicio)).to_numpy()
+    if fim is not None:
+        ok &= (datas < pd.Timestamp(fim) + pd.Timedelta(days=1)).to_numpy()
+    return df[ok]
+
+
+def _chave(filtros: dict) -> tuple:
+    return tuple(sorted((c, v) for c, v in (filtros or {}).items() if v not in ("", None)))
+
+
+@medido
+def serie(coluna: str, filtros: dict = None, inicio=None, fim=None,
+          pontos: int = MAX_PONTOS) -> pd.DataFrame:
+    """Cada atendimento no tempo (dataHoraInternacaoPS x coluna), via LTTB."""
+    return _em_cache(
+        ("serie", coluna, _chave(filtros), str(inicio), str(fim), pontos),
+        lambda: reduzir(_recorte(filtros, inicio, fim), "dataHoraInternacaoPS", coluna, pontos))
+
+
+@medido
+def distribuicao(coluna: str, filtros: dict = None, inicio=None, fim=None,
+                 n_faixas: int = MAX_FAIXAS) -> pd.DataFrame:
+    """Histograma da coluna (ex.: permanenciaReal) no recorte."""
+    return _em_cache(
+        ("distribuicao", coluna, _chave(filtros), str(inicio), str(fim), n_faixas),
+        lambda: faixas(_recorte(filtros, inicio, fim)[coluna], n_faixas))
+
+
+@medido
+def volumes(filtros: dict = None, inicio=None, fim=None) -> pd.DataFrame:
+    """Atendimentos por hospital × mês (do cubo, sem ler as etapas)."""
+    def calcular():
+        df = consultar_cubo(["hospital", "dia"], inicio, fim, filtros)
+        df["mes"] = df["dia"].dt.to_period("M").dt.to_timestamp()
+        return (df.groupby(["hospital", "mes"], observed=True)["atendimentos"]
+                  .sum().reset_index())
+    return _em_cache(("volumes", _chave(filtros), str(inicio), str(fim)), calcular)
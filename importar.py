@@ -0,0 +1,201 @@
+# importar.py
+# ------------------------------------------------------------------
+# IMPORTAÇÃO EM MASSA DE EXTRATOS DOS HOSPITAIS
+#   • lê CSV ou Parquet em blocos (memória limitada pelo --bloco)
+#   • renomeia as colunas do extrato para as da etapa (--mapa)
+#   • normaliza datas / números e calcula tempoExame vetorizado,
+#     igual aos formulários: (laudo - solicitação) em minutos
+#   • datas dos extratos no padrão brasileiro (dd/mm/aaaa, dia primeiro;
+#     ISO também vale) ou no formato exato de --formato-data /
+#     --formato-data-hora; data que não se lê rejeita a linha
+#   • valida, descarta numeroAtendimento repetido (no arquivo e já
+#     gravado) e grava cada bloco de uma vez (dados.salvar_lote)
+#   • mostra linhas/s a cada bloco
+#
+# Uso:
+#   python importar.py extrato.csv --etapa "Pronto Atendimento" \
+#       --mapa atendimento=numeroAtendimento --hospital HUC
+# ------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import dados
+from dados import COLUNAS, ETAPAS, HOSPITAIS, LINHAS_CUIDADO, normalizar_chaves
+
+BLOCO = 50_000
+
+NUMERICAS = {"idade", "tempoExame", "tempoUTI", "permanenciaPrevistaDRG",
+             "permanenciaReal", "quantidade"}
+BOOLEANAS = {"altaUTIParaEnfermaria"}
+
+
+def _eh_data_hora(col: str) -> bool:
+    return col.startswith("dataHora")
+
+
+def _eh_data(col: str) -> bool:
+    return col.startswith("data") and not _eh_data_hora(col)
+
+
+def _ler_datas(valores: pd.Series, formato: str = None) -> pd.Series:
+    """Texto -> datetime; sem `formato`, dia primeiro (01/02/2025 = 1º de fevereiro)."""
+    if formato:
+        return pd.to_datetime(valores, errors="coerce", format=formato)
+    return pd.to_datetime(valores, errors="coerce", format="mixed", dayfirst=True)
+
+
+# --------------------------- Leitura em blocos ---------------------
+def ler_blocos(arquivo: str, tamanho: int = BLOCO):
+    """Itera o extrato em DataFrames de até `tamanho` linhas, tudo texto."""
+    if arquivo.lower().endswith((".parquet", ".pq")):
+        for lote in pq.ParquetFile(arquivo).iter_batches(batch_size=tamanho):
+            yield lote.to_pandas().astype("string").astype(object)
+    else:
+        yield from pd.read_csv(arquivo, chunksize=tamanho, dtype=str,
+                               keep_default_na=False, na_values=[""])
+
+
+# --------------------------- Preparação ----------------------------
+def preparar(bloco: pd.DataFrame, etapa: str, mapa: dict = None,
+             padroes: dict = None, formatos: dict = None) -> tuple:
+    """Leva um bloco do extrato para o formato da etapa.
+
+    `formatos`: {"data": ..., "datahora": ...} no padrão do strftime
+    (ausente = dd/mm/aaaa ou ISO). Devolve (válidos, rejeitados);
+    rejeitados ganham a coluna "motivo".
+    """
+    formatos = formatos or {}
+    colunas = COLUNAS[etapa]
+    df = bloco.rename(columns=mapa or {})
+    for col, valor in (padroes or {}).items():
+        if col not in df.columns:
+            df[col] = valor
+        else:
+            df[col] = df[col].fillna(valor)
+    df = df.reindex(columns=colunas)
+
+    motivo = pd.Series("", index=df.index)
+    for col in colunas:
+        if _eh_data_hora(col) or _eh_data(col):
+            hora = _eh_data_hora(col)
+            texto = df[col].astype("string").str.strip()
+            datas = _ler_datas(texto, formatos.get("datahora" if hora else "data"))
+            # preenchida mas ilegível: rejeita em vez de gravar vazio ou trocada
+            ruim = texto.fillna("").ne("") & datas.isna()
+            motivo[(motivo == "") & ruim.to_numpy()] = f"data inválida em {col}"
+            df[col] = datas.dt.strftime("%Y-%m-%dT%H:%M:%S" if hora else "%Y-%m-%d")
+        elif col in NUMERICAS:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        elif col in BOOLEANAS:
+            df[col] = df[col].astype(str).str.strip().str.lower().isin(["1", "true", "sim", "s", "yes"])
+
+    # tempoExame igual aos formulários: (laudo - solicitação) em minutos
+    if "tempoExame" in colunas:
+        laudo = pd.to_datetime(df["dataHoraLaudo"], errors="coerce", format="ISO8601")
+        solic = pd.to_datetime(df["dataHoraSolicitacao"], errors="coerce", format="ISO8601")
+        calculado = ((laudo - solic).dt.total_seconds() / 60).round(2)
+        df["tempoExame"] = calculado.fillna(df["tempoExame"])
+
+    df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"].fillna(""))
+    df["hospital"] = df["hospital"].fillna("").astype(str).str.strip()
+
+    motivo[df["numeroAtendimento"].isin(["", "nan", "<NA>"])] = "numeroAtendimento vazio"
+    motivo[(motivo == "") & ~df["hospital"].isin(HOSPITAIS)] = "hospital desconhecido"
+    if "linhaCuidado" in colunas:
+        motivo[(motivo == "") & ~df["linhaCuidado"].isin(LINHAS_CUIDADO)] = "linhaCuidado desconhecida"
+
+    ok = motivo == ""
+    return df[ok], bloco[~ok].assign(motivo=motivo[~ok])
+
+
+# --------------------------- Importação ----------------------------
+def importar(arquivo: str, etapa: str, mapa: dict = None, padroes: dict = None,
+             tamanho: int = BLOCO, rejeitados: str = None, saida=sys.stdout,
+             formatos: dict = None) -> dict:
+    """Importa o extrato na etapa; devolve os totais da execução."""
+    path = ETAPAS[etapa]
+    existentes = set(normalizar_chaves(
+        dados.carregar_csv(path, colunas=["numeroAtendimento"]).get(
+            "numeroAtendimento", pd.Series(dtype=object))))
+    # daqui em diante só as chaves importam: solta a tabela do cache para a
+    # memória não crescer com o arquivo (os appends não a recarregam)
+    dados.invalidar(path)
+
+    totais = {"lidas": 0, "gravadas": 0, "duplicadas": 0, "rejeitadas": 0}
+    inicio = time.perf_counter()
+    for bloco in ler_blocos(arquivo, tamanho):
+        totais["lidas"] += len(bloco)
+        validos, ruins = preparar(bloco, etapa, mapa, padroes, formatos)
+
+        # repetidos no bloco, em blocos anteriores ou já gravados
+        repetido = validos["numeroAtendimento"].duplicated() | \
+            validos["numeroAtendimento"].isin(existentes)
+        totais["duplicadas"] += int(repetido.sum())
+        validos = validos[~repetido]
+        existentes.update(validos["numeroAtendimento"])
+
+        dados.salvar_lote(path, validos)
+        totais["gravadas"] += len(validos)
+
+        if len(ruins):
+            totais["rejeitadas"] += len(ruins)
+            if rejeitados:
+                ruins.to_csv(rejeitados, mode="a", index=False,
+                             header=not os.path.exists(rejeitados))
+
+        seg = time.perf_counter() - inicio
+        print(f"{totais['lidas']:>10,} lidas | {totais['gravadas']:>10,} gravadas | "
+              f"{totais['lidas'] / seg:,.0f} linhas/s", file=saida)
+
+    totais["segundos"] = round(time.perf_counter() - inicio, 3)
+    totais["linhas_por_segundo"] = round(totais["lidas"] / max(totais["segundos"], 1e-9))
+    return totais
+
+
+def _pares(itens: list) -> dict:
+    pares = {}
+    for item in itens or []:
+        origem, _, destino = item.partition("=")
+        if not destino:
+            raise SystemExit(f"use coluna=valor, recebi {item!r}")
+        pares[origem] = destino
+    return pares
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa extrato de hospital para uma etapa.")
+    parser.add_argument("arquivo", help="extrato .csv ou .parquet")
+    parser.add_argument("--etapa", required=True, choices=list(ETAPAS))
+    parser.add_argument("--mapa", action="append", metavar="ORIGEM=DESTINO",
+                        help="renomeia coluna do extrato (pode repetir)")
+    parser.add_argument("--mapa-json", help="arquivo JSON {origem: destino}")
+    parser.add_argument("--hospital", help="hospital para linhas sem a coluna")
+    parser.add_argument("--padrao", action="append", metavar="COLUNA=VALOR",
+                        help="valor para coluna ausente/vazia (pode repetir)")
+    parser.add_argument("--bloco", type=int, default=BLOCO, help="linhas por bloco (padrão: %(default)s)")
+    parser.add_argument("--rejeitados", help="CSV onde gravar as linhas rejeitadas")
+    parser.add_argument("--formato-data", help='formato das datas, ex.: "%%d/%%m/%%Y" '
+                        "(padrão: dia primeiro ou ISO)")
+    parser.add_argument("--formato-data-hora", help='formato das datas com hora, ex.: '
+                        '"%%d/%%m/%%Y %%H:%%M" (padrão: dia primeiro ou ISO)')
+    args = parser.parse_args()
+
+    mapa = _pares(args.mapa)
+    if args.mapa_json:
+        with open(args.mapa_json, encoding="utf-8") as f:
+            mapa.update(json.load(f))
+    padroes = _pares(args.padrao)
+    if args.hospital:
+        padroes["hospital"] = args.hospital
+
+    formatos = {"data": args.formato_data, "datahora": args.formato_data_hora}
+    totais = importar(args.arquivo, args.etapa, mapa, padroes, args.bloco, args.rejeitados,
+                      formatos=formatos)
+    print(json.dumps(totais, ensure_ascii=False))
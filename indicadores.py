@@ -0,0 +1,140 @@
+# indicadores.py
+# ------------------------------------------------------------------
+# MOTOR DE INDICADORES DAS LINHAS DE CUIDADO
+#   • junta as etapas por numeroAtendimento (uma linha por atendimento)
+#   • calcula os KPIs com groupby vetorizado, sem laço por linha:
+#       - tempo de exame (PS e internação): p50 / p90
+#       - permanência real x prevista pelo DRG
+#       - tempo de UTI
+#       - taxa de reinternação e de mortalidade
+#   • resultado em cache até alguma etapa mudar (dados.assinatura)
+#   • com LINHAS_FLUXO=1 os KPIs saem de fluxo.py (leitura em blocos)
+# ------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from dados import ETAPAS, assinatura, carregar_csv, normalizar_chaves
+from perfil import medido
+
+GRUPOS = ["hospital", "linhaCuidado"]
+
+# colunas lidas de cada etapa -> nome na base de indicadores
+_COLUNAS = {
+    "Pronto Atendimento": {
+        "hospital": "hospital",
+        "linhaCuidado": "linhaCuidado",
+        "numeroAtendimento": "numeroAtendimento",
+        "status": "status",
+        "dataHoraInternacaoPS": "dataHoraInternacaoPS",
+        "tempoExame": "tempoExamePS",
+    },
+    "Internação": {
+        "numeroAtendimento": "numeroAtendimento",
+        "tempoExame": "tempoExameInternacao",
+        "tempoUTI": "tempoUTI",
+    },
+    "Permanência": {
+        "numeroAtendimento": "numeroAtendimento",
+        "permanenciaReal": "permanenciaReal",
+        "permanenciaPrevistaDRG": "permanenciaPrevistaDRG",
+    },
+    "Pós-Alta": {
+        "numeroAtendimento": "numeroAtendimento",
+        "reinternacao": "reinternacao",
+    },
+}
+_NUMERICAS = ["tempoExamePS", "tempoExameInternacao", "tempoUTI",
+              "permanenciaReal", "permanenciaPrevistaDRG"]
+
+_cache: dict = {}          # "base" | ("kpi", grupos) -> (assinaturas, DataFrame)
+_lock = threading.Lock()
+
+
+def _etapa(nome: str) -> pd.DataFrame:
+    mapa = _COLUNAS[nome]
+    df = carregar_csv(ETAPAS[nome], colunas=list(mapa))
+    df = df.rename(columns=mapa).reindex(columns=list(mapa.values()))
+    df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"])
+    # vale a 1ª linha de cada atendimento, como no fetch_row
+    return df.drop_duplicates("numeroAtendimento")
+
+
+@medido
+def base() -> pd.DataFrame:
+    """Uma linha por atendimento do PA com as colunas das outras etapas."""
+    df = _etapa("Pronto Atendimento")
+    for nome in ("Internação", "Permanência", "Pós-Alta"):
+        df = df.merge(_etapa(nome), on="numeroAtendimento", how="left")
+
+    for c in _NUMERICAS:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")   # Int32 -> NaN
+    df["dataHoraInternacaoPS"] = pd.to_datetime(
+        df["dataHoraInternacaoPS"], errors="coerce", format="ISO8601")
+    df["obito"] = (df["status"] == "Óbito").astype("float64")
+    # reinternação só conta para quem tem Pós-Alta preenchido
+    df["reinternado"] = np.where(df["reinternacao"].isin(["Sim", "Não"]),
+                                 (df["reinternacao"] == "Sim").astype("float64"), np.nan)
+    return df
+
+
+def calcular(df: pd.DataFrame, grupos: list = GRUPOS) -> pd.DataFrame:
+    """KPIs por grupo (ou da rede toda, com grupos=[])."""
+    grupos = list(grupos)
+    if not grupos:
+        df = df.assign(_rede=0)
+    chave = grupos or ["_rede"]
+    g = df.groupby(chave, observed=True, sort=True)
+
+    res = g.agg(
+        atendimentos=("numeroAtendimento", "size"),
+        permanenciaRealMedia=("permanenciaReal", "mean"),
+        permanenciaPrevistaMedia=("permanenciaPrevistaDRG", "mean"),
+        tempoUTIMedio=("tempoUTI", "mean"),
+        taxaReinternacao=("reinternado", "mean"),
+        taxaMortalidade=("obito", "mean"),
+    )
+    for col in ("tempoExamePS", "tempoExameInternacao"):
+        q = g[col].quantile([0.5, 0.9]).unstack().reindex(columns=[0.5, 0.9])
+        res[f"{col}P50"] = q[0.5]
+        res[f"{col}P90"] = q[0.9]
+
+    # razão real/prevista só entre quem tem as duas permanências
+    ambos = df[df["permanenciaReal"].notna() & (df["permanenciaPrevistaDRG"] > 0)]
+    soma = ambos.groupby(chave, observed=True)[["permanenciaReal", "permanenciaPrevistaDRG"]].sum()
+    res["razaoPermanencia"] = soma["permanenciaReal"] / soma["permanenciaPrevistaDRG"]
+
+    return res.reset_index(drop=not grupos)
+
+
+def _assinaturas() -> tuple:
+    return tuple(assinatura(ETAPAS[n]) for n in _COLUNAS)
+
+
+def base_atual() -> pd.DataFrame:
+    """base(), refeita só quando alguma etapa mudou."""
+    sig = _assinaturas()
+    with _lock:
+        if _cache.get("base", (None,))[0] == sig:
+            return _cache["base"][1]
+    df = base()
+    with _lock:
+        _cache["base"] = (sig, df)
+    return df
+
+
+@medido
+def indicadores(grupos: list = GRUPOS) -> pd.DataFrame:
+    """KPIs por grupo, recalculados só quando alguma etapa mudou."""
+    sig, chave = _assinaturas(), ("kpi", tuple(grupos))
+    with _lock:
+        if _cache.get(chave, (None,))[0] == sig:
+            return _cache[chave][1]
+    import fluxo                    # tardio: fluxo.py importa este módulo
+    # LINHAS_FLUXO=1: etapas lidas em blocos, sem a base inteira em memória
+    res = fluxo.indicadores(grupos)[0] if fluxo.ATIVO else calcular(base_atual(), grupos)
+    with _lock:
+        _cache[chave] = (sig, res)
+    return res
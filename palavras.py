@@ -0,0 +1,244 @@
+# palavras.py
+# ------------------------------------------------------------------
+# ÍNDICE INVERTIDO DE PALAVRAS DOS TEXTOS LIVRES
+#   • nome do paciente (Pronto Atendimento), procedimento cirúrgico
+#     (Tratamento), observação (Pós-Alta) e as observações dos
+#     questionários de 7/30/60/90 dias
+#   • palavra -> {numeroAtendimento: peso}, sem acento nem caixa; o peso
+#     soma as ocorrências × o peso do campo (nome vale mais que observação)
+#   • procurar("fem fratura"): toda palavra digitada tem de aparecer; a
+#     última vale como prefixo (digitação em andamento); nota = Σ peso ×
+#     idf, só os N melhores são montados
+#   • construção vetorizada; depois cada save_csv / atualizar_registro
+#     das quatro etapas tira as palavras antigas do atendimento e põe as
+#     novas (mesmo esquema de ganchos do cubo.py)
+#   • etapas mudadas por fora (outro processo) -> índice refeito
+# ------------------------------------------------------------------
+
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import dados
+from busca import _normalizar, normalizar_texto
+from dados import ETAPAS, carregar_csv, fetch_row, normalizar_chaves
+from perfil import medido
+
+# etapa -> {campo: peso}
+CAMPOS = {
+    "Pronto Atendimento": {"nomePaciente": 3.0},
+    "Tratamento": {"procedimentoCirurgico": 2.0},
+    "Pós-Alta": {"observacao": 1.0},
+    "Questionários": {f"observacaoQuestionarioPaciente{d}": 1.0 for d in (7, 30, 60, 90)},
+}
+PA_PATH = ETAPAS["Pronto Atendimento"]
+COLUNAS_PA = ["hospital", "linhaCuidado", "numeroAtendimento", "nomePaciente", "numeroDRG"]
+LIMITE = 20
+# prefixo mais curto que isso só casa com a palavra inteira
+MIN_PREFIXO = 2
+# lotes maiores que isso invalidam o índice em vez de atualizá-lo por atendimento
+LIMITE_INCREMENTAL = 1000
+_PALAVRA = re.compile(r"[a-z0-9]+")
+# não entram no índice nem na consulta
+PALAVRAS_VAZIAS = {"a", "o", "as", "os", "e", "de", "da", "do", "das", "dos",
+                   "em", "na", "no", "com", "sem", "para", "por", "um", "uma"}
+
+# como em agenda.py: _lock nunca é tomado antes de chamar dados.py
+_lock = threading.RLock()
+_estado = {"assinaturas": None, "postagens": None, "vocabulario": [], "n": 0}
+
+
+def _assinaturas(exceto: str = None) -> tuple:
+    # exceto: etapa sendo gravada; ela e as que dividem o destino com ela
+    # ficam de fora (o gancho confere só as outras)
+    return tuple(None if exceto and dados.destino(ETAPAS[e]) == dados.destino(exceto)
+                 else dados.assinatura(ETAPAS[e]) for e in CAMPOS)
+
+
+def _palavras(texto: str) -> list:
+    """Palavras normalizadas de um texto, sem as vazias."""
+    return [p for p in _PALAVRA.findall(_normalizar(texto)) if p not in PALAVRAS_VAZIAS]
+
+
+# --------------------------- Construção ----------------------------
+def _pesos_da_etapa(etapa: str) -> pd.DataFrame:
+    """(palavra, chave, peso) de todas as linhas da etapa, vetorizado."""
+    campos = CAMPOS[etapa]
+    df = carregar_csv(ETAPAS[etapa], colunas=["numeroAtendimento", *campos])
+    df = df.reindex(columns=["numeroAtendimento", *campos])
+    df["numeroAtendimento"] = normalizar_chaves(df["numeroAtendimento"])
+    # vale a 1ª linha de cada atendimento, como no fetch_row
+    df = df.drop_duplicates("numeroAtendimento")
+    partes = []
+    for campo, peso in campos.items():
+        palavras = normalizar_texto(df[campo]).str.findall(_PALAVRA)
+        partes.append(pd.DataFrame({"palavra": palavras,
+                                    "chave": df["numeroAtendimento"].to_numpy()})
+                        .explode("palavra").dropna().assign(peso=peso))
+    return pd.concat(partes, ignore_index=True)
+
+
+def reconstruir():
+    """Refaz o índice inteiro a partir das etapas."""
+    sig = _assinaturas()
+    tudo = pd.concat([_pesos_da_etapa(e) for e in CAMPOS], ignore_index=True)
+    tudo = tudo[~tudo["palavra"].isin(PALAVRAS_VAZIAS)]
+    soma = tudo.groupby(["palavra", "chave"], sort=True)["peso"].sum()
+    n = carregar_csv(PA_PATH, colunas=["numeroAtendimento"])["numeroAtendimento"].nunique()
+
+    palavras = soma.index.get_level_values(0).to_numpy()
+    chaves = soma.index.get_level_values(1).to_numpy()
+    pesos = soma.to_numpy()
+    # índice ordenado por palavra: cada palavra é um trecho contíguo
+    cortes = np.flatnonzero(palavras[1:] != palavras[:-1]) + 1
+    postagens = {palavras[i]: dict(zip(chaves[i:j].tolist(), pesos[i:j].tolist()))
+                 for i, j in zip(np.r_[0, cortes], np.r_[cortes, len(palavras)])
+                 if j > i}
+    with _lock:
+        _estado.update(assinaturas=sig, postagens=postagens,
+                       vocabulario=sorted(postagens), n=n)
+
+
+def _garantir():
+    with _lock:
+        em_dia = _estado["assinaturas"] == _assinaturas()
+    if not em_dia:
+        reconstruir()
+
+
+# --------------------------- Atualização incremental ---------------
+def _documento(etapa: str, chave) -> Counter:
+    """palavra -> peso do atendimento na etapa (lido pelo índice)."""
+    linha = fetch_row(ETAPAS[etapa], chave)
+    doc = Counter()
+    for campo, peso in CAMPOS[etapa].items():
+        valor = linha.get(campo)
+        if valor is not None and not pd.isna(valor):
+            for p in _palavras(valor):
+                doc[p] += peso
+    return doc
+
+
+def _no_pa(chave) -> bool:
+    """O atendimento já tem linha no Pronto Atendimento? (conta para o idf)"""
+    valor = fetch_row(PA_PATH, chave).get("numeroAtendimento")
+    return valor is not None and not pd.isna(valor) and str(valor) != ""
+
+
+def _somar(chave: str, doc: Counter, sinal: float):
+    postagens, vocabulario = _estado["postagens"], _estado["vocabulario"]
+    for palavra, peso in doc.items():
+        lista = postagens.get(palavra)
+        if lista is None:
+            lista = postagens[palavra] = {}
+            insort(vocabulario, palavra)
+        novo = lista.get(chave, 0.0) + sinal * peso
+        if novo > 1e-9:
+            lista[chave] = novo
+        else:
+            lista.pop(chave, None)
+            if not lista:
+                del postagens[palavra]
+                del vocabulario[bisect_left(vocabulario, palavra)]
+
+
+def _gancho(path: str, lote: pd.DataFrame):
+    # roda sob o lock de gravação de dados.py (ver _notificando)
+    etapa = next((e for e in CAMPOS if ETAPAS[e] == path), None)
+    if etapa is None or "numeroAtendimento" not in lote:
+        return None
+    outras = _assinaturas(exceto=path)
+    if _estado["postagens"] is None or _estado["assinaturas"] != _assinaturas():
+        return None                       # já desatualizado: refeito na próxima consulta
+    if len(lote) > LIMITE_INCREMENTAL:
+        return lambda: _estado.update(assinaturas=None)
+    chaves = set(normalizar_chaves(lote["numeroAtendimento"]))
+    antes = {c: _documento(etapa, c) for c in chaves}
+    no_pa = {c: _no_pa(c) for c in chaves} if path == PA_PATH else {}
+
+    def depois():
+        with _lock:
+            try:
+                agora = _assinaturas()
+                if _assinaturas(exceto=path) != outras:
+                    # outra etapa gravada em paralelo mudou o atendimento
+                    # depois do antes: refeito na próxima consulta
+                    _estado["assinaturas"] = None
+                    return
+                for c, velho in antes.items():
+                    _somar(c, velho, -1.0)
+                    _somar(c, _documento(etapa, c), +1.0)
+                # atendimento novo no PA muda o total de documentos do idf
+                _estado["n"] += sum(_no_pa(c) - estava for c, estava in no_pa.items())
+                _estado["assinaturas"] = agora
+            except Exception:
+                # o registro já foi salvo; o índice é refeito na próxima consulta
+                _estado["assinaturas"] = None
+    return depois
+
+
+dados.registrar_gancho(_gancho)
+
+
+# --------------------------- Consulta ------------------------------
+def _notas(palavra: str, prefixo: bool) -> dict:
+    """chave -> nota da palavra (a melhor das palavras com o prefixo)."""
+    postagens, n = _estado["postagens"], max(_estado["n"], 1)
+    if prefixo and len(palavra) >= MIN_PREFIXO:
+        vocabulario = _estado["vocabulario"]
+        i = bisect_left(vocabulario, palavra)
+        j = bisect_left(vocabulario, palavra[:-1] + chr(ord(palavra[-1]) + 1))
+        termos = vocabulario[i:j]
+    else:
+        termos = [palavra] if palavra in postagens else []
+    notas: dict = {}
+    for t in termos:
+        lista = postagens[t]
+        idf = math.log(1 + n / len(lista))
+        for chave, peso in lista.items():
+            nota = peso * idf
+            if nota > notas.get(chave, 0.0):
+                notas[chave] = nota
+    return notas
+
+
+@medido
+def procurar(consulta: str, filtros: dict = None, limite: int = LIMITE) -> pd.DataFrame:
+    """Os `limite` atendimentos que melhor casam com as palavras da consulta.
+
+    Devolve as colunas do PA (COLUNAS_PA) + `nota`, da maior para a menor."""
+    palavras = _palavras(consulta)
+    vazio = pd.DataFrame(columns=COLUNAS_PA + ["nota"])
+    if not palavras:
+        return vazio
+    _garantir()
+    with _lock:
+        # da lista mais curta para a mais longa: a interseção encolhe logo
+        listas = sorted((_notas(p, i == len(palavras) - 1) for i, p in enumerate(palavras)),
+                        key=len)
+        notas = dict(listas[0])
+        for lista in listas[1:]:
+            notas = {c: v + lista[c] for c, v in notas.items() if c in lista}
+    if not notas:
+        return vazio
+
+    filtros = {c: v for c, v in (filtros or {}).items() if v not in ("", None)}
+    if filtros:
+        permitidos = set(normalizar_chaves(
+            carregar_csv(PA_PATH, colunas=["numeroAtendimento"], filtros=filtros)["numeroAtendimento"]))
+        notas = {c: v for c, v in notas.items() if c in permitidos}
+
+    # empate: menor nº de atendimento primeiro
+    melhores = heapq.nsmallest(limite, notas.items(), key=lambda cv: (-cv[1], cv[0]))
+    linhas = []
+    for chave, nota in melhores:
+        linha = fetch_row(PA_PATH, chave).reindex(COLUNAS_PA)
+        linha["numeroAtendimento"] = chave
+        linhas.append({**linha.to_dict(), "nota": round(nota, 3)})
+    return pd.DataFrame(linhas, columns=COLUNAS_PA + ["nota"])
@@ -0,0 +1,175 @@
+# perfil.py
+# ------------------------------------------------------------------
+# INSTRUMENTAÇÃO DOS CAMINHOS QUENTES (carga, busca, gravação, filtros,
+# montagem dos formulários)
+#   • ligada por LINHAS_PERFIL: "1" grava em perfil.jsonl, outro valor
+#     é o caminho do log; vazia/"0" = desligada
+#   • desligada não custa nada: @medido devolve a própria função e
+#     trecho() um contexto vazio compartilhado
+#   • cada trecho vira uma linha JSON no log: rerun, rótulo (menu),
+#     nome, etapa, nível de aninhamento, ms, linhas, thread
+#   • rerun(rotulo) no topo do app abre o rerun da thread do script;
+#     trechos fora de rerun (gravadora, API) saem com rerun = null
+#   • últimos eventos em memória para o painel de admin da sidebar:
+#     reruns recentes (reruns()) e p50/p95 por trecho/etapa (resumo())
+# ------------------------------------------------------------------
+
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import pandas as pd
+
+_CONFIG = os.environ.get("LINHAS_PERFIL", "").strip()
+ATIVO = _CONFIG not in ("", "0")
+ARQUIVO = "perfil.jsonl" if _CONFIG in ("", "0", "1") else _CONFIG
+MAX_EVENTOS = 20_000            # guardados em memória para o painel
+
+_eventos: deque = deque(maxlen=MAX_EVENTOS)
+_local = threading.local()      # rerun / rótulo / nível da thread
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_saida = {"arquivo": None}
+_NADA = nullcontext()
+
+
+# --------------------------- Registro ------------------------------
+def _gravar(evento: dict):
+    linha = json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        _eventos.append(evento)
+        if _saida["arquivo"] is None:
+            _saida["arquivo"] = open(ARQUIVO, "a", encoding="utf-8", buffering=1)
+        _saida["arquivo"].write(linha)
+
+
+def _evento(nome: str, etapa, nivel: int, inicio: float, linhas, erro) -> dict:
+    evento = {"ts": datetime.now().isoformat(timespec="milliseconds"),
+              "rerun": getattr(_local, "rerun", None),
+              "rotulo": getattr(_local, "rotulo", None),
+              "trecho": nome, "etapa": etapa, "nivel": nivel,
+              "ms": round((time.perf_counter() - inicio) * 1000, 3),
+              "linhas": linhas, "thread": threading.current_thread().name}
+    if erro is not None:
+        evento["erro"] = type(erro).__name__
+    return evento
+
+
+def _linhas_df(resultado, *args, **kwargs):
+    """Nº de linhas quando a função devolve uma tabela."""
+    return len(resultado) if getattr(resultado, "ndim", None) == 2 else None
+
+
+def _etapa(args) -> str:
+    """Arquivo da etapa quando o 1º argumento é o path (dados.py)."""
+    if args and isinstance(args[0], str) and args[0].endswith(".csv"):
+        return os.path.basename(args[0])
+    return None
+
+
+def rerun(rotulo: str = ""):
+    """Abre um rerun novo na thread atual (topo do script do Streamlit)."""
+    if not ATIVO:
+        return
+    _local.rerun = next(_ids)
+    _local.rotulo = rotulo
+    _local.nivel = 0
+
+
+@contextmanager
+def _medindo(nome: str, etapa, linhas):
+    nivel = getattr(_local, "nivel", 0)
+    _local.nivel = nivel + 1
+    inicio, erro = time.perf_counter(), None
+    try:
+        yield
+    except BaseException as e:          # st.stop() também passa por aqui
+        erro = e
+        raise
+    finally:
+        _local.nivel = nivel
+        _gravar(_evento(nome, etapa, nivel, inicio, linhas, erro))
+
+
+def trecho(nome: str, etapa: str = None, linhas: int = None):
+    """Contexto que mede o bloco:  with st.form(...), trecho("form x"):"""
+    return _medindo(nome, etapa, linhas) if ATIVO else _NADA
+
+
+def medido(funcao=None, *, nome: str = None, linhas=_linhas_df):
+    """Decorador que mede cada chamada da função.
+
+    `linhas(resultado, *args, **kwargs)` dá o nº de linhas do evento
+    (padrão: len do DataFrame devolvido). Desligado, a função volta
+    intacta."""
+    def decorar(f):
+        if not ATIVO:
+            return f
+        nome_trecho = nome or f"{f.__module__}.{f.__name__}"
+
+        @functools.wraps(f)
+        def medida(*args, **kwargs):
+            nivel = getattr(_local, "nivel", 0)
+            _local.nivel = nivel + 1
+            inicio, erro, n = time.perf_counter(), None, None
+            try:
+                resultado = f(*args, **kwargs)
+                n = linhas(resultado, *args, **kwargs) if linhas else None
+                return resultado
+            except BaseException as e:
+                erro = e
+                raise
+            finally:
+                _local.nivel = nivel
+                _gravar(_evento(nome_trecho, _etapa(args), nivel, inicio, n, erro))
+        return medida
+
+    return decorar(funcao) if funcao is not None else decorar
+
+
+# --------------------------- Painel --------------------------------
+def eventos() -> pd.DataFrame:
+    """Eventos em memória (os mais recentes, até MAX_EVENTOS)."""
+    with _lock:
+        return pd.DataFrame(list(_eventos))
+
+
+def reruns(n: int = 20) -> pd.DataFrame:
+    """Últimos `n` reruns: tempo medido (soma dos trechos de nível 0),
+    nº de trechos e o trecho mais lento."""
+    ev = eventos()
+    if ev.empty or ev["rerun"].isna().all():
+        return pd.DataFrame(columns=["rerun", "rotulo", "inicio", "ms", "trechos", "mais_lento"])
+    ev = ev[ev["rerun"].notna()]
+    topo = ev[ev["nivel"] == 0]
+    lento = ev.loc[ev.groupby("rerun")["ms"].idxmax(), ["rerun", "trecho"]]
+    tab = (ev.groupby("rerun")
+             .agg(rotulo=("rotulo", "first"), inicio=("ts", "min"), trechos=("trecho", "size"))
+             .join(topo.groupby("rerun")["ms"].sum())
+             .join(lento.set_index("rerun")["trecho"].rename("mais_lento"))
+             .reset_index())
+    tab["rerun"] = tab["rerun"].astype(int)
+    return tab.sort_values("rerun", ascending=False).head(n)[
+        ["rerun", "rotulo", "inicio", "ms", "trechos", "mais_lento"]]
+
+
+def resumo() -> pd.DataFrame:
+    """p50 / p95 / máx (ms) e linhas por trecho e etapa."""
+    ev = eventos()
+    if ev.empty:
+        return pd.DataFrame(columns=["trecho", "etapa", "n", "p50_ms", "p95_ms",
+                                     "max_ms", "linhas"])
+    ev["etapa"] = ev["etapa"].fillna("")
+    g = ev.groupby(["trecho", "etapa"])
+    tab = pd.DataFrame({"n": g.size(),
+                        "p50_ms": g["ms"].quantile(0.5),
+                        "p95_ms": g["ms"].quantile(0.95),
+                        "max_ms": g["ms"].max(),
+                        "linhas": g["linhas"].last().astype("Int64")}).reset_index()
+    return tab.sort_values("p95_ms", ascending=False)
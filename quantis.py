@@ -0,0 +1,328 @@
+# quantis.py
+# ------------------------------------------------------------------
+# ESBOÇOS DE QUANTIS  medida × hospital × linhaCuidado × mês
+#   • medidas: tempo de exame PS e internação, permanência real
+#   • esboço = contagem por faixa logarítmica (estilo DDSketch): a faixa
+#     k guarda os valores em (MINIMO·γ^(k-1), MINIMO·γ^k], γ = (1+α)/(1-α);
+#     o quantil devolvido tem erro relativo ≤ ERRO_RELATIVO (α)
+#   • esboços se somam: juntar hospitais, linhas ou meses é somar as
+#     contagens das faixas; p50/p90/p99 saem de umas centenas de faixas,
+#     não importa quantos atendimentos há no histórico
+#   • contagem também se subtrai: cada save_csv / atualizar_registro
+#     tira do esboço o valor antigo do atendimento e põe o novo (como
+#     no cubo.py; t-digest/KLL não aceitariam a edição)
+#   • gravado em quantis_indicadores.parquet junto com a assinatura das
+#     etapas; se elas mudarem por fora, os esboços são reconstruídos
+#   • save mexe só nos esboços em memória: o parquet é regravado uma vez
+#     por rajada de saves (ATRASO_GRAVACAO s depois da primeira) e na saída
+#   • reconstrução completa:  python quantis.py
+# ------------------------------------------------------------------
+
+import atexit
+import json
+import math
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import dados
+from dados import ETAPAS, fetch_row, normalizar_chaves
+from perfil import medido
+
+ARQUIVO = "quantis_indicadores.parquet"
+
+DIMENSOES = ["medida", "hospital", "linhaCuidado", "mes"]
+# medida -> (etapa, coluna)
+MEDIDAS = {
+    "tempoExamePS":         ("Pronto Atendimento", "tempoExame"),
+    "tempoExameInternacao": ("Internação", "tempoExame"),
+    "permanenciaReal":      ("Permanência", "permanenciaReal"),
+}
+QUANTIS = (0.5, 0.9, 0.99)
+ERRO_RELATIVO = 0.01
+# |valor| abaixo disso cai na faixa 0 (vale 0)
+MINIMO = 1e-3
+_GAMA = (1 + ERRO_RELATIVO) / (1 - ERRO_RELATIVO)
+_LOG_GAMA = math.log(_GAMA)
+_FONTES = ["Pronto Atendimento", "Internação", "Permanência"]
+# lotes maiores que isso invalidam os esboços em vez de atualizá-los por atendimento
+LIMITE_INCREMENTAL = 1000
+# segundos entre o primeiro save de uma rajada e a regravação do parquet
+ATRASO_GRAVACAO = 5.0
+
+# como em agenda.py: _lock nunca é tomado antes de chamar dados.py
+_lock = threading.RLock()
+_estado = {"assinaturas": None, "celulas": None, "df": None, "timer": None}
+
+
+def _assinaturas(exceto: str = None) -> str:
+    # exceto: etapa sendo gravada; ela e as que dividem o destino com ela
+    # ficam de fora (o gancho confere só as outras)
+    return json.dumps([None if exceto and dados.destino(ETAPAS[e]) == dados.destino(exceto)
+                       else dados.assinatura(ETAPAS[e]) for e in _FONTES])
+
+
+# --------------------------- Faixas --------------------------------
+def faixa(valores) -> np.ndarray:
+    """Faixa de cada valor: +k / -k (positivos / negativos), 0 perto de zero."""
+    x = np.asarray(valores, dtype="float64")
+    k = np.ceil(np.log(np.maximum(np.abs(x), MINIMO) / MINIMO) / _LOG_GAMA)
+    return (np.sign(x) * k).astype(np.int64)
+
+
+def valor(faixas) -> np.ndarray:
+    """Valor que representa a faixa (erro relativo ≤ α para todo valor dela)."""
+    k = np.asarray(faixas, dtype="float64")
+    return np.sign(k) * MINIMO * 2 * _GAMA ** np.abs(k) / (_GAMA + 1)
+
+
+def _mes(datas) -> pd.Series:
+    datas = pd.to_datetime(pd.Series(datas), errors="coerce", format="ISO8601")
+    return datas.dt.to_period("M").dt.to_timestamp()
+
+
+# --------------------------- Construção ----------------------------
+def _calcular_celulas() -> dict:
+    """Esboços de todas as células a partir das etapas, vetorizado."""
+    from indicadores import base
+
+    df = base()
+    df["mes"] = _mes(df["dataHoraInternacaoPS"]).to_numpy()
+    df = df.dropna(subset=["hospital", "linhaCuidado", "mes"])
+    df = df[(df["hospital"] != "") & (df["linhaCuidado"] != "")]
+
+    partes = []
+    for m in MEDIDAS:
+        ok = df[df[m].notna()]
+        partes.append(pd.DataFrame({"medida": m, "hospital": ok["hospital"].astype(object),
+                                    "linhaCuidado": ok["linhaCuidado"].astype(object),
+                                    "mes": ok["mes"], "faixa": faixa(ok[m])}))
+    tudo = pd.concat(partes, ignore_index=True)
+    contagem = tudo.groupby(DIMENSOES + ["faixa"], sort=True).size()
+    celulas: dict = {}
+    for (*cel, k), n in contagem.items():
+        celulas.setdefault(tuple(cel), Counter())[k] = int(n)
+    return celulas
+
+
+def _tabela(celulas: dict) -> pd.DataFrame:
+    """Células em formato longo: DIMENSOES + faixa + n."""
+    linhas = [(*cel, k, n) for cel, cont in celulas.items() for k, n in cont.items()]
+    df = pd.DataFrame(linhas, columns=DIMENSOES + ["faixa", "n"])
+    df["mes"] = pd.to_datetime(df["mes"])
+    df = df.astype({"faixa": "int64", "n": "int64"})
+    return df.sort_values(DIMENSOES + ["faixa"], ignore_index=True)
+
+
+def _gravar():
+    _estado["df"] = _tabela(_estado["celulas"])
+    tabela = pa.Table.from_pandas(_estado["df"], preserve_index=False).replace_schema_metadata(
+        {"assinaturas": _estado["assinaturas"]})
+    tmp = ARQUIVO + ".tmp"
+    pq.write_table(tabela, tmp)
+    os.replace(tmp, ARQUIVO)
+
+
+def _adiar_gravacao():
+    # chamado sob _lock, como em cubo.py: um timer por rajada de saves
+    if _estado["timer"] is None:
+        _estado["timer"] = threading.Timer(ATRASO_GRAVACAO, gravar_pendente)
+        _estado["timer"].daemon = True
+        _estado["timer"].start()
+
+
+def gravar_pendente():
+    """Grava no parquet os esboços que só foram atualizados em memória."""
+    with _lock:
+        timer, _estado["timer"] = _estado["timer"], None
+        if timer is None:
+            return
+        timer.cancel()
+        if _estado["assinaturas"] is not None:      # desatualizados: nada a gravar
+            _gravar()
+
+
+def _na_saida():
+    dados.descarregar()         # gravações em segundo plano ainda passam pelo gancho
+    gravar_pendente()
+
+
+atexit.register(_na_saida)
+
+
+def _ler_gravado(sig: str):
+    try:
+        tabela = pq.read_table(ARQUIVO)
+    except (FileNotFoundError, OSError):
+        return None
+    meta = tabela.schema.metadata or {}
+    if meta.get(b"assinaturas", b"").decode() != sig:
+        return None
+    df = tabela.to_pandas()
+    celulas: dict = {}
+    for *cel, k, n in df[DIMENSOES + ["faixa", "n"]].itertuples(index=False):
+        celulas.setdefault(tuple(cel), Counter())[int(k)] = int(n)
+    return celulas
+
+
+def reconstruir():
+    """Refaz os esboços a partir das etapas e grava no disco."""
+    # assinatura tirada antes da leitura: se alguém gravar no meio, a
+    # próxima consulta vê a diferença e refaz de novo
+    sig = _assinaturas()
+    celulas = _calcular_celulas()
+    with _lock:
+        _estado.update(assinaturas=sig, celulas=celulas, df=None)
+        _gravar()
+
+
+def _garantir():
+    sig = _assinaturas()
+    with _lock:
+        if _estado["assinaturas"] == sig:
+            return
+        celulas = _ler_gravado(sig)
+        if celulas is not None:
+            _estado.update(assinaturas=sig, celulas=celulas, df=None)
+            return
+    reconstruir()
+
+
+# --------------------------- Atualização incremental ---------------
+def _contribuicao(chave) -> list:
+    """[(célula, faixa)] do atendimento, lido das etapas pelo índice."""
+    pa_ = fetch_row(ETAPAS["Pronto Atendimento"], chave)
+    hospital, linha = pa_.get("hospital"), pa_.get("linhaCuidado")
+    mes = _mes([pa_.get("dataHoraInternacaoPS")]).iloc[0]
+    if pd.isna(hospital) or pd.isna(linha) or hospital == "" or linha == "" or pd.isna(mes):
+        return []
+
+    linhas = {"Pronto Atendimento": pa_}
+    itens = []
+    for m, (etapa, coluna) in MEDIDAS.items():
+        if etapa not in linhas:
+            linhas[etapa] = fetch_row(ETAPAS[etapa], chave)
+        x = pd.to_numeric(linhas[etapa].get(coluna), errors="coerce")
+        if pd.notna(x):
+            itens.append(((m, hospital, linha, mes), int(faixa(x))))
+    return itens
+
+
+def _somar(itens: list, sinal: int):
+    celulas = _estado["celulas"]
+    for cel, k in itens:
+        cont = celulas.setdefault(cel, Counter())
+        cont[k] += sinal
+        if cont[k] <= 0:
+            del cont[k]
+            if not cont:
+                del celulas[cel]            # célula sem valores some
+
+
+def _gancho(path: str, lote: pd.DataFrame):
+    # roda sob o lock de gravação de dados.py (ver _notificando)
+    if path not in (ETAPAS[e] for e in _FONTES) or "numeroAtendimento" not in lote:
+        return None
+    outras = _assinaturas(exceto=path)
+    if _estado["celulas"] is None or _estado["assinaturas"] != _assinaturas():
+        return None                       # já desatualizado: refeito na próxima consulta
+    if len(lote) > LIMITE_INCREMENTAL:
+        return lambda: _estado.update(assinaturas=None)
+    chaves = set(normalizar_chaves(lote["numeroAtendimento"]))
+    antes = {c: _contribuicao(c) for c in chaves}
+
+    def depois():
+        with _lock:
+            try:
+                agora = _assinaturas()
+                if _assinaturas(exceto=path) != outras:
+                    # outra etapa gravada em paralelo mudou o atendimento
+                    # depois do antes: refeito na próxima consulta
+                    _estado["assinaturas"] = None
+                    return
+                for c, velho in antes.items():
+                    _somar(velho, -1)
+                    _somar(_contribuicao(c), +1)
+                _estado.update(assinaturas=agora, df=None)
+                _adiar_gravacao()
+            except Exception:
+                # o registro já foi salvo; os esboços são refeitos na próxima consulta
+                _estado["assinaturas"] = None
+    return depois
+
+
+dados.registrar_gancho(_gancho)
+
+
+# --------------------------- Consulta ------------------------------
+@medido
+def esbocos() -> pd.DataFrame:
+    """Todos os esboços em formato longo (DIMENSOES + faixa + n)."""
+    _garantir()
+    with _lock:
+        if _estado["df"] is None:
+            _estado["df"] = _tabela(_estado["celulas"])
+        return _estado["df"]
+
+
+def quantis_do_esboco(faixas, contagens, quantis=QUANTIS) -> list:
+    """Quantis de um esboço (faixas crescentes e suas contagens)."""
+    acumulado = np.cumsum(contagens)
+    if not len(acumulado) or acumulado[-1] <= 0:
+        return [np.nan] * len(quantis)
+    n = acumulado[-1]
+    # posição q·(n-1) na amostra ordenada; a faixa dela dá o valor
+    pos = [np.searchsorted(acumulado, math.floor(q * (n - 1)), side="right") for q in quantis]
+    return list(valor(np.asarray(faixas)[pos]))
+
+
+@medido
+def percentis(grupos: list = ("hospital", "linhaCuidado"), inicio=None, fim=None,
+              filtros: dict = None, quantis=QUANTIS) -> pd.DataFrame:
+    """p50/p90/p99 (QUANTIS) de cada medida por `grupos`, juntando os
+    esboços dos meses que tocam [inicio, fim].
+
+    Colunas: grupos + n_<medida> + <medida>P50 / P90 / P99."""
+    df = esbocos()
+    if inicio is not None:
+        df = df[df["mes"] >= pd.Timestamp(inicio).to_period("M").to_timestamp()]
+    if fim is not None:
+        df = df[df["mes"] <= pd.Timestamp(fim)]
+    for col, v in (filtros or {}).items():
+        if v not in ("", None):
+            df = df[df[col] == v]
+
+    grupos = list(grupos)
+    if not grupos:
+        df = df.assign(_rede=0)
+    chave = grupos or ["_rede"]
+    nomes = [f"P{round(q * 100)}" for q in quantis]
+    colunas = [c for m in MEDIDAS for c in (f"n_{m}", *(f"{m}{p}" for p in nomes))]
+    if df.empty:
+        return pd.DataFrame(columns=grupos + colunas)
+
+    # um esboço por (grupo, medida): soma das células, faixa a faixa
+    soma = df.groupby(chave + ["medida", "faixa"], sort=True)["n"].sum()
+    linhas = []
+    for cel, esboco in soma.groupby(level=list(range(len(chave) + 1)), sort=True):
+        valores = quantis_do_esboco(esboco.index.get_level_values("faixa"),
+                                    esboco.to_numpy(), quantis)
+        linhas.append((*cel, int(esboco.sum()), *valores))
+
+    largo = (pd.DataFrame(linhas, columns=chave + ["medida", "n"] + nomes)
+               .set_index(chave + ["medida"]).unstack("medida"))
+    largo.columns = [f"n_{m}" if p == "n" else f"{m}{p}" for p, m in largo.columns]
+    largo = largo.reindex(columns=colunas)
+    for m in MEDIDAS:
+        largo[f"n_{m}"] = largo[f"n_{m}"].fillna(0).astype(np.int64)
+    return largo.reset_index(drop=not grupos)
+
+
+if __name__ == "__main__":
+    reconstruir()
+    print(f"{ARQUIVO}: {len(_estado['celulas'])} células, {len(esbocos())} faixas")
@@ -0,0 +1,94 @@
+# conftest.py
+# ------------------------------------------------------------------
+# FIXTURES DOS TESTES
+#   • etapas: diretório temporário (cwd do teste) com as 6 etapas
+#     geradas por benchmark.gerar, cache de dados.py zerado
+#   • gravacoes_variadas: saves e edições nas etapas que alimentam os
+#     ganchos (cubo, quantis, agenda, palavras)
+#   • rodar da raiz do repositório:  python -m pytest -q
+# ------------------------------------------------------------------
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+import dados  # noqa: E402
+
+ATENDIMENTOS = 300
+
+
+@pytest.fixture
+def etapas(tmp_path, monkeypatch):
+    """Etapas sintéticas em tmp_path, que vira o diretório corrente."""
+    benchmark.gerar(ATENDIMENTOS, str(tmp_path), semente=0)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dados, "BACKEND", "csv")
+    monkeypatch.setattr(dados, "JANELA_GRUPO", 0.001)
+    dados.invalidar()
+    yield tmp_path
+    dados.descarregar()
+    dados.invalidar()
+
+
+def recarregado(path: str) -> pd.DataFrame:
+    """A etapa lida do zero, sem o cache do processo."""
+    dados.invalidar(path)
+    return dados.carregar_csv(path)
+
+
+def mesma_tabela(a: pd.DataFrame, b: pd.DataFrame):
+    """Mesmas linhas (em qualquer ordem) e mesmos valores."""
+    chave = ["numeroAtendimento"]
+    a = a.sort_values(chave, kind="stable").reset_index(drop=True)
+    b = b.sort_values(chave, kind="stable").reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b[a.columns], check_dtype=False,
+                                  check_categorical=False)
+
+
+def gravacoes_variadas():
+    """Atendimento novo em todas as etapas + edições que mudam célula,
+    medidas, datas e textos; parte em segundo plano (esperando cada uma:
+    gravação de outra etapa no meio faria o gancho só marcar desatualizado).
+    Volta com tudo gravado."""
+    e = dados.ETAPAS
+    chaves = list(dados.carregar_csv(e["Pronto Atendimento"])["numeroAtendimento"].iloc[:6])
+    novo = {"hospital": "HUC", "numeroAtendimento": "99990001"}
+
+    dados.save_csv(e["Pronto Atendimento"], {**novo, "linhaCuidado": "AVC",
+                                             "nomePaciente": "José Fêmur",
+                                             "dataHoraInternacaoPS": "2025-03-01T10:00:00",
+                                             "tempoExame": 40})
+    dados.save_csv(e["Internação"], {**novo, "tempoExame": 12, "tempoUTI": 2})
+    dados.save_csv(e["Permanência"], {**novo, "permanenciaReal": 5, "dataAlta": "2025-03-06"},
+                   esperar=False)
+    dados.descarregar()
+    dados.save_csv(e["Tratamento"], {**novo, "procedimentoCirurgico": "Artroplastia de quadril"})
+    dados.save_csv(e["Questionários"], {**novo, "dataQuestionarioPaciente7": "2025-03-13",
+                                        "observacaoQuestionarioPaciente7": "sem dor"})
+
+    dados.atualizar_registro(e["Pronto Atendimento"], {"numeroAtendimento": chaves[0],
+                                                       "hospital": "PUCC", "linhaCuidado": "ICC"})
+    dados.atualizar_registro(e["Pronto Atendimento"], {"numeroAtendimento": chaves[1],
+                                                       "dataHoraInternacaoPS": "2025-01-15T08:00:00",
+                                                       "nomePaciente": "Ana Beatriz Fêmur"},
+                             esperar=False)
+    dados.descarregar()
+    dados.atualizar_lote(e["Internação"], [{"numeroAtendimento": c, "tempoExame": 10 * i,
+                                            "tempoUTI": i} for i, c in enumerate(chaves[2:5])])
+    dados.atualizar_registro(e["Permanência"], {"numeroAtendimento": chaves[2],
+                                                "permanenciaReal": 17, "dataAlta": "2025-02-01"})
+    dados.atualizar_registro(e["Questionários"], {"numeroAtendimento": chaves[3],
+                                                  "observacaoQuestionarioPaciente30": "retorno ok"},
+                             esperar=False)
+    dados.descarregar()
+    dados.atualizar_registro(e["Pós-Alta"], {"numeroAtendimento": chaves[4],
+                                             "observacao": "reinternou por febre"})
+    dados.atualizar_registro(e["Pronto Atendimento"], {"numeroAtendimento": chaves[5],
+                                                       "hospital": ""})
+    assert dados.descarregar(30)
+    return chaves + ["99990001"]
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import agenda
+import dados
+from conftest import gravacoes_variadas
+from dados import ETAPAS
+
+CONSULTAS = [
+    {},
+    {"filtros": {"hospital": "HUC"}},
+    {"filtros": {"hospital": "PUCC", "linhaCuidado": "ICC"}},
+    {"inicio": "2025-02-01", "fim": "2025-04-30"},
+    {"inicio": "2025-03-01", "filtros": {"hospital": "HUC"}, "limite": 20},
+]
+
+
+@pytest.fixture
+def vazio(etapas, monkeypatch):
+    monkeypatch.setattr(agenda, "_estado", {"assinaturas": None, "base": None,
+                                            "vencimentos": None, "trechos": {},
+                                            "novos": [], "velhos": set()})
+
+
+def _consultas():
+    return [agenda.vencimentos(**c) for c in CONSULTAS]
+
+
+def _iguais_a_reconstrucao(incrementais):
+    agenda.reconstruir()
+    for consulta, a, b in zip(CONSULTAS, incrementais, _consultas()):
+        pd.testing.assert_frame_equal(a, b, check_dtype=False, obj=str(consulta))
+
+
+def test_incremental_igual_a_reconstrucao(vazio):
+    agenda.vencimentos()
+    gravacoes_variadas()
+
+    assert agenda._estado["assinaturas"] == agenda._assinaturas()
+    assert agenda._estado["novos"] and agenda._estado["velhos"]
+    _iguais_a_reconstrucao(_consultas())
+
+
+def test_questionario_respondido_sai_da_agenda(vazio):
+    chave = agenda.vencimentos(filtros={"hospital": "HUC"})["numeroAtendimento"].iloc[0]
+    dias = set(agenda.vencimentos()
+               .query("numeroAtendimento == @chave")["dia"])
+    dia = min(dias)
+    dados.atualizar_registro(ETAPAS["Questionários"],
+                             {"numeroAtendimento": chave,
+                              f"observacaoQuestionarioPaciente{dia}": "respondido"})
+
+    depois = agenda.vencimentos()
+    assert set(depois.query("numeroAtendimento == @chave")["dia"]) == dias - {dia}
+    _iguais_a_reconstrucao(_consultas())
@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import dados
+from conftest import mesma_tabela
+from dados import ETAPAS
+
+PA = ETAPAS["Pronto Atendimento"]
+PE = ETAPAS["Permanência"]
+BACKENDS = ["sqlite", "parquet"]
+
+
+def _zerar(backend):
+    if backend == "sqlite":
+        import dados_sqlite
+        while True:
+            try:
+                dados_sqlite._pool.get_nowait().close()
+            except queue.Empty:
+                break
+        dados_sqlite._colunas.clear()
+    elif backend == "parquet":
+        import dados_parquet
+        with dados_parquet._schemas_lock:
+            dados_parquet._schemas.clear()
+    dados.invalidar()
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, etapas, monkeypatch):
+    """As etapas convertidas para o backend e ele ativo; devolve o nome."""
+    nome = request.param
+    if nome == "sqlite":
+        import dados_sqlite
+        _zerar(nome)
+        monkeypatch.setattr(dados_sqlite, "DB_PATH", str(etapas / "linhas.db"))
+        dados_sqlite.migrar_csvs()
+    elif nome == "parquet":
+        import dados_parquet
+        _zerar(nome)
+        dados_parquet.converter_csvs()
+    monkeypatch.setattr(dados, "BACKEND", nome)
+    yield nome
+    dados.descarregar()
+    _zerar(nome)
+
+
+def _do_csv(path, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(dados, "BACKEND", "csv")
+        dados.invalidar(path)
+        return dados.carregar_csv(path)
+
+
+@pytest.mark.parametrize("etapa", ["Pronto Atendimento", "Internação", "Questionários"])
+def test_carregar_igual_ao_csv(backend, monkeypatch, etapa):
+    path = ETAPAS[etapa]
+    mesma_tabela(_do_csv(path, monkeypatch), dados.carregar_csv(path))
+
+
+def test_filtros_e_colunas(backend, monkeypatch):
+    filtros = {"hospital": "HUC", "linhaCuidado": "AVC"}
+    colunas = ["numeroAtendimento", "nomePaciente", "idade"]
+    csv = _do_csv(PA, monkeypatch)
+    csv = csv[(csv["hospital"] == "HUC") & (csv["linhaCuidado"] == "AVC")][colunas]
+    lido = dados.carregar_csv(PA, colunas=colunas, filtros=filtros)
+    assert list(lido.columns) == colunas
+    mesma_tabela(csv, lido)
+
+
+def test_fetch_row_com_os_tipos_do_csv(backend, monkeypatch):
+    chave = _do_csv(PA, monkeypatch)["numeroAtendimento"].iloc[7]
+    with monkeypatch.context() as m:
+        m.setattr(dados, "BACKEND", "csv")
+        esperado = dados.fetch_row(PA, chave)
+    linha = dados.fetch_row(PA, chave).reindex(esperado.index)
+    for coluna, valor in esperado.items():
+        if pd.isna(valor):
+            assert pd.isna(linha[coluna]), coluna
+        else:
+            assert type(linha[coluna]) is type(valor) and linha[coluna] == valor, coluna
+
+
+def test_save_e_edicao_ida_e_volta(backend):
+    registro = {**dados.fetch_row(PE, dados.carregar_csv(PE)["numeroAtendimento"].iloc[0]),
+                "numeroAtendimento": "99999001", "permanenciaReal": 4}
+    dados.save_csv(PE, {c: (None if pd.isna(v) else v) for c, v in registro.items()})
+    assert dados.fetch_row(PE, "99999001")["permanenciaReal"] == 4
+
+    dados.atualizar_registro(PE, {"numeroAtendimento": "99999001", "permanenciaReal": 9},
+                             esperar=False)
+    assert dados.fetch_row(PE, "99999001")["permanenciaReal"] == 9
+    df = dados.carregar_csv(PE)
+    assert (df["numeroAtendimento"] == "99999001").sum() == 1
+    assert dados.existentes(PE, ["99999001", "00000000"]).tolist() == [True, False]
+
+
+def test_chave_inexistente(backend):
+    linha = dados.fetch_row(PA, "00000000")
+    assert set(linha) == {""} and "numeroAtendimento" in linha.index
+
+
+@pytest.mark.parametrize("backend", ["sqlite"], indirect=True)
+def test_sqlite_uma_linha_por_atendimento(backend):
+    import dados_sqlite
+    dados_sqlite.save(PE, [{"numeroAtendimento": "1", "hospital": "HUC", "permanenciaReal": 1}])
+    dados_sqlite.save(PE, [{"numeroAtendimento": "1", "hospital": "PUCC", "permanenciaReal": 2}])
+    dados_sqlite.upsert(PE, [{"numeroAtendimento": "1", "hospital": "Galileo"}])
+    dados_sqlite.upsert(PE, [{"numeroAtendimento": "1", "permanenciaReal": 3}])
+
+    linhas = dados_sqlite.carregar(PE, filtros={"numeroAtendimento": "1"})
+    assert linhas[["hospital", "permanenciaReal"]].values.tolist() == [["Galileo", 3]]
+
+
+@pytest.mark.parametrize("backend", ["parquet"], indirect=True)
+def test_parquet_edicoes_somem_na_compactacao(backend):
+    import dados_parquet
+    chaves = list(dados.carregar_csv(PE)["numeroAtendimento"].iloc[:5])
+    for valor in (1, 2):
+        dados.atualizar_lote(PE, [{"numeroAtendimento": c, "permanenciaReal": valor}
+                                  for c in chaves])
+    antes = dados.carregar_csv(PE)
+
+    dados_parquet.compactar(PE)
+
+    mesma_tabela(antes, dados.carregar_csv(PE))
+    assert (dados.carregar_csv(PE)["numeroAtendimento"].isin(chaves)).sum() == len(chaves)
+
+
+@pytest.mark.parametrize("backend", ["parquet"], indirect=True)
+def test_parquet_leitores_durante_a_compactacao(backend):
+    import dados_parquet
+    n = len(dados_parquet.carregar(PA))
+    chave = dados_parquet.carregar(PA)["numeroAtendimento"].iloc[0]
+    erros, fim = [], threading.Event()
+
+    def ler():
+        while not fim.is_set():
+            try:
+                tamanhos = (len(dados_parquet.carregar(PA)),
+                            sum(len(x) for x in dados_parquet.lotes(PA, tamanho=100)))
+                dados_parquet.fetch_row(PA, chave)
+                if tamanhos != (n, n):
+                    erros.append(tamanhos)
+            except Exception as e:
+                erros.append(e)
+            time.sleep(0.05)        # um rerun não lê em laço fechado
+
+    leitores = [threading.Thread(target=ler) for _ in range(2)]
+    for t in leitores:
+        t.start()
+    try:
+        for i in range(4):
+            dados.atualizar_registro(PA, {"numeroAtendimento": chave, "tempoExame": i})
+            dados_parquet.compactar(PA)
+    finally:
+        fim.set()
+        for t in leitores:
+            t.join()
+    assert erros == []
+    assert dados.fetch_row(PA, chave)["tempoExame"] == 3
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import cubo
+import dados
+from conftest import gravacoes_variadas
+from dados import ETAPAS
+
+
+@pytest.fixture
+def vazio(etapas, monkeypatch):
+    """Cubo do zero, gravação no parquet só quando o teste pedir."""
+    monkeypatch.setattr(cubo, "_estado", {"assinaturas": None, "celulas": None,
+                                          "df": None, "timer": None})
+    monkeypatch.setattr(cubo, "ATRASO_GRAVACAO", 60.0)
+    yield
+    cubo.gravar_pendente()
+
+
+def _iguais(a: dict, b: dict):
+    assert set(a) == set(b)
+    for cel in a:
+        assert np.allclose(a[cel], b[cel]), cel
+
+
+def test_incremental_igual_a_reconstrucao(vazio):
+    cubo.cubo()
+    gravacoes_variadas()
+
+    # o gancho acompanhou as gravações: nada a refazer na leitura
+    assert cubo._estado["assinaturas"] == cubo._assinaturas()
+    _iguais(cubo._estado["celulas"], cubo._calcular_celulas())
+
+
+def test_atendimento_que_muda_de_celula(vazio):
+    cubo.cubo()
+    chave = dados.carregar_csv(ETAPAS["Pronto Atendimento"])["numeroAtendimento"].iloc[0]
+    for hospital in ("Galileo", "Maternidade", "Galileo"):
+        dados.atualizar_registro(ETAPAS["Pronto Atendimento"],
+                                 {"numeroAtendimento": chave, "hospital": hospital})
+    assert cubo._estado["assinaturas"] == cubo._assinaturas()
+    _iguais(cubo._estado["celulas"], cubo._calcular_celulas())
+
+
+def test_parquet_gravado_uma_vez_por_rajada(vazio, monkeypatch):
+    cubo.cubo()
+    gravacoes = []
+    real = cubo._gravar
+    monkeypatch.setattr(cubo, "_gravar", lambda: (gravacoes.append(1), real()))
+    gravacoes_variadas()
+    assert gravacoes == []
+
+    cubo.gravar_pendente()
+    assert gravacoes == [1]
+    _iguais(cubo._ler_gravado(cubo._assinaturas()), cubo._estado["celulas"])
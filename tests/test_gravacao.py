@@ -0,0 +1,142 @@
+import threading
+
+import dados
+from conftest import mesma_tabela, recarregado
+from dados import ETAPAS
+
+PA = ETAPAS["Pronto Atendimento"]
+
+
+def _contar_fsync(monkeypatch):
+    real, conta = dados._fsync, []
+
+    def contado(f):
+        conta.append(1)
+        real(f)
+    monkeypatch.setattr(dados, "_fsync", contado)
+    return conta
+
+
+def test_gravacoes_simultaneas_saem_juntas(etapas, monkeypatch):
+    monkeypatch.setattr(dados, "JANELA_GRUPO", 0.05)
+    n, antes = 16, len(dados.carregar_csv(PA))
+    fsyncs = _contar_fsync(monkeypatch)
+    largada = threading.Barrier(n)
+
+    def gravar(i):
+        largada.wait()
+        dados.save_csv(PA, {"numeroAtendimento": f"9900{i:04d}", "hospital": "HUC"})
+
+    threads = [threading.Thread(target=gravar, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(fsyncs) < n
+    df = recarregado(PA)
+    assert len(df) == antes + n
+    novos = df["numeroAtendimento"][df["numeroAtendimento"].str.startswith("9900")]
+    assert sorted(novos) == [f"9900{i:04d}" for i in range(n)]
+
+
+def test_cache_igual_ao_disco_depois_de_gravacoes_simultaneas(etapas):
+    chaves = list(dados.carregar_csv(PA)["numeroAtendimento"].iloc[:8])
+
+    def editar(i, chave):
+        dados.save_csv(PA, {"numeroAtendimento": f"9800{i:04d}", "hospital": "PUCC"})
+        dados.atualizar_registro(PA, {"numeroAtendimento": chave, "tempoExame": i})
+
+    threads = [threading.Thread(target=editar, args=(i, c)) for i, c in enumerate(chaves)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    mesma_tabela(dados.carregar_csv(PA), recarregado(PA))
+
+
+def test_segundo_plano_na_ordem_e_leitura_espera(etapas):
+    chave = dados.carregar_csv(PA)["numeroAtendimento"].iloc[0]
+    dados.save_csv(PA, {"numeroAtendimento": "99990001", "hospital": "HUC"}, esperar=False)
+    for i in range(20):
+        dados.atualizar_registro(PA, {"numeroAtendimento": chave, "tempoExame": i},
+                                 esperar=False)
+
+    # sem descarregar: a leitura da etapa espera as gravações pendentes
+    assert dados.fetch_row(PA, chave)["tempoExame"] == 19
+    assert dados.existentes(PA, ["99990001"]).tolist() == [True]
+    assert dados.pendentes(PA) == 0
+    mesma_tabela(dados.carregar_csv(PA), recarregado(PA))
+
+
+def test_gancho_lendo_outra_etapa_nao_trava_a_gravadora(etapas, monkeypatch):
+    import cubo
+    monkeypatch.setattr(cubo, "_estado", {"assinaturas": None, "celulas": None,
+                                          "df": None, "timer": None})
+    monkeypatch.setattr(cubo, "ATRASO_GRAVACAO", 0.01)
+    # caminhos absolutos: se travar, a thread presa não grava no cwd seguinte
+    for etapa, path in list(ETAPAS.items()):
+        monkeypatch.setitem(ETAPAS, etapa, str(etapas / path))
+    pa, internacao = ETAPAS["Pronto Atendimento"], ETAPAS["Internação"]
+    chave = dados.carregar_csv(pa)["numeroAtendimento"].iloc[0]
+    cubo.cubo()
+    fim = threading.Event()
+
+    def fundo():
+        i = 0
+        while not fim.is_set():
+            dados.atualizar_registro(internacao, {"numeroAtendimento": chave,
+                                                  "tempoUTI": i % 7}, esperar=False)
+            i += 1
+
+    def sincrono():
+        for i in range(30):
+            dados.atualizar_registro(pa, {"numeroAtendimento": chave, "tempoExame": i})
+
+    threading.Thread(target=fundo, daemon=True).start()
+    t = threading.Thread(target=sincrono, daemon=True)
+    t.start()
+    t.join(30)
+    fim.set()
+    assert not t.is_alive(), "gravação síncrona travou esperando a gravadora"
+    assert dados.descarregar(30)
+    cubo.gravar_pendente()
+    assert dados.falhas() == []
+
+
+def test_fsync_que_falha_repete_sem_duplicar(etapas, monkeypatch):
+    monkeypatch.setattr(dados, "_falhas", [])
+    antes = len(dados.carregar_csv(PA))
+    real, conta = dados._fsync, []
+
+    def falha_uma_vez(f):
+        conta.append(1)
+        if len(conta) == 1:
+            raise OSError("fsync")
+        real(f)
+    monkeypatch.setattr(dados, "_fsync", falha_uma_vez)
+
+    dados.save_csv(PA, {"numeroAtendimento": "99990002", "hospital": "HUC"}, esperar=False)
+    assert dados.descarregar(30)
+
+    df = recarregado(PA)
+    assert len(df) == antes + 1
+    assert (df["numeroAtendimento"] == "99990002").sum() == 1
+    assert dados.falhas() == []
+
+
+def test_erro_de_gancho_nao_repete_a_gravacao(etapas, monkeypatch):
+    monkeypatch.setattr(dados, "_falhas", [])
+    monkeypatch.setattr(dados, "_ganchos", [])
+
+    def quebrado(path, lote):
+        def depois():
+            raise RuntimeError("gancho")
+        return depois
+    dados.registrar_gancho(quebrado)
+
+    dados.save_csv(PA, {"numeroAtendimento": "99990003", "hospital": "HUC"}, esperar=False)
+    assert dados.descarregar(30)
+    assert (recarregado(PA)["numeroAtendimento"] == "99990003").sum() == 1
+    assert dados.falhas() == []
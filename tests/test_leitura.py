@@ -0,0 +1,86 @@
+import os
+
+import dados
+from conftest import mesma_tabela, recarregado
+from dados import ETAPAS
+
+PA = ETAPAS["Pronto Atendimento"]
+PE = ETAPAS["Permanência"]
+
+
+def _leituras_do_csv(monkeypatch):
+    """Registra o offset de cada leitura do CSV base (0 = do começo)."""
+    real, inicios = dados._ler_csv, []
+
+    def registrado(path, inicio=0, cabecalho=()):
+        inicios.append(inicio)
+        return real(path, inicio, cabecalho)
+    monkeypatch.setattr(dados, "_ler_csv", registrado)
+    return inicios
+
+
+def _gravado_por_outro_processo(path, gravar):
+    """Grava pelo caminho normal e devolve o cache ao estado de antes:
+    é o que um processo vê quando outro acrescenta ao arquivo."""
+    dados.carregar_csv(path)
+    antigo = dados._cache[path]
+    gravar()
+    dados._cache[path] = antigo
+
+
+def test_final_acrescentado_ao_csv_e_lido_sozinho(etapas, monkeypatch):
+    _gravado_por_outro_processo(PA, lambda: dados.salvar_lote(PA, [
+        {"numeroAtendimento": f"9900{i:04d}", "hospital": "HUC", "nomePaciente": 'Ana "A"\nB'}
+        for i in range(5)]))
+    inicios = _leituras_do_csv(monkeypatch)
+
+    em_cache = dados.carregar_csv(PA)
+
+    assert inicios and all(i > 0 for i in inicios)
+    mesma_tabela(em_cache, recarregado(PA))
+    assert em_cache["numeroAtendimento"].str.startswith("9900").sum() == 5
+
+
+def test_edicoes_acrescentadas_ao_log_sao_aplicadas(etapas, monkeypatch):
+    chaves = list(dados.carregar_csv(PE)["numeroAtendimento"].iloc[:3])
+    dados.atualizar_registro(PE, {"numeroAtendimento": chaves[0], "permanenciaReal": 1})
+    _gravado_por_outro_processo(PE, lambda: dados.atualizar_lote(PE, [
+        {"numeroAtendimento": c, "permanenciaReal": 30 + i} for i, c in enumerate(chaves)]))
+    inicios = _leituras_do_csv(monkeypatch)
+
+    em_cache = dados.carregar_csv(PE)
+
+    assert inicios == []
+    mesma_tabela(em_cache, recarregado(PE))
+    valores = em_cache.set_index("numeroAtendimento")["permanenciaReal"]
+    assert [valores[c] for c in chaves] == [30, 31, 32]
+
+
+def test_reescrita_no_lugar_do_mesmo_tamanho_recarrega(etapas, monkeypatch):
+    df = dados.carregar_csv(PA)
+    antiga = df["numeroAtendimento"].iloc[len(df) // 2]
+    with open(PA, "rb") as f:
+        conteudo = f.read()
+    novo = conteudo.replace(f",{antiga},".encode(), b",99999999,", 1)
+    assert len(novo) == len(conteudo) and novo != conteudo
+    info = os.stat(PA)
+    with open(PA, "r+b") as f:
+        f.write(novo)
+    os.utime(PA, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+    inicios = _leituras_do_csv(monkeypatch)
+
+    lido = dados.carregar_csv(PA)
+
+    assert inicios == [0]
+    assert "99999999" in set(lido["numeroAtendimento"]) and antiga not in set(lido["numeroAtendimento"])
+    mesma_tabela(lido, recarregado(PA))
+
+
+def test_csv_trocado_por_outro_recarrega(etapas):
+    dados.carregar_csv(PA)
+    df = recarregado(PA).iloc[:10]
+    temporario = PA + ".novo"
+    dados.para_texto(df).to_csv(temporario, index=False)
+    os.replace(temporario, PA)
+
+    mesma_tabela(df, dados.carregar_csv(PA))
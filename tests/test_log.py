@@ -0,0 +1,77 @@
+import os
+
+import dados
+from conftest import mesma_tabela, recarregado
+from dados import ETAPAS
+
+PE = ETAPAS["Permanência"]
+
+
+def _chaves(path, n):
+    return list(dados.carregar_csv(path)["numeroAtendimento"].iloc[:n])
+
+
+def test_edicao_vai_para_o_log_e_nao_reescreve_o_csv(etapas):
+    chave = _chaves(PE, 1)[0]
+    tamanho = os.path.getsize(PE)
+    dados.atualizar_registro(PE, {"numeroAtendimento": chave, "permanenciaReal": 41})
+
+    assert os.path.getsize(PE) == tamanho
+    with open(dados._arquivo_log(PE), encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert dados.fetch_row(PE, chave)["permanenciaReal"] == 41
+
+
+def test_ultima_edicao_vence_e_cache_igual_a_recarga(etapas):
+    chaves = _chaves(PE, 3)
+    for valor in (5, 6, 7):
+        dados.atualizar_lote(PE, [{"numeroAtendimento": c, "permanenciaReal": valor}
+                                  for c in chaves])
+    dados.atualizar_registro(PE, {"numeroAtendimento": chaves[0], "permanenciaReal": 1})
+
+    em_cache = dados.carregar_csv(PE)
+    do_zero = recarregado(PE)
+    mesma_tabela(em_cache, do_zero)
+    valores = do_zero.set_index("numeroAtendimento")["permanenciaReal"]
+    assert [valores[c] for c in chaves] == [1, 7, 7]
+    assert len(do_zero) == len(em_cache)
+
+
+def test_edicao_de_atendimento_novo_acrescenta_linha(etapas):
+    n = len(dados.carregar_csv(PE))
+    dados.atualizar_registro(PE, {"numeroAtendimento": "99999001", "permanenciaReal": 3})
+    assert len(dados.carregar_csv(PE)) == n + 1
+    assert len(recarregado(PE)) == n + 1
+    assert dados.fetch_row(PE, "99999001")["permanenciaReal"] == 3
+
+
+def test_compactacao_incorpora_o_log(etapas):
+    chaves = _chaves(PE, 10)
+    dados.atualizar_lote(PE, [{"numeroAtendimento": c, "permanenciaReal": i}
+                              for i, c in enumerate(chaves)])
+    antes = dados.carregar_csv(PE)
+
+    dados.compactar(PE)
+
+    assert not os.path.exists(dados._arquivo_log(PE))
+    mesma_tabela(antes, dados.carregar_csv(PE))
+    mesma_tabela(antes, recarregado(PE))
+    # e as edições seguintes continuam numerando do zero
+    dados.atualizar_registro(PE, {"numeroAtendimento": chaves[0], "permanenciaReal": 99})
+    assert recarregado(PE).set_index("numeroAtendimento").loc[chaves[0], "permanenciaReal"] == 99
+
+
+def test_log_reaplicado_sobre_base_compactada_da_o_mesmo(etapas):
+    # compactação que caiu entre o rename e a remoção do log
+    chave = _chaves(PE, 1)[0]
+    dados.atualizar_registro(PE, {"numeroAtendimento": chave, "permanenciaReal": 12})
+    log = dados._arquivo_log(PE)
+    with open(log, encoding="utf-8") as f:
+        conteudo = f.read()
+    dados.compactar(PE)
+    with open(log, "w", encoding="utf-8") as f:
+        f.write(conteudo)
+
+    df = recarregado(PE)
+    assert (df["numeroAtendimento"] == chave).sum() == 1
+    assert df.set_index("numeroAtendimento").loc[chave, "permanenciaReal"] == 12
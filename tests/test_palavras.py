@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import dados
+import palavras
+from conftest import gravacoes_variadas
+from dados import ETAPAS
+
+CONSULTAS = ["femur", "fratura fem", "ana", "febre", "quadril", "sem dor", "retorno"]
+
+
+@pytest.fixture
+def vazio(etapas, monkeypatch):
+    monkeypatch.setattr(palavras, "_estado", {"assinaturas": None, "postagens": None,
+                                              "vocabulario": [], "n": 0})
+
+
+def _foto():
+    return ({p: dict(lista) for p, lista in palavras._estado["postagens"].items()},
+            list(palavras._estado["vocabulario"]), palavras._estado["n"])
+
+
+def test_incremental_igual_a_reconstrucao(vazio):
+    palavras.reconstruir()
+    chaves = gravacoes_variadas()
+
+    assert palavras._estado["assinaturas"] == palavras._assinaturas()
+    postagens, vocabulario, n = _foto()
+    buscas = [palavras.procurar(c) for c in CONSULTAS]
+    palavras.reconstruir()
+
+    refeito = _foto()
+    assert vocabulario == refeito[1] and n == refeito[2]
+    assert postagens.keys() == refeito[0].keys()
+    for p, lista in refeito[0].items():
+        assert postagens[p] == pytest.approx(lista), p
+    for c, busca in zip(CONSULTAS, buscas):
+        pd.testing.assert_frame_equal(busca, palavras.procurar(c), obj=c)
+    achados = set(palavras.procurar("femur")["numeroAtendimento"])
+    assert {chaves[1], "99990001"} <= achados
+
+
+def test_nome_trocado_sai_do_indice(vazio):
+    pa = ETAPAS["Pronto Atendimento"]
+    chave = dados.carregar_csv(pa)["numeroAtendimento"].iloc[0]
+    dados.atualizar_registro(pa, {"numeroAtendimento": chave, "nomePaciente": "Zacarias Quixaba"})
+    assert chave in set(palavras.procurar("quixa")["numeroAtendimento"])
+
+    dados.atualizar_registro(pa, {"numeroAtendimento": chave, "nomePaciente": "Maria Silva"})
+    assert palavras.procurar("quixaba").empty
+    assert "quixaba" not in palavras._estado["vocabulario"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+import quantis
+from conftest import gravacoes_variadas
+from dados import ETAPAS
+
+
+@pytest.fixture
+def vazio(etapas, monkeypatch):
+    """Esboços do zero, gravação no parquet só quando o teste pedir."""
+    monkeypatch.setattr(quantis, "_estado", {"assinaturas": None, "celulas": None,
+                                             "df": None, "timer": None})
+    monkeypatch.setattr(quantis, "ATRASO_GRAVACAO", 60.0)
+    yield
+    quantis.gravar_pendente()
+
+
+def _iguais(a: dict, b: dict):
+    pd.testing.assert_frame_equal(quantis._tabela(a), quantis._tabela(b))
+
+
+def test_incremental_igual_a_reconstrucao(vazio):
+    quantis.esbocos()
+    gravacoes_variadas()
+
+    assert quantis._estado["assinaturas"] == quantis._assinaturas()
+    _iguais(quantis._estado["celulas"], quantis._calcular_celulas())
+    incremental = quantis.percentis()
+    quantis.reconstruir()
+    pd.testing.assert_frame_equal(incremental, quantis.percentis())
+
+
+def test_edicao_repetida_nao_acumula(vazio):
+    quantis.esbocos()
+    chave = dados.carregar_csv(ETAPAS["Permanência"])["numeroAtendimento"].iloc[0]
+    for valor in (3, 300, 3):
+        dados.atualizar_registro(ETAPAS["Permanência"],
+                                 {"numeroAtendimento": chave, "permanenciaReal": valor})
+    assert quantis._estado["assinaturas"] == quantis._assinaturas()
+    _iguais(quantis._estado["celulas"], quantis._calcular_celulas())
+
+
+def test_erro_relativo_do_esboco():
+    valores = np.random.default_rng(0).lognormal(3, 1, 5000)
+    faixas, contagens = np.unique(quantis.faixa(valores), return_counts=True)
+    for q, aproximado in zip(quantis.QUANTIS, quantis.quantis_do_esboco(faixas, contagens)):
+        exato = np.sort(valores)[int(np.floor(q * (len(valores) - 1)))]
+        assert abs(aproximado - exato) <= quantis.ERRO_RELATIVO * exato * 1.0001
+
+
+def test_parquet_gravado_uma_vez_por_rajada(vazio):
+    quantis.esbocos()
+    gravacoes_variadas()
+    assert quantis._ler_gravado(quantis._assinaturas()) is None
+
+    quantis.gravar_pendente()
+    _iguais(quantis._ler_gravado(quantis._assinaturas()), quantis._estado["celulas"])